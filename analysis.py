@@ -3,7 +3,7 @@ import pandas as pd
 from datetime import datetime, timedelta
 import json
 import logging
-from sqlalchemy import func, and_, or_, desc, asc
+from sqlalchemy import func, and_, or_, desc, asc, case, exists
 import matplotlib.pyplot as plt
 import seaborn as sns
 from io import BytesIO
@@ -21,43 +21,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger('car_analysis')
 
+# Engine type keys (normalize_key of what the parsers write) for each fuel
+# the frontend can ask for, in Latvian or English
+FUEL_TYPE_KEYS = [
+    ['benzins', 'petrol'],
+    ['dizelis', 'diesel'],
+    ['hibrids', 'hybrid'],
+    ['elektriskais', 'elektrisks', 'electric'],
+    ['gaze', 'gas'],
+]
+
+
+def fuel_type_keys(fuel_type):
+    """Engine type keys a fuel filter should match"""
+    from models import normalize_key
+    
+    key = normalize_key(fuel_type)
+    for keys in FUEL_TYPE_KEYS:
+        if key in keys:
+            return keys
+    # Just try to match whatever they typed
+    return [key]
+
+
+def newest_of_reposts():
+    """Filter that keeps one listing per reposted car - the newest one.
+
+    Reposts all point at the first listing, so a listing is left out if a
+    repost of it exists, or if it is a repost and a newer one of the same
+    car exists. The newest is the one that can still be live.
+    """
+    from sqlalchemy.orm import aliased
+    from models import Listing, ListingRepost
+    
+    newer = aliased(ListingRepost)
+    return and_(
+        ~exists().where(ListingRepost.original_listing_id == Listing.listing_id),
+        ~exists().where(
+            ListingRepost.listing_id == Listing.listing_id,
+            newer.original_listing_id == ListingRepost.original_listing_id,
+            newer.listing_id > ListingRepost.listing_id
+        )
+    )
+
 
 class CarDataAnalyzer:
     """Main class for car price analysis stuff"""
 
     def __init__(self, session):
         self.session = session
-        self._setup_sqlite_functions()  # Setup custom SQL functions if needed
-    
-    def _setup_sqlite_functions(self):
-        """Register some custom functions for SQLite since it's missing some features"""
-        if 'sqlite' in self.session.bind.dialect.name:
-            conn = self.session.bind.raw_connection()
-            
-            # Custom date truncation function - SQLite doesn't have this built-in
-            def date_trunc(interval, date_str):
-                if date_str is None:
-                    return None
-                
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                
-                if interval.lower() == 'month':
-                    return date_obj.replace(day=1).strftime('%Y-%m-%d')
-                elif interval.lower() == 'year':
-                    return date_obj.replace(month=1, day=1).strftime('%Y-%m-%d')
-                elif interval.lower() == 'week':
-                    # Get Monday of that week
-                    days_to_subtract = date_obj.weekday()
-                    return (date_obj - timedelta(days=days_to_subtract)).strftime('%Y-%m-%d')
-                else:
-                    return date_str
-            
-            conn.create_function("date_trunc", 2, date_trunc)
+        # date_trunc() for SQLite gets registered on every connection by models.make_engine
     
     def get_price_statistics(self, brand=None, model=None, year_from=None, 
                              year_to=None, region=None, fuel_type=None):
         """Calculate basic price stats - average, min, max, etc."""
-        from models import Brand, Model, Car, Listing, Region
+        from models import normalize_key, Brand, Model, Car, Listing, Region
         
         try:
             # Build the query step by step
@@ -71,14 +89,17 @@ class CarDataAnalyzer:
                 Brand, Model.brand_id == Brand.brand_id
             ).join(
                 Region, Car.region_id == Region.region_id
+            ).filter(
+                # A reposted car only counts once
+                newest_of_reposts()
             )
             
             # Add filters one by one
             if brand:
-                query = query.filter(func.lower(Brand.name) == func.lower(brand))
+                query = query.filter(Brand.name_key == normalize_key(brand))
             
             if model:
-                query = query.filter(func.lower(Model.name) == func.lower(model))
+                query = query.filter(Model.name_key == normalize_key(model))
             
             if year_from:
                 query = query.filter(Car.year >= year_from)
@@ -87,10 +108,10 @@ class CarDataAnalyzer:
                 query = query.filter(Car.year <= year_to)
             
             if region:
-                query = query.filter(func.lower(Region.name) == func.lower(region))
+                query = query.filter(Region.name_key == normalize_key(region))
             
             if fuel_type:
-                query = query.filter(func.lower(Car.engine_type) == func.lower(fuel_type))
+                query = query.filter(Car.engine_type_key.in_(fuel_type_keys(fuel_type)))
             
             # Get all the prices
             prices = [item[0] for item in query.all()]
@@ -122,7 +143,7 @@ class CarDataAnalyzer:
     def get_similar_listings(self, brand, model, year, mileage=None, 
                               engine_type=None, limit=10):
         """Find cars similar to what user is looking for"""
-        from models import Brand, Model, Car, Listing
+        from models import normalize_key, Brand, Model, Car, Listing
         
         try:
             query = self.session.query(
@@ -142,11 +163,15 @@ class CarDataAnalyzer:
                 Model, Car.model_id == Model.model_id
             ).join(
                 Brand, Model.brand_id == Brand.brand_id
+            ).filter(
+                # Only ads people can still answer, and a reposted car once
+                Listing.is_active == True,
+                newest_of_reposts()
             )
             
             # Filter by brand and model
-            query = query.filter(func.lower(Brand.name) == func.lower(brand))
-            query = query.filter(func.lower(Model.name) == func.lower(model))
+            query = query.filter(Brand.name_key == normalize_key(brand))
+            query = query.filter(Model.name_key == normalize_key(model))
             
             # Year range - give or take 2 years
             query = query.filter(Car.year.between(year - 2, year + 2))
@@ -159,7 +184,7 @@ class CarDataAnalyzer:
             
             # Engine type if specified
             if engine_type:
-                query = query.filter(func.lower(Car.engine_type) == func.lower(engine_type))
+                query = query.filter(Car.engine_type_key.in_(fuel_type_keys(engine_type)))
             
             # Sort by how close the year is
             query = query.order_by(func.abs(Car.year - year))
@@ -189,35 +214,46 @@ class CarDataAnalyzer:
             logger.error(f"Error finding similar cars: {str(e)}")
             return []
     
+    def _model_ids(self, brand, model=None):
+        """Ids of the models matching a brand (and model) name"""
+        from models import normalize_key, Brand, Model
+        
+        query = self.session.query(Model.model_id).join(
+            Brand, Model.brand_id == Brand.brand_id
+        ).filter(Brand.name_key == normalize_key(brand))
+        if model:
+            query = query.filter(Model.name_key == normalize_key(model))
+        return [model_id for model_id, in query.all()]
+    
     def get_price_history(self, brand, model, months=6):
-        """Get price trends over time for a car model"""
-        from models import Brand, Model, Car, Listing
+        """Get price trends over time for a car model.
+
+        Reads the price observation log, so each month is the average of the
+        prices listings were put up at or changed to that month.
+        """
+        from models import PriceObservation
         
         try:
             # Look back X months
-            end_date = datetime.now().date()
+            end_date = datetime.now()
             start_date = end_date - timedelta(days=30 * months)
             
-            # Query with monthly grouping
+            model_ids = self._model_ids(brand, model)
+            if not model_ids:
+                logger.info(f"No price history for {brand} {model}")
+                return None
+            
+            # Range scan on (model_id, observed_at), grouped by month
+            month = func.date_trunc('month', PriceObservation.observed_at)
             query = self.session.query(
-                func.date_trunc('month', Listing.listing_date).label('month'),
-                func.avg(Listing.price).label('avg_price'),
-                func.count(Listing.listing_id).label('count')
-            ).join(
-                Car, Listing.car_id == Car.car_id
-            ).join(
-                Model, Car.model_id == Model.model_id
-            ).join(
-                Brand, Model.brand_id == Brand.brand_id
+                month.label('month'),
+                func.avg(PriceObservation.price).label('avg_price'),
+                func.count(PriceObservation.observation_id).label('count'),
+                func.sum(case((PriceObservation.price < PriceObservation.previous_price, 1), else_=0)).label('drops')
             ).filter(
-                func.lower(Brand.name) == func.lower(brand),
-                func.lower(Model.name) == func.lower(model),
-                Listing.listing_date.between(start_date, end_date)
-            ).group_by(
-                func.date_trunc('month', Listing.listing_date)
-            ).order_by(
-                func.date_trunc('month', Listing.listing_date)
-            )
+                PriceObservation.model_id.in_(model_ids),
+                PriceObservation.observed_at.between(start_date, end_date)
+            ).group_by(month).order_by(month)
             
             results = query.all()
             
@@ -225,15 +261,17 @@ class CarDataAnalyzer:
                 logger.info(f"No price history for {brand} {model}")
                 return None
             
-            # Prepare chart data
-            dates = [row.month.strftime('%Y-%m') for row in results]
+            # Prepare chart data - SQLite gives the month back as a string
+            dates = [row.month[:7] if isinstance(row.month, str) else row.month.strftime('%Y-%m') for row in results]
             prices = [int(row.avg_price) for row in results]
             counts = [row.count for row in results]
+            drops = [int(row.drops or 0) for row in results]
             
             history_data = {
                 'dates': dates,
                 'prices': prices,
-                'counts': counts
+                'counts': counts,
+                'price_drops': drops
             }
             
             logger.info(f"Got price history for {brand} {model} - {len(dates)} months")
@@ -243,10 +281,81 @@ class CarDataAnalyzer:
             logger.error(f"Price history failed: {str(e)}")
             return None
     
+    def get_listing_price_history(self, listing_id):
+        """Every price a single listing has had, oldest first"""
+        from models import PriceObservation
+        
+        try:
+            rows = self.session.query(
+                PriceObservation.observed_at,
+                PriceObservation.price
+            ).filter(
+                PriceObservation.listing_id == listing_id
+            ).order_by(PriceObservation.observed_at).all()
+            
+            return [{'date': row.observed_at.isoformat(), 'price': row.price} for row in rows]
+            
+        except Exception as e:
+            logger.error(f"Listing price history failed: {str(e)}")
+            return []
+    
+    def get_price_drops(self, brand=None, model=None, days=30, limit=20):
+        """Biggest recent price cuts on listings that are still up"""
+        from models import Brand, Model, Car, Listing, PriceObservation
+        
+        try:
+            since = datetime.now() - timedelta(days=days)
+            drop_pct = (PriceObservation.previous_price - PriceObservation.price) * 100.0 / PriceObservation.previous_price
+            
+            query = self.session.query(
+                Listing.listing_id,
+                Listing.listing_url,
+                Brand.name.label('brand'),
+                Model.name.label('model'),
+                Car.year,
+                PriceObservation.observed_at,
+                PriceObservation.previous_price,
+                PriceObservation.price,
+                drop_pct.label('drop_pct')
+            ).join(
+                Listing, PriceObservation.listing_id == Listing.listing_id
+            ).join(
+                Car, Listing.car_id == Car.car_id
+            ).join(
+                Model, PriceObservation.model_id == Model.model_id
+            ).join(
+                Brand, Model.brand_id == Brand.brand_id
+            ).filter(
+                PriceObservation.observed_at >= since,
+                PriceObservation.previous_price > PriceObservation.price,
+                Listing.is_active == True
+            )
+            
+            if brand:
+                query = query.filter(PriceObservation.model_id.in_(self._model_ids(brand, model)))
+            
+            results = query.order_by(desc('drop_pct')).limit(limit).all()
+            
+            return [{
+                'listing_id': row.listing_id,
+                'url': row.listing_url,
+                'brand': row.brand,
+                'model': row.model,
+                'year': row.year,
+                'date': row.observed_at.isoformat(),
+                'old_price': row.previous_price,
+                'new_price': row.price,
+                'drop_percent': round(row.drop_pct, 1)
+            } for row in results]
+            
+        except Exception as e:
+            logger.error(f"Price drops failed: {str(e)}")
+            return []
+    
     
     def create_price_distribution_chart(self, brand=None, model=None, year_from=None, year_to=None):
         """Make a histogram showing price distribution"""
-        from models import Brand, Model, Car, Listing
+        from models import normalize_key, Brand, Model, Car, Listing
         
         try:
             query = self.session.query(
@@ -261,10 +370,10 @@ class CarDataAnalyzer:
             
             # Apply filters
             if brand:
-                query = query.filter(func.lower(Brand.name) == func.lower(brand))
+                query = query.filter(Brand.name_key == normalize_key(brand))
             
             if model:
-                query = query.filter(func.lower(Model.name) == func.lower(model))
+                query = query.filter(Model.name_key == normalize_key(model))
             
             if year_from:
                 query = query.filter(Car.year >= year_from)
@@ -408,7 +517,7 @@ class CarDataAnalyzer:
     
     def get_popular_models(self, brand=None, limit=10):
         """Get popular models, optionally filtered by brand"""
-        from models import Brand, Model, Car, Listing
+        from models import normalize_key, Brand, Model, Car, Listing
         
         try:
             query = self.session.query(
@@ -424,7 +533,7 @@ class CarDataAnalyzer:
             )
             
             if brand:
-                query = query.filter(func.lower(Brand.name) == func.lower(brand))
+                query = query.filter(Brand.name_key == normalize_key(brand))
             
             query = query.group_by(
                 Brand.name,
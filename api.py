@@ -4,14 +4,16 @@ import json
 import logging
 from datetime import datetime
 import requests
-from bs4 import BeautifulSoup
-from models import init_db, Brand, Model, Car, Listing, Region, Source
-from ss_scraper import run_ss_scraper
-from analysis import CarDataAnalyzer
+from models import init_db, init_read_db, normalize_key, Brand, Model, Car, Listing, Region, Source
+from scrape_jobs import ScrapeJobManager, JobConflictError
+from html_parsers import get_parser
+from details_cache import ListingDetailsCache
+from analysis import CarDataAnalyzer, fuel_type_keys
 from sqlalchemy import func, and_, or_, desc, asc, case, distinct
 import jwt
 from functools import wraps
 from auth_models import AuthDB
+from config import Config
 import re
 import os
 import sqlite3
@@ -32,10 +34,30 @@ logger_listing_details = logging.getLogger('car_api.listing_details')
 app = Flask(__name__, static_folder=None)
 CORS(app)
 
-# Database connection
-session, engine = init_db()
+# Database connection. init_db creates/upgrades the schema, after that the
+# endpoints only read, through a read-only engine with a session per request
+# thread - in WAL mode they never wait on a scrape's commits
+config = Config()
+setup_session, setup_engine = init_db(config['db_url'], **config.db_options())
+setup_session.close()
+setup_engine.dispose()
+session, engine = init_read_db(config['db_url'], **config.db_options())
 analyzer = CarDataAnalyzer(session)
 
+# HTML parser for the listing details popup, and a cache in front of it
+# so popular listings aren't fetched and parsed for every user
+listing_parser = get_parser()
+details_cache = ListingDetailsCache(listing_parser)
+
+# Scrapes run in the background, one at a time per source
+scrape_jobs = ScrapeJobManager(db_url=config['db_url'])
+
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    # Hand this thread's connection back to the pool
+    session.remove()
+
 
 @app.route('/api/search', methods=['POST'])
 def search_cars():
@@ -90,12 +112,12 @@ def search_cars():
                 .join(Car, Model.model_id == Car.model_id)
                 .join(Listing, Car.car_id == Listing.car_id)
                 .join(Region, Car.region_id == Region.region_id)
-                .filter(func.lower(Brand.name) == func.lower(brand))
+                .filter(Brand.name_key == normalize_key(brand))
             )
             
             # Apply filters one by one
             if model:
-                query = query.filter(func.lower(Model.name) == func.lower(model))
+                query = query.filter(Model.name_key == normalize_key(model))
             if year_from:
                 query = query.filter(Car.year >= year_from)
             if year_to:
@@ -103,33 +125,16 @@ def search_cars():
             if fuel_type:
                 logger.info(f"Filtering by fuel: {fuel_type}")
                 
-                # Handle different fuel type variations
-                if fuel_type.lower() in ['petrol', 'benzīns', 'benzins']:
-                    query = query.filter(func.lower(Car.engine_type).like('%benzīn%') | 
-                                        func.lower(Car.engine_type).like('%petrol%'))
-                elif fuel_type.lower() in ['diesel', 'dīzelis', 'dizelis']:
-                    query = query.filter(func.lower(Car.engine_type).like('%dīzel%') | 
-                                        func.lower(Car.engine_type).like('%diesel%'))
-                elif fuel_type.lower() in ['hybrid', 'hibrīds', 'hibrids']:
-                    query = query.filter(func.lower(Car.engine_type).like('%hibrīd%') | 
-                                        func.lower(Car.engine_type).like('%hybrid%'))
-                elif fuel_type.lower() in ['electric', 'elektriskais', 'elektrisks']:
-                    query = query.filter(func.lower(Car.engine_type).like('%elektr%'))
-                elif fuel_type.lower() in ['gas', 'gāze', 'gaze']:
-                    query = query.filter(func.lower(Car.engine_type).like('%gāz%') | 
-                                        func.lower(Car.engine_type).like('%gas%'))
-                else:
-                    # Just try to match whatever they typed
-                    query = query.filter(func.lower(Car.engine_type).like(f'%{fuel_type.lower()}%'))
+                query = query.filter(Car.engine_type_key.in_(fuel_type_keys(fuel_type)))
                     
             if transmission:
-                query = query.filter(func.lower(Car.transmission) == func.lower(transmission))
+                query = query.filter(Car.transmission_key == normalize_key(transmission))
             if price_from:
                 query = query.filter(Listing.price >= price_from)
             if price_to:
                 query = query.filter(Listing.price <= price_to)
             if region:
-                query = query.filter(func.lower(Region.name) == func.lower(region))
+                query = query.filter(Region.name_key == normalize_key(region))
             
             # Only active listings
             query = query.filter(Listing.is_active == True)
@@ -317,10 +322,10 @@ def region_statistics():
         
         # Apply filters
         if brand:
-            query = query.filter(func.lower(Brand.name) == func.lower(brand))
+            query = query.filter(Brand.name_key == normalize_key(brand))
         
         if model:
-            query = query.filter(func.lower(Model.name) == func.lower(model))
+            query = query.filter(Model.name_key == normalize_key(model))
             
         if year_from:
             query = query.filter(Car.year >= year_from)
@@ -418,167 +423,12 @@ def listing_details():
     logger_listing_details.info(f"Getting details for: {listing_url}")
 
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept-Language': 'lv-LV,lv;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Connection': 'keep-alive',
-            'Referer': 'https://www.ss.lv/'
-        }
+        details, cache_state = details_cache.get(listing_url)
         
-        response = requests.get(listing_url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        details = {}
-
-        # Extract description (before tables)
-        description_div = soup.select_one('div#msg_div_msg')
-        if description_div:
-            description_copy = description_div.__copy__()
-            
-            # Remove the options/price tables
-            options_table = description_copy.select_one('table.options_list')
-            if options_table:
-                options_table.extract()
-            
-            # Remove price tables
-            price_tables = description_copy.find_all('table')
-            for table in price_tables:
-                # Check if this looks like a price table
-                price_indicators = [
-                    table.find('td', class_='ads_opt_name_big'),
-                    table.find('td', class_='ads_price'),
-                    table.find('span', class_='ads_price'),
-                    table.find('a', class_='a9a'),
-                    table.find('img', src=lambda x: x and 'octa_logo.png' in x)
-                ]
-                
-                if any(price_indicators):
-                    table.extract()
-                    continue
-                
-                # Also check text content
-                table_text = table.get_text()
-                if 'Cena:' in table_text or '€' in table_text or 'apdrošināšanu' in table_text:
-                    table.extract()
-            
-            # Clean up description text
-            description_text = description_copy.get_text(separator='\n', strip=True)
-            lines = [line.strip() for line in description_text.split('\n') if line.strip()]
-            description_text = '\n'.join(lines)
-            
-            details['description'] = description_text
-        else:
-            details['description'] = None
-
-        # Get publication date
-        date_cell = soup.select_one('td.msg_footer[align="right"]')
-        if date_cell and 'Datums:' in date_cell.get_text():
-            date_text = date_cell.get_text().strip()
-            if 'Datums:' in date_text:
-                publication_date = date_text.split('Datums:')[1].strip()
-                details['publication_date'] = publication_date
-        else:
-            details['publication_date'] = None
-
-        # Find main image
-        image_elem = soup.select_one('img#msg_img_img')
-        if image_elem and image_elem.has_attr('src'):
-            details['image_url'] = image_elem['src']
-        else:
-            image_elem_fallback = soup.select_one('div#big_pic_div img')
-            if image_elem_fallback and image_elem_fallback.has_attr('src'):
-                details['image_url'] = image_elem_fallback['src']
-            else:
-                details['image_url'] = None
-
-        # Parse the parameters table
-        params_table = soup.select_one('div#msg_div_msg table.options_list')
-        if params_table:
-            rows = params_table.select('tr')
-            for row in rows:
-                label_cell = row.select_one('td.ads_opt_name')
-                value_cell = row.select_one('td.ads_opt')
-                if label_cell and value_cell:
-                    label_text = label_cell.get_text(strip=True).lower()
-                    value_text = value_cell.get_text(strip=True)
-                    
-                    # Clean up value
-                    value_text = ' '.join(value_text.split())
-                    
-                    # Map labels to fields
-                    if 'marka' in label_text:
-                        bold_elem = value_cell.select_one('b')
-                        if bold_elem:
-                            details['brand_model_detail'] = bold_elem.get_text(strip=True)
-                        else:
-                            details['brand_model_detail'] = value_text
-                    elif 'izlaiduma gads' in label_text:
-                        details['year_detail'] = value_text
-                    elif 'dzinēja tips' in label_text or 'motors' in label_text:
-                        details['engine_detail'] = value_text
-                    elif 'ātr.kārba' in label_text or 'ātrumkārba' in label_text:
-                        details['transmission_detail'] = value_text
-                    elif 'nobraukums' in label_text:
-                        # Clean up mileage
-                        mileage_digits = ''.join(filter(str.isdigit, value_text))
-                        details['mileage_detail'] = mileage_digits
-                    elif 'krāsa' in label_text:
-                        color_text = value_text.split('\n')[0].strip()
-                        details['color_detail'] = color_text
-                    elif 'virsbūves tips' in label_text:
-                        details['body_type_detail'] = value_text
-                    elif 'tehniskā apskate' in label_text:
-                        details['tech_inspection'] = value_text
-
-        # Extract price
-        price_elem = soup.select_one('span.ads_price#tdo_8')
-        if price_elem:
-            price_text = price_elem.get_text(strip=True)
-            price_clean = price_text.replace('€', '').replace(' ', '').replace(',', '')
-            try:
-                details['price_detail'] = int(price_clean)
-            except ValueError:
-                details['price_detail'] = price_text
-
-        # Get equipment list
-        equipment_list = []
-        if description_div:
-            checkboxes = description_div.select('input[type="checkbox"]')
-            for checkbox in checkboxes:
-                label = checkbox.find_next_sibling(text=True)
-                if label:
-                    equipment_list.append(label.strip())
-        
-        # Also check description for equipment
-        if details.get('description'):
-            desc_text = details['description']
-            lines = desc_text.split('\n')
-            for line in lines:
-                line = line.strip()
-                if line.startswith('•') or line.startswith('-'):
-                    equipment_list.append(line[1:].strip())
-        
-        details['equipment'] = equipment_list
-        
-        # Extract region from contacts table
-        contacts_table = soup.select_one('table.contacts_table')
-        if contacts_table:
-            rows = contacts_table.select('tr')
-            for row in rows:
-                label_cell = row.select_one('td.ads_contacts_name')
-                value_cell = row.select_one('td.ads_contacts')
-                
-                if label_cell and value_cell:
-                    label_text = label_cell.get_text(strip=True)
-                    if label_text == 'Vieta:':
-                        details['region'] = value_cell.get_text(strip=True)
-                        break
-        
-        logger_listing_details.info(f"Details scraped successfully for {listing_url}")
-        return jsonify(details)
+        logger_listing_details.info(f"Details for {listing_url} ({cache_state})")
+        response = jsonify(details)
+        response.headers['X-Cache'] = cache_state
+        return response
         
     except requests.exceptions.Timeout:
         logger_listing_details.error(f"Timeout for {listing_url}")
@@ -622,8 +472,8 @@ def debug_counts():
         )
         
         if brand_filter:
-            query_cars = query_cars.filter(func.lower(Brand.name) == func.lower(brand_filter))
-            query_listings = query_listings.filter(func.lower(Brand.name) == func.lower(brand_filter))
+            query_cars = query_cars.filter(Brand.name_key == normalize_key(brand_filter))
+            query_listings = query_listings.filter(Brand.name_key == normalize_key(brand_filter))
         
         cars_by_brand = {row[0]: row[1] for row in query_cars.all()}
         listings_by_brand = {row[0]: row[1] for row in query_listings.all()}
@@ -639,7 +489,7 @@ def debug_counts():
                 .join(Brand, Model.brand_id == Brand.brand_id)
                 .join(Car, Model.model_id == Car.model_id)
                 .join(Listing, Car.car_id == Listing.car_id)
-                .filter(func.lower(Brand.name) == func.lower(brand_filter))
+                .filter(Brand.name_key == normalize_key(brand_filter))
                 .filter(Listing.is_active == True)
                 .group_by(Model.name)
             )
@@ -675,7 +525,7 @@ def price_history():
             months=months
         )
         
-        if not history or not history.get('labels'):
+        if not history or not history.get('dates'):
             logger.warning(f"No price history for {brand} {model}")
             return jsonify({"error": "No price history available"}), 404
         
@@ -686,6 +536,38 @@ def price_history():
         return jsonify({"error": "Price history failed"}), 500
 
 
+@app.route('/api/listing-price-history', methods=['GET'])
+def listing_price_history():
+    """Every price one listing has had"""
+    try:
+        listing_id = request.args.get('listing_id', type=int)
+        if not listing_id:
+            return jsonify({"error": "listing_id required"}), 400
+        
+        return jsonify({"listing_id": listing_id, "prices": analyzer.get_listing_price_history(listing_id)})
+        
+    except Exception as e:
+        logger.error(f"Listing price history failed: {str(e)}", exc_info=True)
+        return jsonify({"error": "Listing price history failed"}), 500
+
+
+@app.route('/api/price-drops', methods=['GET'])
+def price_drops():
+    """Listings whose price was cut recently, biggest cuts first"""
+    try:
+        brand = request.args.get('brand')
+        model = request.args.get('model')
+        days = request.args.get('days', default=30, type=int)
+        limit = request.args.get('limit', default=20, type=int)
+        
+        drops = analyzer.get_price_drops(brand=brand, model=model, days=days, limit=min(limit, 100))
+        return jsonify({"drops": drops, "count": len(drops)})
+        
+    except Exception as e:
+        logger.error(f"Price drops failed: {str(e)}", exc_info=True)
+        return jsonify({"error": "Price drops failed"}), 500
+
+
 @app.route('/api/charts/price-distribution', methods=['GET'])
 def price_distribution_chart():
     """Generate price distribution histogram"""
@@ -1083,29 +965,58 @@ def popular_models():
 
 @app.route('/api/scrape', methods=['POST'])
 def scrape_data():
-    """Trigger scraping (admin only in real app)"""
+    """Start a scrape in the background (admin only in real app)"""
     try:
         logger.info("Scraping triggered via API")
         
         # Get scraping parameters
         data = request.json or {}
-        max_brands = data.get('max_brands', 5)
-        models_per_brand = data.get('models_per_brand', 3)
-        pages_per_model = data.get('pages_per_model', 2)
+        pages_per_model = int(data.get('pages_per_model', 2))
         
-        # Run scraper
-        scrape_results = run_ss_scraper(
-            pages_per_model=pages_per_model
+        job = scrape_jobs.submit(
+            pages_per_model=pages_per_model,
+            incremental=bool(data.get('incremental', False)),
+            resume=bool(data.get('resume', False))
         )
         
-        logger.info(f"Scraping completed: {scrape_results}")
-        return jsonify({"status": "Scraping finished", "results": scrape_results})
+        return jsonify({
+            "status": "Scraping started",
+            "job": job,
+            "status_url": f"/api/scrape/jobs/{job['job_id']}"
+        }), 202
         
+    except JobConflictError as e:
+        return jsonify({"error": "A scrape is already running for this source", "job": e.job}), 409
     except Exception as e:
         logger.error(f"Scraping failed: {str(e)}", exc_info=True)
         return jsonify({"error": "Scraping failed"}), 500
 
 
+@app.route('/api/scrape/jobs', methods=['GET'])
+def scrape_job_list():
+    """Recent scrape jobs, newest first"""
+    return jsonify({"jobs": scrape_jobs.list()})
+
+
+@app.route('/api/scrape/jobs/<job_id>', methods=['GET'])
+def scrape_job_status(job_id):
+    """Status and progress counters for one scrape job"""
+    job = scrape_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route('/api/scrape/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_scrape_job(job_id):
+    """Stop a scrape job - a cancelled run can be picked up again with resume"""
+    job = scrape_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    logger.info(f"Cancel requested for scrape job {job_id}")
+    return jsonify(job)
+
+
 @app.route('/api/status', methods=['GET'])
 def system_status():
     """System status and database info"""
@@ -1144,6 +1055,7 @@ def system_status():
                 "last_scrape": last_scraped,
                 "newest_listing": newest_date
             },
+            "listing_details_cache": details_cache.stats(),
             "system": {
                 "version": "1.0.0",
                 "status": "Operational",
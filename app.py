@@ -2,7 +2,10 @@ import os
 import argparse
 import logging
 from models import init_db
+from ingest import backfill_price_observations
 from ss_scraper import run_ss_scraper
+from scheduler import ScrapeScheduler
+from config import Config
 from api import app as api_app
 
 
@@ -18,8 +21,12 @@ def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Car Price Analysis System')
     
-    parser.add_argument('--mode', choices=['api', 'scrape', 'init'], default='api',
-                      help='Run mode: api (default), scrape (run scraping only), init (initialize database)')
+    parser.add_argument('--mode', choices=['api', 'scrape', 'schedule', 'init'], default='api',
+                      help='Run mode: api (default), scrape (run scraping only), '
+                           'schedule (keep scraping on the configured interval), init (initialize database)')
+    
+    parser.add_argument('--config', type=str, default=None,
+                      help='JSON config file (scrape_interval_hours, max_listings_per_source, ...)')
     
     parser.add_argument('--port', type=int, default=5000,
                       help='Port number for API server (default: 5000)')
@@ -37,6 +44,15 @@ def parse_arguments():
     parser.add_argument('--pages', type=int, default=2,
                       help='Maximum number of pages per model (default: 2)')
     
+    parser.add_argument('--incremental', action='store_true',
+                      help='Skip detail pages for listings we already have at the same price')
+    
+    parser.add_argument('--resume', action='store_true',
+                      help='Resume the last interrupted scrape instead of starting over')
+    
+    parser.add_argument('--parse-workers', type=int, default=None,
+                      help='Processes used to parse pages (default: one per CPU, 0 = no pool)')
+    
     return parser.parse_args()
 
 def init_database():
@@ -46,6 +62,9 @@ def init_database():
     # database file
     session, _ = init_db("sqlite:///car_price_analysis.db")
     
+    # Listings from before the price log existed start their history here
+    backfill_price_observations(session)
+    
     logger.info("Database initialization completed")
 
 def run_scraper(args):
@@ -58,7 +77,10 @@ def run_scraper(args):
     results = run_ss_scraper(
         target_brands=target_brands,
         pages_per_model=args.pages,
-        debug_mode=args.debug
+        debug_mode=args.debug,
+        incremental=args.incremental,
+        parse_workers=args.parse_workers,
+        resume=args.resume
     )
     
     logger.info("Scraping process completed")
@@ -69,6 +91,21 @@ def run_scraper(args):
     else:
         logger.error(f"Scraping failed: {results['error']}")
 
+def run_scheduler(args):
+    """Run incremental scrapes on the configured interval until stopped"""
+    logger.info("Starting scrape scheduler")
+    
+    scheduler = ScrapeScheduler(
+        config=Config(args.config),
+        target_brands=["tesla", "infiniti", "smart", "suzuki"],
+        pages_per_model=args.pages,
+        parse_workers=args.parse_workers
+    )
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        logger.info("Scrape scheduler stopped")
+
 def run_api_server(port, debug):
     """Run API server"""
     logger.info(f"Starting API server on port {port}")
@@ -82,6 +119,8 @@ def main():
         init_database()
     elif args.mode == 'scrape':
         run_scraper(args)
+    elif args.mode == 'schedule':
+        run_scheduler(args)
     elif args.mode == 'api':
         run_api_server(args.port, args.debug)
     else:
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import ss_scraper
+from fixture_server import FixtureServer, FixtureSite
+from rate_limiter import AdaptiveRateLimiter
+
+try:
+    import resource  # not on Windows
+except ImportError:
+    resource = None
+
+# Results we compare against a baseline - higher is better for all of them
+GUARDED_METRICS = ['pages_per_second', 'listings_per_second']
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_benchmark(site, pages_per_model=3, parse_workers=None, latency=0.05, error_rate=0.0,
+                  throttle_rate=0.0, max_rate=50.0):
+    """Run a full Scraper.run_async against a local fixture server and time it"""
+    work_dir = tempfile.mkdtemp(prefix='scraper_bench_')
+    try:
+        with FixtureServer(site, latency=latency, error_rate=error_rate, throttle_rate=throttle_rate) as server:
+            scraper = ss_scraper.Scraper(
+                target_brands=site.brand_slugs(),
+                db_url=f"sqlite:///{os.path.join(work_dir, 'bench.db')}",
+                parse_workers=parse_workers,
+                base_url=server.base_url
+            )
+            # The fixture can take far more than SS.LV, let the limiter find out how much
+            scraper.rate_limiter = AdaptiveRateLimiter(initial_rate=max_rate / 4, min_rate=0.2, max_rate=max_rate)
+
+            cpu_before = time.process_time()
+            children_before = _children_cpu()
+            started = time.perf_counter()
+            result = asyncio.run(scraper.run_async(pages_per_model))
+            elapsed = time.perf_counter() - started
+            cpu = time.process_time() - cpu_before
+            children_cpu = _children_cpu() - children_before
+            scraper.engine.dispose()
+
+        pages_served = server.status_counts.get(200, 0)
+        stage_cpu = {name: stats['cpu_seconds'] for name, stats in result.get('pipeline', {}).items()}
+        return {
+            "success": result.get('success', False),
+            "elapsed_seconds": round(elapsed, 2),
+            "pages": pages_served,
+            "listings": result.get('total_listings', 0),
+            "pages_per_second": round(pages_served / elapsed, 2),
+            "listings_per_second": round(result.get('total_listings', 0) / elapsed, 2),
+            "cpu_seconds": round(cpu, 2),
+            "parse_worker_cpu_seconds": round(children_cpu, 2),
+            "stage_cpu_seconds": stage_cpu,
+            # Brand/model pages, setup, the sweep at the end and the fixture server thread
+            "other_cpu_seconds": round(cpu - sum(stage_cpu.values()), 2),
+            "peak_rss_mb": _peak_rss_mb(),
+            "responses": dict(sorted(server.status_counts.items())),
+            "errors": result.get('errors', 0),
+            "pipeline": result.get('pipeline', {})
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare_to_baseline(results, baseline, tolerance=0.15):
+    """List the guarded metrics that dropped more than `tolerance` below the baseline"""
+    regressions = []
+    for metric in GUARDED_METRICS:
+        old, new = baseline.get(metric), results.get(metric)
+        if old and new is not None and new < old * (1 - tolerance):
+            regressions.append(f"{metric}: {new} vs baseline {old} ({(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scraper against a local SS.LV stand-in")
+    parser.add_argument('--archive', metavar='DIR', help='Serve recorded pages from a page archive')
+    parser.add_argument('--brands', type=int, default=4, help='Synthetic site: number of brands')
+    parser.add_argument('--models', type=int, default=5, help='Synthetic site: models per brand')
+    parser.add_argument('--listings-per-page', type=int, default=30, help='Synthetic site: listings per list page')
+    parser.add_argument('--pages', type=int, default=3, help='List pages per model')
+    parser.add_argument('--parse-workers', type=int, help='Parse worker processes (default: one per CPU)')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds of latency per response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of 500 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of 429 responses')
+    parser.add_argument('--max-rate', type=float, default=50.0, help='Rate limiter ceiling (requests/s)')
+    parser.add_argument('--save', metavar='FILE', help='Write the results to a JSON file')
+    parser.add_argument('--baseline', metavar='FILE', help='Fail if results are worse than this saved run')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed drop against the baseline')
+    args = parser.parse_args()
+
+    # The scraper logs every page to the console, which would swamp the
+    # summary and cost CPU we're trying to measure
+    ss_scraper.console_handler.setLevel(logging.WARNING)
+
+    if args.archive:
+        site = FixtureSite.from_archive(args.archive)
+    else:
+        site = FixtureSite.synthetic(brands=args.brands, models_per_brand=args.models,
+                                     pages_per_model=args.pages, listings_per_page=args.listings_per_page)
+
+    results = run_benchmark(site, pages_per_model=args.pages, parse_workers=args.parse_workers,
+                            latency=args.latency, error_rate=args.error_rate,
+                            throttle_rate=args.throttle_rate, max_rate=args.max_rate)
+
+    summary = {key: value for key, value in results.items() if key != 'pipeline'}
+    print(json.dumps(summary, indent=2))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+    sys.exit(0 if results['success'] else 1)
@@ -12,6 +12,10 @@ class Config:
         # Default configuration
         self.config = {
             'db_url': os.environ.get('CAR_PRICE_DB_URL', 'sqlite:///car_price_analysis.db'),
+            'db_pool_size': int(os.environ.get('CAR_PRICE_DB_POOL_SIZE', 5)),
+            'db_max_overflow': int(os.environ.get('CAR_PRICE_DB_MAX_OVERFLOW', 10)),
+            'db_pool_timeout': int(os.environ.get('CAR_PRICE_DB_POOL_TIMEOUT', 30)),
+            'db_busy_timeout_ms': int(os.environ.get('CAR_PRICE_DB_BUSY_TIMEOUT', 5000)),
             'api_host': os.environ.get('CAR_PRICE_API_HOST', '0.0.0.0'),
             'api_port': int(os.environ.get('CAR_PRICE_API_PORT', 5000)),
             'debug': os.environ.get('CAR_PRICE_DEBUG', 'False').lower() == 'true',
@@ -36,6 +40,15 @@ class Config:
         except Exception as e:
             print(f"Error loading config file: {str(e)}")
     
+    def db_options(self):
+        """Connection pool and lock wait settings, as keyword arguments for init_db"""
+        return {
+            'pool_size': self.config['db_pool_size'],
+            'max_overflow': self.config['db_max_overflow'],
+            'pool_timeout': self.config['db_pool_timeout'],
+            'busy_timeout': self.config['db_busy_timeout_ms']
+        }
+    
     def get(self, key, default=None):
         """Get configuration value"""
         return self.config.get(key, default)
@@ -0,0 +1,220 @@
+import hashlib
+import logging
+import math
+import random
+import re
+from array import array
+from sqlalchemy import insert
+from models import Listing, ListingFingerprint, LshBucket, ListingRepost
+
+logger = logging.getLogger('ss_scraper.dedup')
+
+# 2^61 - 1 is prime, so (a * x + b) % PRIME is a decent family of hash functions
+PRIME = (1 << 61) - 1
+NUM_PERM = 64
+BANDS = 16  # 4 minhashes per band - pairs above ~0.5 similarity nearly always share a bucket
+SHINGLE_SIZE = 4
+MILEAGE_STEP = 5000  # km, a repost often has a bit more on the clock
+PRICE_STEP = 0.1  # price bands are ~10% wide, reposts usually come a bit cheaper
+MIN_FEATURE_WEIGHT = 8
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _signed64(text):
+    # SQLite integers are signed
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def listing_tokens(listing_data, region_id=None):
+    """The features we compare listings on: car details plus character shingles of the ad text.
+
+    Model and year aren't in here, they're part of every bucket key instead.
+    Mileage, engine and price band are what tell two cars of the same model
+    and year apart (the ad text is often much the same template), so each of
+    them goes in as many copies as half the shingles - two listings that
+    differ on one of them end up under the threshold.
+    """
+    # On SS.LV the list page title is the start of the description
+    text = ' '.join(re.findall(r'\w+', (listing_data.get('title') or '').lower()))
+    tokens = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+    features = [f"engine:{listing_data.get('engine_type')}:{listing_data.get('engine_volume')}"]
+    if listing_data.get('mileage'):
+        features.append(f"km:{int(listing_data['mileage']) // MILEAGE_STEP}")
+    if listing_data.get('price'):
+        features.append(f"price:{int(math.log(listing_data['price']) / math.log(1 + PRICE_STEP))}")
+    weight = max(MIN_FEATURE_WEIGHT, len(tokens) // 2)
+    for feature in features:
+        tokens.update(f"{feature}#{n}" for n in range(weight))
+
+    if region_id is not None:
+        tokens.add(f"region:{region_id}")
+    for field in ('transmission', 'body_type', 'color'):
+        if listing_data.get(field):
+            tokens.add(f"{field}:{str(listing_data[field]).lower()}")
+    return tokens
+
+
+def _overlaps(range_a, range_b):
+    # (first day, last day seen) - overlapping means both ads were up at once
+    return range_a[0] <= range_b[1] and range_b[0] <= range_a[1]
+
+
+def pack_signature(signature):
+    return array('Q', signature).tobytes()
+
+
+def unpack_signature(data):
+    signature = array('Q')
+    signature.frombytes(data)
+    return signature
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity - the share of minhashes that agree"""
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / len(signature_a)
+
+
+class MinHasher:
+    """MinHash signatures and LSH band keys for token sets"""
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm has to be a multiple of bands")
+        # Fixed seed - signatures are stored, so they have to come out the same every run
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, PRIME), rng.randrange(0, PRIME)) for _ in range(num_perm)]
+        self.bands = bands
+        self.rows = num_perm // bands
+
+    def signature(self, tokens):
+        hashes = [_hash64(token) for token in tokens] or [0]
+        return [min((a * x + b) % PRIME for x in hashes) for a, b in self.params]
+
+    def bucket_keys(self, signature, model_id, year):
+        """One key per band. Only listings of the same model and year can share one"""
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            keys.append(_signed64(f"{band}:{model_id}:{year}:" + ','.join(map(str, rows))))
+        return keys
+
+
+class RepostDetector:
+    """Links new listings to earlier ones that look like the same car.
+
+    Each new listing gets a MinHash signature and goes into one LSH bucket
+    per band. Candidates are whatever already sits in the same buckets (an
+    indexed lookup, not a scan of the listings table); a candidate counts
+    as the original if the signatures agree on at least `threshold` of
+    their minhashes and the two ads weren't up at the same time (then
+    they're two cars, or at least not a repost). Reposts of reposts point
+    at the first listing.
+    """
+
+    def __init__(self, threshold=0.7, hasher=None, batch_size=500):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self.batch_size = batch_size  # keep IN lists under SQLite's variable limit
+
+    def _batches(self, values):
+        values = list(values)
+        for start in range(0, len(values), self.batch_size):
+            yield values[start:start + self.batch_size]
+
+    def process(self, session, new_listings, now):
+        """Fingerprint freshly inserted listings and record any reposts among them.
+
+        new_listings is a list of (listing_id, model_id, year, tokens, listed_on,
+        seen_on) - the dates are when the ad went up and when we saw it. Runs
+        in the caller's transaction. Returns how many reposts were found.
+        """
+        prepared = []
+        ranges = {}
+        for listing_id, model_id, year, tokens, listed_on, seen_on in new_listings:
+            signature = self.hasher.signature(tokens)
+            prepared.append((listing_id, model_id, signature, self.hasher.bucket_keys(signature, model_id, year)))
+            ranges[listing_id] = (listed_on, seen_on)
+
+        # Everything already indexed that shares a bucket with one of them
+        members = {}
+        for keys in self._batches({key for _, _, _, keys in prepared for key in keys}):
+            for key, listing_id in session.query(LshBucket.bucket_key, LshBucket.listing_id).filter(
+                LshBucket.bucket_key.in_(keys)
+            ):
+                members.setdefault(key, set()).add(listing_id)
+
+        candidate_ids = set().union(*members.values())
+        signatures, originals = {}, {}
+        for ids in self._batches(candidate_ids):
+            for listing_id, data in session.query(ListingFingerprint.listing_id, ListingFingerprint.signature).filter(
+                ListingFingerprint.listing_id.in_(ids)
+            ):
+                signatures[listing_id] = unpack_signature(data)
+            for listing_id, original_id in session.query(ListingRepost.listing_id, ListingRepost.original_listing_id).filter(
+                ListingRepost.listing_id.in_(ids)
+            ):
+                originals[listing_id] = original_id
+            # updated_at is the last time we saw the listing
+            for listing_id, listed_on, last_seen in session.query(Listing.listing_id, Listing.listing_date, Listing.updated_at).filter(
+                Listing.listing_id.in_(ids)
+            ):
+                ranges[listing_id] = (listed_on, last_seen.date() if last_seen else listed_on)
+
+        fingerprints, buckets, reposts = [], [], []
+        for listing_id, model_id, signature, keys in prepared:
+            best = None
+            candidates = set().union(*(members.get(key, ()) for key in keys))
+            for candidate in candidates:
+                # Bucket entries can outlive their listing or fingerprint
+                if candidate not in ranges or candidate not in signatures:
+                    continue
+                if _overlaps(ranges[listing_id], ranges[candidate]):
+                    continue
+                score = similarity(signature, signatures[candidate])
+                # Ties go to the older listing
+                if score >= self.threshold and (best is None or (score, -candidate) > (best[0], -best[1])):
+                    best = (score, candidate)
+
+            if best:
+                original_id = originals.get(best[1], best[1])
+                originals[listing_id] = original_id
+                reposts.append({'listing_id': listing_id, 'original_listing_id': original_id,
+                                'similarity': round(best[0], 3), 'created_at': now})
+
+            # Later listings in the same chunk can match this one too
+            signatures[listing_id] = signature
+            for key in keys:
+                members.setdefault(key, set()).add(listing_id)
+            fingerprints.append({'listing_id': listing_id, 'model_id': model_id,
+                                 'signature': pack_signature(signature), 'created_at': now})
+            buckets.extend({'bucket_key': key, 'listing_id': listing_id} for key in keys)
+
+        if fingerprints:
+            session.execute(insert(ListingFingerprint), fingerprints)
+            session.execute(insert(LshBucket), buckets)
+        if reposts:
+            session.execute(insert(ListingRepost), reposts)
+            logger.info(f"Found {len(reposts)} reposts among {len(prepared)} new listings")
+        return len(reposts)
+
+
+if __name__ == "__main__":
+    import argparse
+    from models import init_db
+
+    parser = argparse.ArgumentParser(description="Show listings that look like reposts")
+    parser.add_argument('--db', default="sqlite:///car_price_analysis.db", help='Database URL')
+    parser.add_argument('--limit', type=int, default=20, help='How many of the newest reposts to list')
+    args = parser.parse_args()
+
+    session, _ = init_db(args.db)
+    print(f"{session.query(ListingRepost).count()} reposts, "
+          f"{session.query(ListingFingerprint).count()} fingerprinted listings")
+    for repost in session.query(ListingRepost).order_by(ListingRepost.repost_id.desc()).limit(args.limit):
+        new, original = session.get(Listing, repost.listing_id), session.get(Listing, repost.original_listing_id)
+        print(f"{new.external_id} ({new.price}) looks like {original.external_id} ({original.price}), "
+              f"similarity {repost.similarity}")
@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('car_api.details_cache')
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'lv-LV,lv;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Connection': 'keep-alive',
+    'Referer': 'https://www.ss.lv/'
+}
+
+
+class ListingDetailsCache:
+    """Parsed listing details, cached by listing URL.
+
+    Entries are fresh for `ttl` seconds. After that they're still served for
+    up to `stale_ttl` more seconds while a background refresh gets the new
+    version (stale-while-revalidate). If several requests want the same
+    uncached page at once only one of them fetches it, the rest wait for
+    its result. All fetches go through one keep-alive requests.Session.
+    """
+
+    def __init__(self, parser, ttl=300, stale_ttl=3600, max_entries=1000, timeout=15,
+                 pool_size=10, refresh_workers=4):
+        self.parser = parser
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+
+        self.http = requests.Session()
+        self.http.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+
+        self.entries = OrderedDict()  # url -> (fetched_at, details), oldest used first
+        self.in_flight = {}  # url -> Future for the fetch in progress
+        self.lock = threading.Lock()
+        self.refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='details-refresh')
+
+        # Counters for reporting
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.shared_fetches = 0  # callers that waited on someone else's fetch
+
+    def _fetch(self, url):
+        response = self.http.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return self.parser.parse_full_details(response.content)
+
+    def _load(self, url, future):
+        """Fetch a page for everyone waiting on `future`"""
+        try:
+            details = self._fetch(url)
+        except Exception as e:
+            with self.lock:
+                self.in_flight.pop(url, None)
+            future.set_exception(e)
+            return
+
+        with self.lock:
+            self.entries[url] = (time.monotonic(), details)
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.in_flight.pop(url, None)
+        future.set_result(details)
+
+    def _refresh(self, url, future):
+        self._load(url, future)
+        if future.exception() is not None:
+            # Keep serving the old copy until it runs out
+            logger.warning(f"Background refresh failed for {url}: {str(future.exception())}")
+
+    def get(self, url):
+        """Details for a listing URL, returns (details, 'hit' | 'stale' | 'miss')"""
+        leader = False
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                age = time.monotonic() - entry[0]
+                if age < self.ttl:
+                    self.entries.move_to_end(url)
+                    self.hits += 1
+                    return entry[1], 'hit'
+                if age < self.ttl + self.stale_ttl:
+                    self.entries.move_to_end(url)
+                    self.stale_hits += 1
+                    if url not in self.in_flight:
+                        future = self.in_flight[url] = Future()
+                        self.refresher.submit(self._refresh, url, future)
+                    return entry[1], 'stale'
+                del self.entries[url]
+
+            self.misses += 1
+            future = self.in_flight.get(url)
+            if future is None:
+                future = self.in_flight[url] = Future()
+                leader = True
+            else:
+                self.shared_fetches += 1
+
+        if leader:
+            self._load(url, future)
+        # Raises whatever the fetch raised, for the leader and everyone waiting
+        return future.result(timeout=self.timeout * 2), 'miss'
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "in_flight": len(self.in_flight),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "shared_fetches": self.shared_fetches
+            }
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import random
+import threading
+from urllib.parse import urlparse
+from aiohttp import web
+
+logger = logging.getLogger('ss_scraper.fixture_server')
+
+CARS_PATH = '/lv/transport/cars/'
+
+
+class FixtureSite:
+    """The pages a FixtureServer serves, keyed by URL path"""
+
+    def __init__(self, pages=None):
+        self.pages = pages or {}
+
+    @classmethod
+    def from_archive(cls, directory):
+        """Use recorded pages from a page archive (newest copy of each URL)"""
+        from page_archive import PageArchive
+        archive = PageArchive(directory)
+        pages = {}
+        for url, fetched_at, content in archive.iter_pages():
+            pages[urlparse(url).path] = content  # oldest first, so newer copies win
+        archive.close()
+        logger.info(f"Loaded {len(pages)} recorded pages from {directory}")
+        return cls(pages)
+
+    @classmethod
+    def synthetic(cls, brands=4, models_per_brand=5, pages_per_model=3, listings_per_page=30, seed=1):
+        """Generate SS.LV-shaped category, list and detail pages"""
+        rng = random.Random(seed)
+        pages = {}
+        brand_links = []
+
+        for b in range(brands):
+            brand_slug = f"brand{b}"
+            model_links = []
+            for m in range(models_per_brand):
+                model_slug = f"model-{m}"
+                model_path = f"{CARS_PATH}{brand_slug}/{model_slug}/"
+                listing_count = pages_per_model * listings_per_page
+                model_links.append(_category_link(model_path, f"Model {m}", listing_count))
+
+                for page in range(1, pages_per_model + 1):
+                    rows = []
+                    for n in range(listings_per_page):
+                        listing_id = f"{brand_slug}{model_slug}{page:03d}{n:03d}".replace('-', '')
+                        detail_path = f"/msg/lv/transport/cars/{brand_slug}/{model_slug}/{listing_id}.html"
+                        listing = {
+                            'year': rng.randint(2005, 2024),
+                            'engine': round(rng.uniform(1.0, 3.0), 1),
+                            'mileage': rng.randint(10, 300),
+                            'price': rng.randint(1500, 60000),
+                            'title': f"Brand {b} Model {m} in good condition",
+                            'engine_type': rng.choice(['Benzīns', 'Dīzelis', 'Hibrīds']),
+                            'transmission': rng.choice(['Manuāla', 'Automāts']),
+                            'color': rng.choice(['Balta', 'Melna', 'Pelēka', 'Zila']),
+                            'body': rng.choice(['Sedans', 'Universāls', 'Hečbeks']),
+                            'region': rng.choice(['Rīga', 'Jelgava', 'Liepāja', 'Daugavpils'])
+                        }
+                        rows.append(_list_row(listing_id, detail_path, listing))
+                        pages[detail_path] = _detail_page(f"Brand {b} Model {m}", listing).encode('utf-8')
+
+                    page_path = model_path if page == 1 else f"{model_path}page{page}.html"
+                    next_path = f"{model_path}page{page + 1}.html" if page < pages_per_model else None
+                    pages[page_path] = _list_page(rows, next_path).encode('utf-8')
+
+            pages[f"{CARS_PATH}{brand_slug}/"] = _html(''.join(model_links)).encode('utf-8')
+            brand_links.append(_category_link(f"{CARS_PATH}{brand_slug}/", f"Brand {b}",
+                                              models_per_brand * pages_per_model * listings_per_page))
+
+        pages[CARS_PATH] = _html(''.join(brand_links)).encode('utf-8')
+        return cls(pages)
+
+    def brand_slugs(self):
+        """Slugs of every brand that has a page under the cars category"""
+        slugs = set()
+        for path in self.pages:
+            if path.startswith(CARS_PATH):
+                parts = path[len(CARS_PATH):].strip('/').split('/')
+                if parts[0]:
+                    slugs.add(parts[0])
+        return sorted(slugs)
+
+
+def _html(body):
+    return f'<!DOCTYPE html><html><head><meta charset="UTF-8"><title>SS.LV</title></head><body>{body}</body></html>'
+
+
+def _category_link(path, name, count):
+    return (f'<h4 class="category"><a class="a_category" href="{path}">{name}</a></h4>'
+            f'<span class="category_cnt">({count})</span>')
+
+
+def _list_row(listing_id, detail_path, listing):
+    price = f"{listing['price']:,}".replace(',', ' ')
+    return (f'<tr id="tr_{listing_id}"><td class="msga2 pp0"><input type="checkbox"></td>'
+            f'<td class="msga2 pp0"><a href="{detail_path}"><img src="https://i.ss.lv/thumb.jpg"></a></td>'
+            f'<td class="msg2"><div class="d1"><a class="am" href="{detail_path}">{listing["title"]}</a></div></td>'
+            f'<td class="msga2-o pp6">{listing["year"]}</td>'
+            f'<td class="msga2-o pp6">{listing["engine"]}</td>'
+            f'<td class="msga2-o pp6">{listing["mileage"]} tūkst.</td>'
+            f'<td class="msga2-o pp6">{price}  €</td></tr>')
+
+
+def _list_page(rows, next_path):
+    navi = f'<a class="navi" href="{next_path}">Nākamā</a>' if next_path else ''
+    return _html(f'<table>{"".join(rows)}<tr id="tr_bnr_712"><td>reklāma</td></tr></table>{navi}')
+
+
+def _detail_page(brand_model, listing):
+    price = f"{listing['price']:,}".replace(',', ' ')
+    return _html(f'''<script>var ads = 1;</script>
+<div id="msg_div_msg">Pārdodu savu auto, labā stāvoklī. Regulāri apkopts.<br>
+• Kondicionieris<br>• Parkošanās sensori<br>
+<table class="options_list"><tr><td class="ads_opt_name">Marka</td><td class="ads_opt" id="tdo_31"><b>{brand_model}</b></td></tr>
+<tr><td class="ads_opt_name">Izlaiduma gads:</td><td class="ads_opt" id="tdo_18">{listing["year"]} marts</td></tr>
+<tr><td class="ads_opt_name">Motors:</td><td class="ads_opt" id="tdo_15">{listing["engine"]} {listing["engine_type"]}</td></tr>
+<tr><td class="ads_opt_name">Ātr.kārba:</td><td class="ads_opt" id="tdo_35">{listing["transmission"]}</td></tr>
+<tr><td class="ads_opt_name">Nobraukums, km:</td><td class="ads_opt" id="tdo_16">{listing["mileage"]} 000</td></tr>
+<tr><td class="ads_opt_name">Krāsa:</td><td class="ads_opt" id="tdo_17">{listing["color"]}</td></tr>
+<tr><td class="ads_opt_name">Virsbūves tips:</td><td class="ads_opt" id="tdo_32">{listing["body"]}</td></tr>
+<tr><td class="ads_opt_name">Tehniskā apskate:</td><td class="ads_opt" id="tdo_223">05.2026</td></tr></table>
+<table><tr><td class="ads_opt_name_big">Cena:</td><td class="ads_price"><span class="ads_price" id="tdo_8">{price} €</span></td></tr></table>
+</div>
+<img id="msg_img_img" src="https://i.ss.lv/gallery/photo.jpg">
+<table class="contacts_table"><tr><td class="ads_contacts_name">Vieta:</td><td class="ads_contacts">{listing["region"]}</td></tr></table>
+<table><tr><td class="msg_footer" align="right">Datums: 12.03.2025 10:00</td></tr></table>''')
+
+
+class FixtureServer:
+    """Local stand-in for SS.LV serving a FixtureSite.
+
+    Runs in a background thread with its own event loop, since the scraper
+    makes some blocking requests from its event loop. Latency, random 5xx
+    errors and 429 throttling can be dialled in to see how the scraper
+    copes with a slow or unhappy site.
+    """
+
+    def __init__(self, site, latency=0.05, jitter=0.02, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, seed=1, host='127.0.0.1', port=0):
+        self.site = site
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.host = host
+        self.port = port
+
+        self.status_counts = {}
+        self.loop = None
+        self.thread = None
+        self.runner = None
+        self.started = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _handle(self, request):
+        delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+
+        roll = self.rng.random()
+        if roll < self.throttle_rate:
+            response = web.Response(status=429, text='Too Many Requests',
+                                    headers={'Retry-After': str(self.retry_after)})
+        elif roll < self.throttle_rate + self.error_rate:
+            response = web.Response(status=500, text='Internal Server Error')
+        elif request.path in self.site.pages:
+            response = web.Response(body=self.site.pages[request.path], content_type='text/html', charset='utf-8')
+        else:
+            response = web.Response(status=404, text='Not Found')
+
+        self.status_counts[response.status] = self.status_counts.get(response.status, 0) + 1
+        return response
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_route('GET', '/{path:.*}', self._handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        # Pick up the real port if we asked for any free one
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _serve(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._start())
+        self.started.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+    def start(self):
+        """Start serving in the background, returns the base URL"""
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        logger.info(f"Fixture server on {self.base_url} with {len(self.site.pages)} pages")
+        return self.base_url
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Serve SS.LV fixture pages locally")
+    parser.add_argument('--archive', metavar='DIR', help='Serve recorded pages from a page archive')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with a 429')
+    args = parser.parse_args()
+
+    site = FixtureSite.from_archive(args.archive) if args.archive else FixtureSite.synthetic()
+    with FixtureServer(site, latency=args.latency, error_rate=args.error_rate,
+                       throttle_rate=args.throttle_rate, port=args.port) as server:
+        print(f"Serving {len(site.pages)} pages on {server.base_url}{CARS_PATH} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,254 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, insert
+from models import CrawlRun, FrontierPage, SeenListing, ModelCrawlStat
+
+logger = logging.getLogger('ss_scraper.frontier')
+
+
+class RunInProgressError(Exception):
+    """Raised when another process is still crawling the same source"""
+
+    def __init__(self, run):
+        super().__init__(f"Crawl run {run.run_id} for this source is still running "
+                         f"(last heartbeat {run.updated_at:%Y-%m-%d %H:%M:%S})")
+        self.run = run
+
+
+class CrawlFrontier:
+    """Keeps track of where a crawl run is, in the database.
+
+    Every list page we visit is checkpointed together with the detail pages
+    it turned up, and detail pages are marked done in the same transaction
+    that writes their listing. If a run dies, --resume picks the last
+    unfinished run back up: models whose list pages were all visited are
+    not paged again, half-done models carry on from the next page, and
+    detail pages still pending get fetched.
+
+    A running run's updated_at is its heartbeat, bumped with every
+    checkpoint and written chunk. Only one run per source can be live at a
+    time; a 'running' run that hasn't beaten for stale_after is taken to
+    be dead (the process was killed) and counts as unfinished.
+    """
+
+    def __init__(self, session, source_id, stale_after=timedelta(minutes=30)):
+        self.session = session
+        self.source_id = source_id
+        self.stale_after = stale_after
+        self.run = None
+        # Kept apart from self.run so the writer thread can use it without
+        # touching this session's objects
+        self.run_id = None
+
+    def start_run(self, pages_per_model, resume=False):
+        """Start a new crawl run, or pick up the last unfinished one.
+
+        Raises RunInProgressError if another process is crawling this source.
+        """
+        cutoff = datetime.now() - self.stale_after
+        unfinished = self.session.query(CrawlRun).filter(
+            CrawlRun.source_id == self.source_id,
+            CrawlRun.status.in_(['running', 'failed'])
+        ).order_by(CrawlRun.run_id.desc()).all()
+
+        live = [run for run in unfinished if run.status == 'running' and run.updated_at and run.updated_at >= cutoff]
+        if live:
+            # Its frontier and seen listings are in use, leave them alone
+            self.session.rollback()
+            raise RunInProgressError(live[0])
+
+        if resume and unfinished:
+            self.run = unfinished[0]
+            unfinished = unfinished[1:]
+            self.run.status = 'running'
+            pending = self.session.query(FrontierPage).filter(
+                FrontierPage.run_id == self.run.run_id,
+                FrontierPage.kind == 'detail',
+                FrontierPage.status == 'pending'
+            ).count()
+            logger.info(f"Resuming crawl run {self.run.run_id} ({pending} detail pages pending)")
+        else:
+            if resume:
+                logger.info("Nothing to resume, starting a new crawl run")
+            self.run = CrawlRun(source_id=self.source_id, status='running',
+                                pages_per_model=pages_per_model, started_at=datetime.now())
+            self.session.add(self.run)
+
+        # Older unfinished runs won't be picked up any more
+        for run in unfinished:
+            run.status = 'abandoned'
+            self._clear_pages(run.run_id)
+
+        self.session.commit()
+        self.run_id = self.run.run_id
+        return self.run
+
+    @property
+    def pages_per_model(self):
+        return self.run.pages_per_model
+
+    def model_progress(self, brand_name, model_name):
+        """Where discovery got to for a model in this run.
+
+        Returns (done, next_url, next_page_num). next_url is None if we
+        haven't finished any of its list pages yet.
+        """
+        last_page = self.session.query(FrontierPage).filter(
+            FrontierPage.run_id == self.run.run_id,
+            FrontierPage.kind == 'list',
+            FrontierPage.status == 'done',
+            FrontierPage.brand == brand_name,
+            FrontierPage.model == model_name
+        ).order_by(FrontierPage.page_num.desc()).first()
+
+        if last_page is None:
+            return False, None, 0
+
+        next_url = json.loads(last_page.data or '{}').get('next_url')
+        done = next_url is None or last_page.page_num + 1 >= self.run.pages_per_model
+        return done, next_url, last_page.page_num + 1
+
+    def pending_details(self, brand_name, model_name):
+        """Basic listing dicts for a model's detail pages we haven't finished"""
+        rows = self.session.query(FrontierPage.data).filter(
+            FrontierPage.run_id == self.run.run_id,
+            FrontierPage.kind == 'detail',
+            FrontierPage.status == 'pending',
+            FrontierPage.brand == brand_name,
+            FrontierPage.model == model_name
+        ).all()
+        return [json.loads(data) for data, in rows]
+
+    def checkpoint_list_page(self, brand_name, model_name, page_url, page_num, next_url, listings, seen_ids=(),
+                             done=True):
+        """Record a visited list page and the detail pages it gave us, in one transaction.
+
+        seen_ids are the external ids of every listing on the page, including
+        ones we won't fetch, so the inactive sweep knows what's still up.
+        done=False (the listing cap cut the page short) leaves the page
+        pending - a resumed run visits it again, and the model doesn't
+        count as crawled to the end.
+        """
+        try:
+            now = datetime.now()
+            urls = [listing['url'] for listing in listings] + [page_url]
+
+            # A listing can show up on two pages if it moved while we were paging
+            known = {url for url, in self.session.query(FrontierPage.url).filter(
+                FrontierPage.run_id == self.run.run_id,
+                FrontierPage.url.in_(urls)
+            ).all()}
+
+            rows = []
+            if page_url not in known:
+                rows.append(FrontierPage(
+                    run_id=self.run.run_id, kind='list', url=page_url, status='done' if done else 'pending',
+                    brand=brand_name, model=model_name, page_num=page_num,
+                    data=json.dumps({'next_url': next_url}), created_at=now, updated_at=now
+                ))
+            elif done:
+                # A page the cap cut short last time, finished now
+                self.session.execute(
+                    update(FrontierPage)
+                    .where(FrontierPage.run_id == self.run.run_id, FrontierPage.url == page_url,
+                           FrontierPage.kind == 'list')
+                    .values(status='done', data=json.dumps({'next_url': next_url}), updated_at=now)
+                )
+            for listing in listings:
+                if listing['url'] in known:
+                    continue
+                known.add(listing['url'])
+                rows.append(FrontierPage(
+                    run_id=self.run.run_id, kind='detail', url=listing['url'], status='pending',
+                    brand=brand_name, model=model_name,
+                    data=json.dumps(listing, ensure_ascii=False), created_at=now, updated_at=now
+                ))
+
+            self.session.add_all(rows)
+            self.run.updated_at = now
+            if seen_ids:
+                self.session.execute(insert(SeenListing), [
+                    {'run_id': self.run.run_id, 'brand': brand_name, 'model': model_name, 'external_id': external_id}
+                    for external_id in seen_ids
+                ])
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Error checkpointing {page_url}: {str(e)}")
+
+    def completed_models(self):
+        """(brand, model) names whose list pages we went through to the end.
+
+        Only these can be swept for listings that are gone - if we stopped
+        at the page limit or a page failed, unseen listings may just be on
+        a page we didn't get to.
+        """
+        last_pages = {}
+        for brand_name, model_name, page_num, data in self.session.query(
+            FrontierPage.brand, FrontierPage.model, FrontierPage.page_num, FrontierPage.data
+        ).filter(
+            FrontierPage.run_id == self.run.run_id,
+            FrontierPage.kind == 'list',
+            FrontierPage.status == 'done'
+        ).all():
+            key = (brand_name, model_name)
+            if key not in last_pages or page_num > last_pages[key][0]:
+                last_pages[key] = (page_num, data)
+
+        return [key for key, (page_num, data) in last_pages.items()
+                if json.loads(data or '{}').get('next_url') is None]
+
+    def record_model_stats(self, brand_name, model_name, known, seen, changed):
+        """Remember how many of a model's listings were new or re-priced.
+
+        These outlive the run - the scheduler uses them to tell busy
+        models from quiet ones.
+        """
+        try:
+            self.session.add(ModelCrawlStat(
+                run_id=self.run.run_id, brand=brand_name, model=model_name,
+                listings_known=known, listings_seen=seen, listings_changed=changed, created_at=datetime.now()
+            ))
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Error saving crawl stats for {brand_name} {model_name}: {str(e)}")
+
+    def mark_details_done(self, urls, commit=True, session=None):
+        """Mark detail pages as finished.
+
+        The writer calls this on its own session with commit=False just
+        before it commits a chunk, so the listings and their frontier entries
+        go in together.
+        """
+        if not urls or self.run is None:
+            return
+        session = session or self.session
+        now = datetime.now()
+        session.execute(
+            update(FrontierPage)
+            .where(FrontierPage.run_id == self.run_id, FrontierPage.url.in_(urls))
+            .values(status='done', updated_at=now)
+        )
+        session.execute(update(CrawlRun).where(CrawlRun.run_id == self.run_id).values(updated_at=now))
+        if commit:
+            session.commit()
+
+    def finish_run(self, success=True):
+        """Close the run - finished runs don't need their frontier any more"""
+        if self.run is None:
+            return
+        try:
+            self.run.status = 'finished' if success else 'failed'
+            self.run.finished_at = datetime.now()
+            if success:
+                self._clear_pages(self.run.run_id)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Error closing crawl run {self.run.run_id}: {str(e)}")
+
+    def _clear_pages(self, run_id):
+        self.session.query(FrontierPage).filter(FrontierPage.run_id == run_id).delete(synchronize_session=False)
+        self.session.query(SeenListing).filter(SeenListing.run_id == run_id).delete(synchronize_session=False)
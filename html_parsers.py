@@ -0,0 +1,991 @@
+import copy
+import logging
+import re
+import sys
+from datetime import datetime
+from bs4 import BeautifulSoup, UnicodeDammit
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml is optional, we fall back to BeautifulSoup
+    lxml = None
+    etree = None
+
+logger = logging.getLogger('ss_scraper.parser')
+
+# Words that mean the ad is an exchange or a "buying" ad, not a sale
+EXCHANGE_WORDS = ['maiņai', 'maina', 'pērku']
+
+# td.ads_opt ids on the detail page we care about
+DETAIL_FIELD_IDS = ['tdo_15', 'tdo_34', 'tdo_35', 'tdo_18', 'tdo_32', 'tdo_17', 'tdo_223']
+
+
+# --- Shared interpretation -------------------------------------------------
+#
+# Backends only pull raw text out of the page. Everything below turns that
+# text into listing fields, so both backends give identical results as long
+# as they extract the same strings.
+
+def parse_mileage(mileage_text):
+    """'120 tūkst.' -> 120000, '85 000' -> 85000"""
+    if "tūkst." in mileage_text:
+        mileage_digits = ''.join(filter(str.isdigit, mileage_text.split("tūkst.")[0]))
+        if mileage_digits:
+            return int(mileage_digits) * 1000
+    elif mileage_text.replace(' ', '').isdigit():
+        return int(mileage_text.replace(' ', ''))
+    return None
+
+
+def is_exchange_text(text):
+    return any(word in text for word in EXCHANGE_WORDS)
+
+
+def category_links_from_raw(raw_links):
+    """(text, href, count_text) tuples -> dicts with name, href and count"""
+    links = []
+    for text, href, count_text in raw_links:
+        links.append({
+            'name': text.strip(),
+            'href': href or '',
+            'count': int(count_text.strip("()")) if count_text is not None else 0
+        })
+    return links
+
+
+def listing_from_row(row, index, brand_name, model_name, base_url):
+    """Turn the raw cells of one list page row into a basic listing dict"""
+    year, engine_volume, mileage, price, engine_type = None, None, None, None, None
+    listing_id = row['row_id'].replace('tr_', '')
+    if not listing_id or "bnr" in listing_id.lower():
+        logger.debug(f"Row {index}: Skipping, no valid listing_id or is banner (ID: {listing_id}).")
+        return None
+
+    logger.debug(f"Row {index}: Processing row with ID: {listing_id}")
+
+    listing_url, title_text = None, None
+    if row['href'] is not None:
+        listing_url = base_url + row['href']
+        title_text = row['title'].strip()
+
+    if not title_text or not listing_url:
+        logger.debug(f"Row {index}, ID {listing_id}: Skipping, no title_link or href.")
+        return None
+
+    data_cells = row['cells']
+    logger.debug(f"Row {index}, ID {listing_id}: Found {len(data_cells)} data cells")
+
+    # Check if this is Tesla based on the number of data cells
+    is_tesla = len(data_cells) == 3
+
+    if is_tesla:
+        # Tesla layout: Year | Mileage | Price (3 cells)
+        year_text = data_cells[0]
+        if year_text.isdigit() and len(year_text) == 4:
+            year = int(year_text)
+
+        mileage = parse_mileage(data_cells[1].lower())
+
+        price_text = data_cells[2].lower()
+        if "€" in price_text:
+            # Check if it's an exchange listing
+            if is_exchange_text(price_text):
+                logger.info(f"Row {index}, ID {listing_id}: Skipping exchange/buying listing.")
+                return None
+            # Remove spaces, commas, and non-digit characters
+            price_digits = ''.join(filter(str.isdigit, price_text.replace(' ', '').replace(',', '')))
+            if price_digits:
+                price = int(price_digits)
+
+        # For Tesla, set engine type to Electric
+        engine_type = "Elektrisks"
+
+        logger.debug(f"Row {index}, ID {listing_id}: Tesla layout (3 cells) - Year:{year}, Mileage:{mileage}, Price:{price}")
+    else:
+        # Standard layout: Year | Engine | Mileage | Price (4 cells)
+        if len(data_cells) < 4:
+            logger.warning(f"Row {index}, ID {listing_id}: Standard format but only {len(data_cells)} cells")
+            return None
+
+        # Find the year cell (it's always a 4-digit number)
+        year_cell_index = None
+        for idx, cell_text in enumerate(data_cells):
+            if cell_text.isdigit() and len(cell_text) == 4:
+                year_val = int(cell_text)
+                # Accept years from 1900 to current year + 1 (for future models)
+                if 1900 <= year_val <= datetime.now().year + 1:
+                    year_cell_index = idx
+                    year = year_val
+                    break
+
+        if year_cell_index is None:
+            logger.debug(f"Row {index}, ID {listing_id}: No year found in data cells")
+            return None
+
+        # Engine is at year_index + 1
+        if year_cell_index + 1 < len(data_cells):
+            volume_match = re.search(r'(\d+\.?\d*)', data_cells[year_cell_index + 1])
+            if volume_match:
+                try:
+                    engine_volume = float(volume_match.group(1))
+                except ValueError:
+                    pass
+
+        # Mileage is at year_index + 2
+        if year_cell_index + 2 < len(data_cells):
+            mileage = parse_mileage(data_cells[year_cell_index + 2].lower())
+
+        # Price is at year_index + 3
+        if year_cell_index + 3 < len(data_cells):
+            price_text = data_cells[year_cell_index + 3].lower()
+            if "€" in price_text:
+                if is_exchange_text(price_text):
+                    logger.info(f"Row {index}, ID {listing_id}: Skipping exchange/buying listing.")
+                    return None
+                price_digits = ''.join(filter(str.isdigit, price_text.replace(' ', '').replace(',', '')))
+                if price_digits:
+                    price = int(price_digits)
+
+        logger.debug(f"Row {index}, ID {listing_id}: Standard layout (4 cells) - Year:{year}, Engine:{engine_volume}, Mileage:{mileage}, Price:{price}")
+
+    # Only add if we have essential data
+    if not price:
+        logger.warning(f"Row {index}, ID {listing_id}: Missing essential data - price:{price}, title:{bool(title_text)}, url:{bool(listing_url)}")
+        return None
+
+    logger.debug(f"Row {index}, ID {listing_id}: Success - P:{price} Y:{year} E:{engine_volume}L M:{mileage}")
+    return {
+        'external_id': listing_id,
+        'title': title_text,
+        'url': listing_url,
+        'price': price,
+        'year': year,
+        'engine_volume': engine_volume,
+        'mileage': mileage,
+        'brand': brand_name,
+        'model': model_name,
+        # These will be filled in from the detail page:
+        'engine_type': engine_type,
+        'transmission': None,
+        'region': None,
+        'body_type': None,
+        'color': None
+    }
+
+
+def _engine_type_from_text(text_lower, gas_label):
+    if 'benzīn' in text_lower:
+        return 'Benzīns'
+    elif 'dīzel' in text_lower:
+        return 'Dīzelis'
+    elif 'hibrīd' in text_lower:
+        return 'Hibrīds'
+    elif 'elektr' in text_lower:
+        return 'Elektriskais'
+    elif 'gāz' in text_lower:
+        return gas_label
+    return None
+
+
+def details_from_fields(fields, listing_basic):
+    """Build the detailed listing dict from the raw fields of a detail page"""
+    external_id = listing_basic['external_id']
+    details = dict(listing_basic)  # Start with the basic info we already have
+
+    # Check if this is an exchange listing
+    page_text = fields['page_text'].lower()
+    if is_exchange_text(page_text):
+        logger.info(f"Skipping exchange/buying listing from details page: {external_id}")
+        details['skip_listing'] = True
+        return details
+
+    # Get listing date
+    for cell_text, next_text in fields['label_cells']:
+        if 'Datums' in cell_text or 'Date' in cell_text:
+            if next_text is not None:
+                date_text = next_text.strip()
+                try:
+                    # Handle different date formats
+                    if '.' in date_text:  # DD.MM.YYYY
+                        parts = date_text.split('.')
+                        if len(parts) == 3:
+                            day, month, year = map(int, parts)
+                            details['listing_date'] = f"{year:04d}-{month:02d}-{day:02d}"
+                    elif '-' in date_text:  # YYYY-MM-DD
+                        details['listing_date'] = date_text
+                    else:
+                        details['listing_date'] = datetime.now().strftime('%Y-%m-%d')
+                except Exception:
+                    details['listing_date'] = datetime.now().strftime('%Y-%m-%d')
+
+    # Default listing date if not found
+    if 'listing_date' not in details:
+        details['listing_date'] = datetime.now().strftime('%Y-%m-%d')
+
+    # Get region/location - first check in various text labels
+    for cell_text, next_text in fields['label_cells']:
+        if any(loc_text in cell_text.lower() for loc_text in ['region', 'reģions', 'pilsēta', 'vieta']):
+            if next_text is not None:
+                details['region'] = next_text.strip()
+
+    # Also check contacts table for location
+    for row_text, location_text in fields['contact_rows']:
+        if 'Vieta:' in row_text and location_text is not None:
+            details['region'] = location_text.strip()
+
+    # Default region if not found
+    if 'region' not in details or not details['region']:
+        details['region'] = 'Nav norādīts'
+
+    options = fields['options']
+
+    # Look for specific IDs for engine and transmission
+    if 'tdo_15' in options:
+        engine_text = options['tdo_15'].strip()
+        details['engine'] = engine_text
+
+        # Extract engine volume (e.g., 0.7)
+        volume_match = re.search(r'(\d+[\.,]\d+|\d+)', engine_text)
+        if volume_match:
+            try:
+                details['engine_volume'] = float(volume_match.group(1).replace(',', '.'))
+            except ValueError:
+                pass
+
+        engine_type = _engine_type_from_text(engine_text.lower(), 'Gāze')
+        if engine_type:
+            details['engine_type'] = engine_type
+        logger.debug(f"Found engine info via tdo_15 for {external_id}: {engine_text}")
+
+    # Look for "Dzinēja tips" for Smart cars
+    if 'engine_type' not in details and 'tdo_34' in options:
+        engine_type_text = options['tdo_34'].strip()
+        details['engine'] = engine_type_text  # Use this as the full engine description too
+
+        engine_type = _engine_type_from_text(engine_type_text.lower(), 'Gas')
+        if engine_type:
+            details['engine_type'] = engine_type
+            if engine_type == 'Elektriskais' and 'engine_volume' not in details:
+                details['engine_volume'] = None
+        logger.debug(f"Found engine info via tdo_34 for {external_id}: {engine_type_text}")
+
+    # Check transmission - using ID tdo_35
+    if 'tdo_35' in options:
+        trans_text = options['tdo_35'].strip()
+        trans_text_lower = trans_text.lower()
+        if 'automāt' in trans_text_lower:
+            details['transmission'] = 'Automatic'
+        elif 'manuāl' in trans_text_lower:
+            details['transmission'] = 'Manual'
+        elif 'pusautomāt' in trans_text_lower:
+            details['transmission'] = 'Semi-Automatic'
+        else:
+            details['transmission'] = trans_text  # keep original if no match
+
+    # Get specs from the options table (keep this as a fallback)
+    for label_text, value_text in fields['option_rows']:
+        label = label_text.strip().lower()
+        value = value_text.strip()
+
+        # Only set these if they weren't already found by ID
+        if 'engine' not in details and any(eng_text in label for eng_text in ['dzinējs', 'engine', 'двигатель']):
+            details['engine'] = value
+
+            volume_match = re.search(r'(\d+[\.,]\d+)', value)
+            if volume_match:
+                details['engine_volume'] = float(volume_match.group(1).replace(',', '.'))
+
+            lower_value = value.lower()
+            if any(fuel in lower_value for fuel in ['benzīn', 'petrol', 'gasoline']):
+                details['engine_type'] = 'Petrol'
+            elif any(fuel in lower_value for fuel in ['dīzel', 'diesel']):
+                details['engine_type'] = 'Diesel'
+            elif any(fuel in lower_value for fuel in ['hibrīd', 'hybrid']):
+                details['engine_type'] = 'Hybrid'
+            elif any(fuel in lower_value for fuel in ['elektr', 'electric']):
+                details['engine_type'] = 'Electric'
+            elif any(fuel in lower_value for fuel in ['gas', 'gāze']):
+                details['engine_type'] = 'Gas'
+
+        if 'transmission' not in details and any(trans_text in label for trans_text in ['ātrumkārba', 'transmission', 'коробка']):
+            lower_value = value.lower()
+            if any(t in lower_value for t in ['manuāl', 'manual', 'механика']):
+                details['transmission'] = 'Manual'
+            elif any(t in lower_value for t in ['automāt', 'automatic', 'автомат']):
+                details['transmission'] = 'Automatic'
+            elif any(t in lower_value for t in ['pusautomāt', 'semi-automatic', 'полуавтомат']):
+                details['transmission'] = 'Semi-Automatic'
+            else:
+                details['transmission'] = value
+
+        if 'body_type' not in details and any(body_text in label for body_text in ['virsbūve', 'body', 'кузов']):
+            details['body_type'] = value
+
+        if 'color' not in details and any(color_text in label for color_text in ['krāsa', 'color', 'цвет']):
+            details['color'] = value
+
+    # For Tesla models, default to Automatic if not specified
+    if 'tesla' in (details.get('brand', '') or '').lower() and not details.get('transmission'):
+        details['transmission'] = 'Automatic'
+
+    if 'smart' in listing_basic.get('brand', '').lower() and not details.get('engine_type'):
+        # Check if it's a newer model (2018+)
+        if details.get('year') and details.get('year') >= 2018:
+            logger.info(f"Setting engine type to Electric for newer Smart: {external_id}")
+            details['engine_type'] = 'Elektrisks'
+
+    # Also check by specific IDs
+    for field_name, field_id in [
+        ("year", "tdo_18"),
+        ("body_type", "tdo_32"),
+        ("color", "tdo_17"),
+        ("tech_inspection", "tdo_223"),
+    ]:
+        if field_id in options:
+            field_text = options[field_id].strip()
+            if field_name == "year":
+                # Extract only the numeric year part from strings like "2019 decembris"
+                try:
+                    details[field_name] = int(field_text.split()[0])
+                except (ValueError, IndexError):
+                    details[field_name] = field_text
+            else:
+                details[field_name] = field_text
+
+    # Price from specific ID
+    if fields['price_text'] is not None and not details.get('price'):
+        price_text = fields['price_text'].strip().lower()
+        if is_exchange_text(price_text):
+            logger.info(f"Skipping exchange/buying listing from price: {external_id}")
+            details['skip_listing'] = True
+            return details
+
+        price_digits = ''.join(filter(str.isdigit, price_text))
+        if price_digits:
+            details['price'] = int(price_digits)
+
+    if 'price' not in details or details['price'] is None:
+        logger.info(f"Skipping listing without price: {external_id}")
+        details['skip_listing'] = True
+        return details
+
+    if 'year' not in details or details['year'] is None:
+        logger.info(f"Skipping listing without year: {external_id}")
+        details['skip_listing'] = True
+        return details
+
+    logger.debug(f"Got details for listing {external_id}")
+    return details
+
+
+def full_details_from_fields(fields):
+    """Build the /api/listing-details response from the raw fields of a detail page"""
+    details = {}
+
+    if fields['description'] is not None:
+        lines = [line.strip() for line in fields['description'].split('\n') if line.strip()]
+        details['description'] = '\n'.join(lines)
+    else:
+        details['description'] = None
+
+    # Get publication date
+    footer_text = fields['footer_text']
+    if footer_text is not None and 'Datums:' in footer_text:
+        details['publication_date'] = footer_text.strip().split('Datums:')[1].strip()
+    else:
+        details['publication_date'] = None
+
+    details['image_url'] = fields['image_url']
+
+    # Map the parameters table labels to fields
+    for label_text, value_text, bold_text in fields['params']:
+        value_text = ' '.join(value_text.split())
+        if 'marka' in label_text:
+            details['brand_model_detail'] = bold_text if bold_text is not None else value_text
+        elif 'izlaiduma gads' in label_text:
+            details['year_detail'] = value_text
+        elif 'dzinēja tips' in label_text or 'motors' in label_text:
+            details['engine_detail'] = value_text
+        elif 'ātr.kārba' in label_text or 'ātrumkārba' in label_text:
+            details['transmission_detail'] = value_text
+        elif 'nobraukums' in label_text:
+            details['mileage_detail'] = ''.join(filter(str.isdigit, value_text))
+        elif 'krāsa' in label_text:
+            details['color_detail'] = value_text.split('\n')[0].strip()
+        elif 'virsbūves tips' in label_text:
+            details['body_type_detail'] = value_text
+        elif 'tehniskā apskate' in label_text:
+            details['tech_inspection'] = value_text
+
+    if fields['price_text'] is not None:
+        price_text = fields['price_text']
+        price_clean = price_text.replace('€', '').replace(' ', '').replace(',', '')
+        try:
+            details['price_detail'] = int(price_clean)
+        except ValueError:
+            details['price_detail'] = price_text
+
+    # Equipment from checkboxes and bullet lines in the description
+    equipment_list = [label.strip() for label in fields['checkbox_labels']]
+    if details.get('description'):
+        for line in details['description'].split('\n'):
+            line = line.strip()
+            if line.startswith('•') or line.startswith('-'):
+                equipment_list.append(line[1:].strip())
+    details['equipment'] = equipment_list
+
+    for label_text, value_text in fields['contacts']:
+        if label_text == 'Vieta:':
+            details['region'] = value_text
+            break
+
+    return details
+
+
+class DetailFieldCollector:
+    """Picks the detail page fields out of its td/span/table elements in one walk.
+
+    Backends feed it every td, span and table in document order, so the
+    page is walked once instead of once per selector. A label cell's value
+    is the first td after it, so labels wait until the next td turns up.
+    The options and contacts tables are only remembered here, their rows
+    get read from that table's own subtree afterwards.
+    """
+
+    def __init__(self):
+        self.label_cells = []
+        self.waiting = []  # indexes of label cells still looking for their value
+        self.options = {}
+        self.price_text = None
+        self.options_table = None
+        self.contacts_table = None
+
+    def visit(self, elem, tag, classes, elem_id, text):
+        """One element - text() gives its text, only called when we need it"""
+        if tag == 'td':
+            if self.waiting:
+                value = text()
+                for index in self.waiting:
+                    self.label_cells[index] = (self.label_cells[index][0], value)
+                self.waiting = []
+            if 'msg2' in classes or 'msga2' in classes:
+                self.waiting.append(len(self.label_cells))
+                self.label_cells.append((text(), None))
+            if 'ads_opt' in classes and elem_id in DETAIL_FIELD_IDS and elem_id not in self.options:
+                self.options[elem_id] = text()
+        elif tag == 'span':
+            if self.price_text is None and elem_id == 'tdo_8' and 'ads_price' in classes:
+                self.price_text = text()
+        elif tag == 'table':
+            if self.options_table is None and 'options_list' in classes:
+                self.options_table = elem
+            if self.contacts_table is None and 'contacts_table' in classes:
+                self.contacts_table = elem
+
+    def result(self, page_text, contact_rows, option_rows):
+        return {
+            'page_text': page_text,
+            'label_cells': self.label_cells,
+            'contact_rows': contact_rows,
+            'options': self.options,
+            'option_rows': option_rows,
+            'price_text': self.price_text
+        }
+
+
+class BaseParser:
+    """Turns SS.LV pages into listing dicts.
+
+    Subclasses only extract raw strings from the document; the shared
+    functions above do the interpretation.
+    """
+    name = None
+
+    def parse_category_links(self, html, headers_only=False):
+        """Brand/model links from a category page"""
+        return category_links_from_raw(self._category_links(html, headers_only))
+
+    def parse_list_page(self, html, brand_name, model_name, base_url):
+        """Listings on one list page plus the URL of the next page (or None)"""
+        rows, next_href = self._list_page(html)
+        logger.info(f"Found {len(rows)} potential listing rows on this page")
+
+        listings = []
+        for i, row in enumerate(rows):
+            try:
+                listing = listing_from_row(row, i, brand_name, model_name, base_url)
+                if listing:
+                    listings.append(listing)
+            except Exception as e:
+                logger.error(f"Row {i}, ID {row.get('row_id')}: Exception: {str(e)}", exc_info=True)
+
+        next_url = base_url + next_href if next_href else None
+        return listings, next_url
+
+    def parse_listing_details(self, html, listing_basic):
+        """Fill in a basic listing dict from its detail page"""
+        return details_from_fields(self._detail_fields(html), listing_basic)
+
+    def parse_full_details(self, html):
+        """Everything we show in the listing details popup"""
+        return full_details_from_fields(self._full_detail_fields(html))
+
+
+class SoupParser(BaseParser):
+    """The original BeautifulSoup + html.parser backend"""
+    name = 'bs4'
+
+    def _soup(self, html):
+        return BeautifulSoup(html, 'html.parser')
+
+    def _category_links(self, html, headers_only):
+        soup = self._soup(html)
+        selector = "h4.category > a.a_category" if headers_only else "h4.category > a.a_category, a.a_category"
+        links = []
+        for link in soup.select(selector):
+            count_span = link.find_next("span", class_="category_cnt")
+            links.append((link.text, link.get('href'), count_span.text if count_span else None))
+        return links
+
+    def _list_page(self, html):
+        soup = self._soup(html)
+        rows = []
+        for row in soup.select("tr[id^='tr_']"):
+            href, title = None, None
+            title_cell = row.select_one("td.msg2")
+            if title_cell:
+                title_link = title_cell.select_one("a.am")
+                if title_link and title_link.has_attr('href'):
+                    href, title = title_link['href'], title_link.text
+            rows.append({
+                'row_id': row.get('id', ''),
+                'href': href,
+                'title': title,
+                'cells': [cell.get_text(strip=True) for cell in row.select("td.msga2-o.pp6, td.msga2-r.pp6")]
+            })
+
+        next_href = None
+        for link in soup.select("a.navi"):
+            if link.text.strip().lower() in ["nākamā", "next", ">>", "следующая"]:
+                next_href = link.get('href')
+                break
+        return rows, next_href
+
+    def _detail_fields(self, html):
+        soup = self._soup(html)
+        fields = DetailFieldCollector()
+        for tag in soup.find_all(['td', 'span', 'table']):
+            fields.visit(tag, tag.name, tag.get('class') or (), tag.get('id'), lambda: tag.text)
+
+        contact_rows = []
+        if fields.contacts_table is not None:
+            for row in fields.contacts_table.select('tr'):
+                location_cell = row.select_one('td.ads_contacts')
+                contact_rows.append((row.text, location_cell.text if location_cell else None))
+
+        option_rows = []
+        if fields.options_table is not None:
+            for row in fields.options_table.select('tr'):
+                cells = row.select('td')
+                if len(cells) >= 2:
+                    option_rows.append((cells[0].text, cells[1].text))
+
+        return fields.result(soup.text, contact_rows, option_rows)
+
+    def _full_detail_fields(self, html):
+        soup = self._soup(html)
+        fields = {'description': None, 'checkbox_labels': []}
+
+        description_div = soup.select_one('div#msg_div_msg')
+        if description_div:
+            description_copy = description_div.__copy__()
+
+            # Remove the options/price tables
+            options_table = description_copy.select_one('table.options_list')
+            if options_table:
+                options_table.extract()
+
+            for table in description_copy.find_all('table'):
+                price_indicators = [
+                    table.find('td', class_='ads_opt_name_big'),
+                    table.find('td', class_='ads_price'),
+                    table.find('span', class_='ads_price'),
+                    table.find('a', class_='a9a'),
+                    table.find('img', src=lambda x: x and 'octa_logo.png' in x)
+                ]
+                if any(price_indicators):
+                    table.extract()
+                    continue
+                table_text = table.get_text()
+                if 'Cena:' in table_text or '€' in table_text or 'apdrošināšanu' in table_text:
+                    table.extract()
+
+            fields['description'] = description_copy.get_text(separator='\n', strip=True)
+
+            for checkbox in description_div.select('input[type="checkbox"]'):
+                label = checkbox.find_next_sibling(string=True)
+                if label:
+                    fields['checkbox_labels'].append(str(label))
+
+        date_cell = soup.select_one('td.msg_footer[align="right"]')
+        fields['footer_text'] = date_cell.get_text() if date_cell else None
+
+        fields['image_url'] = None
+        image_elem = soup.select_one('img#msg_img_img')
+        if image_elem and image_elem.has_attr('src'):
+            fields['image_url'] = image_elem['src']
+        else:
+            image_elem_fallback = soup.select_one('div#big_pic_div img')
+            if image_elem_fallback and image_elem_fallback.has_attr('src'):
+                fields['image_url'] = image_elem_fallback['src']
+
+        fields['params'] = []
+        params_table = soup.select_one('div#msg_div_msg table.options_list')
+        if params_table:
+            for row in params_table.select('tr'):
+                label_cell = row.select_one('td.ads_opt_name')
+                value_cell = row.select_one('td.ads_opt')
+                if label_cell and value_cell:
+                    bold_elem = value_cell.select_one('b')
+                    fields['params'].append((
+                        label_cell.get_text(strip=True).lower(),
+                        value_cell.get_text(strip=True),
+                        bold_elem.get_text(strip=True) if bold_elem else None
+                    ))
+
+        price_elem = soup.select_one('span.ads_price#tdo_8')
+        fields['price_text'] = price_elem.get_text(strip=True) if price_elem else None
+
+        fields['contacts'] = []
+        contacts_table = soup.select_one('table.contacts_table')
+        if contacts_table:
+            for row in contacts_table.select('tr'):
+                label_cell = row.select_one('td.ads_contacts_name')
+                value_cell = row.select_one('td.ads_contacts')
+                if label_cell and value_cell:
+                    fields['contacts'].append((label_cell.get_text(strip=True), value_cell.get_text(strip=True)))
+
+        return fields
+
+
+def _has_class(name):
+    """XPath test equivalent to the CSS .name class selector"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+if etree is not None:
+    # Compiled once at import - these are the CSS selectors above as XPath
+    _XP = {
+        'text': etree.XPath(".//text()[not(ancestor::script) and not(ancestor::style)]"),
+        'category_headers': etree.XPath(f"//h4[{_has_class('category')}]/a[{_has_class('a_category')}]"),
+        'category_all': etree.XPath(f"//a[{_has_class('a_category')}]"),
+        'category_count': etree.XPath(f"(descendant::span | following::span)[{_has_class('category_cnt')}][1]"),
+        'rows': etree.XPath("//tr[starts-with(@id, 'tr_')]"),
+        'title_cell': etree.XPath(f"(.//td[{_has_class('msg2')}])[1]"),
+        'title_link': etree.XPath(f"(.//a[{_has_class('am')}])[1]"),
+        'data_cells': etree.XPath(f".//td[({_has_class('msga2-o')} or {_has_class('msga2-r')}) and {_has_class('pp6')}]"),
+        'navi': etree.XPath(f"//a[{_has_class('navi')}]"),
+        'contacts_table': etree.XPath(f"(//table[{_has_class('contacts_table')}])[1]"),
+        'rows_in': etree.XPath(".//tr"),
+        'tds_in': etree.XPath(".//td"),
+        'ads_contacts': etree.XPath(f"(.//td[{_has_class('ads_contacts')}])[1]"),
+        'ads_contacts_name': etree.XPath(f"(.//td[{_has_class('ads_contacts_name')}])[1]"),
+        'options_table': etree.XPath(f"(//table[{_has_class('options_list')}])[1]"),
+        'price': etree.XPath(f"(//span[{_has_class('ads_price')}][@id='tdo_8'])[1]"),
+        'description_div': etree.XPath("(//div[@id='msg_div_msg'])[1]"),
+        'tables_in': etree.XPath(".//table"),
+        'price_indicators': etree.XPath(
+            f".//td[{_has_class('ads_opt_name_big')}] | .//td[{_has_class('ads_price')}]"
+            f" | .//span[{_has_class('ads_price')}] | .//a[{_has_class('a9a')}]"
+            f" | .//img[contains(@src, 'octa_logo.png')]"
+        ),
+        'checkboxes': etree.XPath(".//input[@type='checkbox']"),
+        'footer': etree.XPath(f"(//td[{_has_class('msg_footer')}][@align='right'])[1]"),
+        'main_image': etree.XPath("(//img[@id='msg_img_img'])[1]"),
+        'fallback_image': etree.XPath("(//div[@id='big_pic_div']//img)[1]"),
+        'params_table': etree.XPath(f"(//div[@id='msg_div_msg']//table[{_has_class('options_list')}])[1]"),
+        'opt_name': etree.XPath(f"(.//td[{_has_class('ads_opt_name')}])[1]"),
+        'opt_value': etree.XPath(f"(.//td[{_has_class('ads_opt')}])[1]"),
+        'bold': etree.XPath("(.//b)[1]"),
+    }
+
+
+def _first(xpath, node, **variables):
+    found = xpath(node, **variables)
+    return found[0] if found else None
+
+
+class LxmlParser(BaseParser):
+    """Faster backend using lxml with precompiled XPath selectors"""
+    name = 'lxml'
+
+    def __init__(self):
+        if etree is None:
+            raise ImportError("lxml is not installed")
+
+    def _doc(self, html):
+        if isinstance(html, bytes):
+            # Let bs4 work out the encoding the same way the soup backend does
+            html = UnicodeDammit(html, is_html=True).unicode_markup
+        if not html or not html.strip():
+            html = '<html></html>'
+        return lxml.html.document_fromstring(html)
+
+    def _text(self, node):
+        # Same as BeautifulSoup's .text - all strings, minus scripts/styles/comments
+        return ''.join(_XP['text'](node))
+
+    def _stripped_text(self, node, separator=''):
+        # Same as BeautifulSoup's get_text(separator, strip=True)
+        return separator.join(s.strip() for s in _XP['text'](node) if s.strip())
+
+    def _category_links(self, html, headers_only):
+        doc = self._doc(html)
+        links = []
+        for link in _XP['category_headers' if headers_only else 'category_all'](doc):
+            count_span = _first(_XP['category_count'], link)
+            links.append((self._text(link), link.get('href'), self._text(count_span) if count_span is not None else None))
+        return links
+
+    def _list_page(self, html):
+        doc = self._doc(html)
+        rows = []
+        for row in _XP['rows'](doc):
+            href, title = None, None
+            title_cell = _first(_XP['title_cell'], row)
+            if title_cell is not None:
+                title_link = _first(_XP['title_link'], title_cell)
+                if title_link is not None and title_link.get('href') is not None:
+                    href, title = title_link.get('href'), self._text(title_link)
+            rows.append({
+                'row_id': row.get('id', ''),
+                'href': href,
+                'title': title,
+                'cells': [self._stripped_text(cell) for cell in _XP['data_cells'](row)]
+            })
+
+        next_href = None
+        for link in _XP['navi'](doc):
+            if self._text(link).strip().lower() in ["nākamā", "next", ">>", "следующая"]:
+                next_href = link.get('href')
+                break
+        return rows, next_href
+
+    def _detail_fields(self, html):
+        doc = self._doc(html)
+        fields = DetailFieldCollector()
+        for elem in doc.iter('td', 'span', 'table'):
+            fields.visit(elem, elem.tag, (elem.get('class') or '').split(), elem.get('id'),
+                         lambda: self._text(elem))
+
+        contact_rows = []
+        if fields.contacts_table is not None:
+            for row in _XP['rows_in'](fields.contacts_table):
+                location_cell = _first(_XP['ads_contacts'], row)
+                contact_rows.append((self._text(row), self._text(location_cell) if location_cell is not None else None))
+
+        option_rows = []
+        if fields.options_table is not None:
+            for row in _XP['rows_in'](fields.options_table):
+                cells = _XP['tds_in'](row)
+                if len(cells) >= 2:
+                    option_rows.append((self._text(cells[0]), self._text(cells[1])))
+
+        return fields.result(self._text(doc), contact_rows, option_rows)
+
+    def _full_detail_fields(self, html):
+        doc = self._doc(html)
+        fields = {'description': None, 'checkbox_labels': []}
+
+        description_div = _first(_XP['description_div'], doc)
+        if description_div is not None:
+            description_copy = copy.deepcopy(description_div)
+
+            # Remove the options/price tables (drop_tree keeps the text after them)
+            options_table = _first(_XP['options_table'], description_copy)
+            if options_table is not None:
+                options_table.drop_tree()
+
+            for table in _XP['tables_in'](description_copy):
+                if _XP['price_indicators'](table):
+                    table.drop_tree()
+                    continue
+                table_text = self._text(table)
+                if 'Cena:' in table_text or '€' in table_text or 'apdrošināšanu' in table_text:
+                    table.drop_tree()
+
+            fields['description'] = self._stripped_text(description_copy, separator='\n')
+
+            for checkbox in _XP['checkboxes'](description_div):
+                label = self._next_sibling_text(checkbox)
+                if label:
+                    fields['checkbox_labels'].append(label)
+
+        date_cell = _first(_XP['footer'], doc)
+        fields['footer_text'] = self._text(date_cell) if date_cell is not None else None
+
+        fields['image_url'] = None
+        image_elem = _first(_XP['main_image'], doc)
+        if image_elem is not None and image_elem.get('src') is not None:
+            fields['image_url'] = image_elem.get('src')
+        else:
+            image_elem_fallback = _first(_XP['fallback_image'], doc)
+            if image_elem_fallback is not None and image_elem_fallback.get('src') is not None:
+                fields['image_url'] = image_elem_fallback.get('src')
+
+        fields['params'] = []
+        params_table = _first(_XP['params_table'], doc)
+        if params_table is not None:
+            for row in _XP['rows_in'](params_table):
+                label_cell = _first(_XP['opt_name'], row)
+                value_cell = _first(_XP['opt_value'], row)
+                if label_cell is not None and value_cell is not None:
+                    bold_elem = _first(_XP['bold'], value_cell)
+                    fields['params'].append((
+                        self._stripped_text(label_cell).lower(),
+                        self._stripped_text(value_cell),
+                        self._stripped_text(bold_elem) if bold_elem is not None else None
+                    ))
+
+        price_elem = _first(_XP['price'], doc)
+        fields['price_text'] = self._stripped_text(price_elem) if price_elem is not None else None
+
+        fields['contacts'] = []
+        contacts_table = _first(_XP['contacts_table'], doc)
+        if contacts_table is not None:
+            for row in _XP['rows_in'](contacts_table):
+                label_cell = _first(_XP['ads_contacts_name'], row)
+                value_cell = _first(_XP['ads_contacts'], row)
+                if label_cell is not None and value_cell is not None:
+                    fields['contacts'].append((self._stripped_text(label_cell), self._stripped_text(value_cell)))
+
+        return fields
+
+    def _next_sibling_text(self, element):
+        # BeautifulSoup's find_next_sibling(string=True): the first text node
+        # after the element at the same level (bs4 counts comments as text too)
+        if element.tail:
+            return element.tail
+        for sibling in element.itersiblings():
+            if isinstance(sibling, etree._Comment) and sibling.text:
+                return sibling.text
+            if sibling.tail:
+                return sibling.tail
+        return None
+
+
+PARSERS = {
+    'bs4': SoupParser,
+    'lxml': LxmlParser,
+}
+
+
+def get_parser(name=None):
+    """Get a parser backend by name - defaults to lxml when it's installed"""
+    if name is None:
+        name = 'lxml' if etree is not None else 'bs4'
+    if name not in PARSERS:
+        raise ValueError(f"Unknown parser backend: {name}")
+    return PARSERS[name]()
+
+
+# Parser used by a process pool worker, set up once per process by init_worker
+_worker_parser = None
+
+
+def init_worker(backend=None):
+    """ProcessPoolExecutor initializer - build the parser once per worker"""
+    global _worker_parser
+    _worker_parser = get_parser(backend)
+
+
+def run_parser(method, *args):
+    """Call a parser method inside a worker process.
+
+    Lives at module level so it can be pickled; only HTML bytes go in and
+    plain dicts/lists come back out.
+    """
+    if _worker_parser is None:
+        init_worker()
+    return getattr(_worker_parser, method)(*args)
+
+
+def compare_parsers(pages, backends=('bs4', 'lxml')):
+    """Run every backend over the same pages and return where they disagree.
+
+    pages is a list of (kind, html) where kind is 'list', 'detail' or
+    'category'. Returns a list of (index, kind, results by backend).
+    """
+    parsers = [get_parser(name) for name in backends]
+    basic = {'external_id': 'parity', 'brand': '', 'model': '', 'url': 'parity'}
+    mismatches = []
+
+    for index, (kind, html) in enumerate(pages):
+        results = {}
+        for parser in parsers:
+            if kind == 'list':
+                results[parser.name] = parser.parse_list_page(html, '', '', '')
+            elif kind == 'detail':
+                results[parser.name] = (parser.parse_listing_details(html, basic),
+                                        parser.parse_full_details(html))
+            else:
+                results[parser.name] = parser.parse_category_links(html)
+
+        values = list(results.values())
+        if any(value != values[0] for value in values[1:]):
+            mismatches.append((index, kind, results))
+
+    return mismatches
+
+
+def guess_page_kind(html):
+    """Rough guess of what sort of SS.LV page this is"""
+    text = html if isinstance(html, str) else html.decode('utf-8', errors='ignore')
+    if 'msg_div_msg' in text:
+        return 'detail'
+    if "id=\"tr_" in text or "id='tr_" in text:
+        return 'list'
+    return 'category'
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check that the parser backends agree on saved (or synthetic) pages")
+    parser.add_argument('files', nargs='*', help='Saved HTML pages')
+    parser.add_argument('--archive', metavar='DIR', help='Check every page in a page archive as well')
+    parser.add_argument('--listings', type=int, default=90,
+                        help='Without files or an archive: synthetic detail pages to generate')
+    args = parser.parse_args()
+
+    names, pages = [], []
+    for path in args.files:
+        with open(path, 'rb') as f:
+            html = f.read()
+        names.append(path)
+        pages.append((guess_page_kind(html), html))
+
+    if args.archive:
+        from page_archive import PageArchive
+        for url, fetched_at, html in PageArchive(args.archive).iter_pages():
+            names.append(f"{url} @ {fetched_at}")
+            pages.append((guess_page_kind(html), html))
+
+    if not pages:
+        # Nothing saved to check against, so use the fixture site's pages
+        from fixture_server import FixtureSite
+        site = FixtureSite.synthetic(brands=1, models_per_brand=1, pages_per_model=max(1, args.listings // 30),
+                                     listings_per_page=min(30, args.listings))
+        for url, html in site.pages.items():
+            names.append(url)
+            pages.append((guess_page_kind(html), html))
+
+    mismatches = compare_parsers(pages)
+    for index, kind, results in mismatches:
+        print(f"MISMATCH in {names[index]} ({kind}):")
+        for name, result in results.items():
+            print(f"  {name}: {result}")
+
+    print(f"Checked {len(pages)} pages, {len(mismatches)} mismatches")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,337 @@
+import logging
+from datetime import datetime
+from sqlalchemy import insert, update, select, exists
+from models import Brand, Model, Car, Listing, Region, PriceObservation, KEY_COLUMNS, normalize_key, with_keys
+from dedup import RepostDetector, listing_tokens
+
+logger = logging.getLogger('ss_scraper.ingest')
+
+# Car columns we copy straight from the scraped listing dict
+CAR_FIELDS = ['year', 'engine_volume', 'engine_type', 'transmission', 'mileage', 'body_type', 'color']
+
+
+def parse_listing_date(date_text):
+    """Scraped dates are YYYY-MM-DD strings, None if we can't read it"""
+    if date_text:
+        try:
+            return datetime.strptime(date_text, '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    return None
+
+
+class IngestWriter:
+    """Writes scraped listings to the database in chunks.
+
+    Brand, model and region ids are cached for the lifetime of the writer so
+    we don't look them up for every listing, and each chunk of cars and
+    listings goes in with bulk statements inside a single transaction.
+    """
+
+    def __init__(self, session, source_id, chunk_size=200, country="Latvia", dedup=True):
+        self.session = session
+        self.source_id = source_id
+        self.country = country  # for regions we haven't seen before
+        self.chunk_size = chunk_size
+        self.pending = []
+
+        # Optional hook called with each chunk right before it's committed,
+        # for anything that has to land in the same transaction
+        self.before_commit = None
+
+        # New listings get fingerprinted and linked to what they're reposts of
+        self.dedup = RepostDetector() if dedup else None
+        self.reposts = 0
+
+        # name_key -> id caches, loaded lazily
+        self.brand_ids = None
+        self.region_ids = None
+        self.model_ids = {}  # brand_id -> {name_key: model_id}
+
+    def add(self, listing_data):
+        """Queue a listing, writing the chunk once it's full.
+
+        Returns the statuses of anything that got written, else an empty list.
+        """
+        self.pending.append(listing_data)
+        if len(self.pending) >= self.chunk_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Write whatever is queued"""
+        if not self.pending:
+            return []
+        chunk, self.pending = self.pending, []
+        return self.write_chunk(chunk)
+
+    def _load_brands(self):
+        if self.brand_ids is None:
+            self.brand_ids = {name_key: brand_id for brand_id, name_key in
+                              self.session.query(Brand.brand_id, Brand.name_key).all()}
+
+    def _load_regions(self):
+        if self.region_ids is None:
+            self.region_ids = {name_key: region_id for region_id, name_key in
+                               self.session.query(Region.region_id, Region.name_key).all()}
+
+    def _load_models(self, brand_id):
+        if brand_id not in self.model_ids:
+            self.model_ids[brand_id] = {name_key: model_id for model_id, name_key in
+                                        self.session.query(Model.model_id, Model.name_key)
+                                        .filter(Model.brand_id == brand_id).all()}
+        return self.model_ids[brand_id]
+
+    def brand_id_for(self, brand_name):
+        """Get the brand id, adding the brand if it's new"""
+        self._load_brands()
+        key = normalize_key(brand_name)
+        if key not in self.brand_ids:
+            logger.info(f"Adding new brand: {brand_name}")
+            brand = Brand(name=brand_name, country="Unknown",
+                          created_at=datetime.now(), updated_at=datetime.now())
+            self.session.add(brand)
+            self.session.flush()
+            self.brand_ids[key] = brand.brand_id
+        return self.brand_ids[key]
+
+    def model_id_for(self, brand_id, model_name):
+        """Get the model id, adding the model if it's new"""
+        models = self._load_models(brand_id)
+        key = normalize_key(model_name)
+        if key not in models:
+            logger.info(f"Adding new model: {model_name} (brand_id={brand_id})")
+            model = Model(brand_id=brand_id, name=model_name,
+                          created_at=datetime.now(), updated_at=datetime.now())
+            self.session.add(model)
+            self.session.flush()
+            models[key] = model.model_id
+        return models[key]
+
+    def region_id_for(self, region_name):
+        """Get the region id, adding the region if it's new"""
+        self._load_regions()
+        if not region_name:
+            region_name = "Nav norādīts"
+        key = normalize_key(region_name)
+        if key not in self.region_ids:
+            logger.info(f"Adding new region: {region_name}")
+            region = Region(name=region_name, country=self.country,
+                            created_at=datetime.now(), updated_at=datetime.now())
+            self.session.add(region)
+            self.session.flush()
+            self.region_ids[key] = region.region_id
+        return self.region_ids[key]
+
+    def _reset_caches(self):
+        # Ids added in a rolled back transaction are gone, so start over
+        self.brand_ids = None
+        self.region_ids = None
+        self.model_ids = {}
+
+    def write_chunk(self, chunk):
+        """Upsert a list of listing dicts in one transaction.
+
+        New listings and price changes also get a row in price_observations.
+        A listing dict can carry a 'fetched_at' time (replayed archive pages);
+        it's dated by that instead of now, and a page older than what we
+        already have for the listing doesn't change anything.
+        Returns a status per listing: "new", "updated" or "unchanged". If the
+        chunk can't be written it's retried one listing at a time, so only
+        the listings that actually fail come back as "error".
+        """
+        try:
+            now = datetime.now()
+            external_ids = [item['external_id'] for item in chunk]
+
+            # One query for every listing in the chunk we already have
+            existing = {
+                listing.external_id: (listing, car)
+                for listing, car in self.session.query(Listing, Car)
+                .join(Car, Listing.car_id == Car.car_id)
+                .filter(Listing.source_id == self.source_id, Listing.external_id.in_(external_ids))
+                .all()
+            }
+
+            statuses = [None] * len(chunk)
+            car_updates, listing_updates = [], []
+            new_items, new_cars = [], []
+            observations = []
+            seen = set()
+
+            for i, listing_data in enumerate(chunk):
+                external_id = listing_data['external_id']
+                if external_id in seen:
+                    # Same listing twice in one chunk (e.g. moved between pages)
+                    statuses[i] = "unchanged"
+                    continue
+                seen.add(external_id)
+
+                if external_id in existing:
+                    listing, car = existing[external_id]
+                    statuses[i] = self._diff_existing(listing_data, listing, car, now,
+                                                      car_updates, listing_updates, observations)
+                    continue
+
+                brand_id = self.brand_id_for(listing_data['brand'])
+                car_row = {field: listing_data.get(field) for field in CAR_FIELDS}
+                car_row.update(with_keys(car_row, KEY_COLUMNS['cars']))
+                car_row.update({
+                    'model_id': self.model_id_for(brand_id, listing_data['model']),
+                    'region_id': self.region_id_for(listing_data.get('region', 'Nav norādīts')),
+                    'created_at': now,
+                    'updated_at': listing_data.get('fetched_at') or now
+                })
+                new_cars.append(car_row)
+                new_items.append((i, listing_data))
+
+            if new_cars:
+                # Insert all the new cars at once and get their ids back in order
+                car_ids = self.session.scalars(
+                    insert(Car).returning(Car.car_id, sort_by_parameter_order=True),
+                    new_cars
+                ).all()
+
+                listing_rows = []
+                model_ids = []
+                for car_id, car_row, (i, listing_data) in zip(car_ids, new_cars, new_items):
+                    seen_at = listing_data.get('fetched_at') or now
+                    listing_rows.append({
+                        'car_id': car_id,
+                        'source_id': self.source_id,
+                        'external_id': listing_data['external_id'],
+                        'price': listing_data.get('price', 0),
+                        'listing_date': parse_listing_date(listing_data.get('listing_date')) or seen_at.date(),
+                        'listing_url': listing_data['url'],
+                        'is_active': True,
+                        'created_at': now,
+                        'updated_at': seen_at
+                    })
+                    model_ids.append(car_row['model_id'])
+                    statuses[i] = "new"
+                listing_ids = self.session.scalars(
+                    insert(Listing).returning(Listing.listing_id, sort_by_parameter_order=True),
+                    listing_rows
+                ).all()
+
+                # First sighting is the start of each listing's price history
+                for listing_id, model_id, listing_row in zip(listing_ids, model_ids, listing_rows):
+                    observations.append({'listing_id': listing_id, 'model_id': model_id,
+                                         'observed_at': listing_row['updated_at'],
+                                         'price': listing_row['price'], 'previous_price': None})
+
+                if self.dedup is not None:
+                    self.reposts += self.dedup.process(self.session, [
+                        (listing_id, car_row['model_id'], car_row['year'],
+                         listing_tokens(listing_data, car_row['region_id']),
+                         listing_row['listing_date'], listing_row['updated_at'].date())
+                        for listing_id, car_row, listing_row, (i, listing_data)
+                        in zip(listing_ids, new_cars, listing_rows, new_items)
+                    ], now)
+
+            if car_updates:
+                self.session.execute(update(Car), car_updates)
+            if listing_updates:
+                self.session.execute(update(Listing), listing_updates)
+            if observations:
+                self.session.execute(insert(PriceObservation), observations)
+
+            if self.before_commit:
+                self.before_commit(chunk)
+            self.session.commit()
+
+            logger.info(f"Wrote {len(chunk)} listings: {statuses.count('new')} new, "
+                        f"{statuses.count('updated')} updated, {statuses.count('unchanged')} unchanged")
+            return statuses
+
+        except Exception as e:
+            self.session.rollback()
+            self._reset_caches()
+            if len(chunk) == 1:
+                logger.exception(f"Error writing listing {chunk[0].get('external_id')}: {str(e)}")
+                return ["error"]
+            logger.exception(f"Error writing chunk of {len(chunk)} listings, retrying one at a time: {str(e)}")
+
+        # Find the bad rows instead of losing the whole chunk
+        statuses = []
+        for listing_data in chunk:
+            statuses.extend(self.write_chunk([listing_data]))
+        return statuses
+
+    def _diff_existing(self, listing_data, listing, car, now, car_updates, listing_updates, observations):
+        """Work out what changed on a listing we already have and queue the updates"""
+        seen_at = listing_data.get('fetched_at') or now
+        if listing.updated_at and seen_at < listing.updated_at:
+            # An archived page from before what we have - replaying it mustn't
+            # roll back the price, revive the listing or rewrite its history
+            return "unchanged"
+
+        car_changes = {}
+        for field in CAR_FIELDS:
+            value = listing_data.get(field)
+            if value and getattr(car, field) != value:
+                car_changes[field] = value
+        car_changes.update(with_keys(car_changes, KEY_COLUMNS['cars']))
+        if 'engine_type' in car_changes:
+            logger.info(f"Updated engine type for listing {listing.external_id}: {car_changes['engine_type']}")
+
+        listing_changes = {}
+        if listing_data.get('price') and listing.price != listing_data['price']:
+            listing_changes['price'] = listing_data['price']
+            observations.append({'listing_id': listing.listing_id, 'model_id': car.model_id, 'observed_at': seen_at,
+                                 'price': listing_data['price'], 'previous_price': listing.price})
+        new_date = parse_listing_date(listing_data.get('listing_date'))
+        if new_date:
+            if listing.listing_date != new_date:
+                listing_changes['listing_date'] = new_date
+        if not listing.is_active:
+            listing_changes['is_active'] = True
+
+        # Always bump the timestamps, that's how we know we saw it
+        car_updates.append({'car_id': car.car_id, 'updated_at': seen_at, **car_changes})
+        listing_updates.append({'listing_id': listing.listing_id, 'updated_at': seen_at, **listing_changes})
+
+        return "updated" if car_changes or listing_changes else "unchanged"
+
+
+def backfill_price_observations(session):
+    """Give every listing without a price history its current price as a first observation.
+
+    Safe to run again, listings that already have observations are left alone.
+    """
+    try:
+        has_observation = select(PriceObservation.observation_id).where(
+            PriceObservation.listing_id == Listing.listing_id
+        )
+        rows = select(
+            Listing.listing_id,
+            Car.model_id,
+            Listing.created_at,
+            Listing.price
+        ).join(Car, Listing.car_id == Car.car_id).where(~exists(has_observation))
+
+        result = session.execute(
+            insert(PriceObservation).from_select(['listing_id', 'model_id', 'observed_at', 'price'], rows)
+        )
+        session.commit()
+        logger.info(f"Backfilled price observations for {result.rowcount} listings")
+        return result.rowcount
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error backfilling price observations: {str(e)}")
+        return 0
+
+
+if __name__ == "__main__":
+    import argparse
+    from models import init_db
+
+    parser = argparse.ArgumentParser(description="Listing data maintenance")
+    parser.add_argument('--db', default="sqlite:///car_price_analysis.db", help='Database URL')
+    parser.add_argument('--backfill-price-observations', action='store_true',
+                        help='Seed price history from current listing prices')
+    args = parser.parse_args()
+
+    if args.backfill_price_observations:
+        session, _ = init_db(args.db)
+        print(f"Backfilled {backfill_price_observations(session)} listings")
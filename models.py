@@ -1,17 +1,55 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Text, create_engine
+import logging
+import unicodedata
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Boolean, Date, DateTime, ForeignKey, Text, LargeBinary, UniqueConstraint, Index, create_engine, event, inspect, text, bindparam
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
-from datetime import datetime
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import relationship, sessionmaker, scoped_session, validates
+from datetime import datetime, timedelta
+
+logger = logging.getLogger('car_models')
 
 # Create base class for declarative models
 Base = declarative_base()
 
+
+def normalize_key(value):
+    """Lookup key for a name: lower case, Latvian diacritics folded, spaces collapsed.
+
+    'Rīga', 'RIGA' and ' riga ' all come out as 'riga'. Filters compare these
+    keys instead of lower(name), so they can use an index.
+    """
+    if value is None:
+        return None
+    folded = ''.join(c for c in unicodedata.normalize('NFKD', str(value)) if not unicodedata.combining(c))
+    return ' '.join(folded.casefold().split())
+
+
+# Columns that have a normalized <column>_key copy next to them
+KEY_COLUMNS = {
+    'brands': ['name'],
+    'models': ['name'],
+    'regions': ['name'],
+    'cars': ['engine_type', 'transmission', 'body_type', 'color'],
+}
+
+
+def with_keys(values, fields):
+    """The <field>_key values to write alongside whichever of `fields` are in `values`"""
+    return {f"{field}_key": normalize_key(values[field]) for field in fields if field in values}
+
+
 class Brand(Base):
     """Model representing car brands"""
     __tablename__ = 'brands'
+    __table_args__ = (
+        Index('idx_brands_name_key', 'name_key'),
+    )
     
     brand_id = Column(Integer, primary_key=True)
     name = Column(String(30), nullable=False)
+    name_key = Column(String(30))  # normalize_key(name), what filters match on
     country = Column(String(30))
     logo_url = Column(String(255))
     created_at = Column(DateTime, default=datetime.now)
@@ -20,16 +58,26 @@ class Brand(Base):
     # Relationships
     models = relationship("Model", back_populates="brand")
     
+    @validates('name')
+    def _set_name_key(self, key, value):
+        self.name_key = normalize_key(value)
+        return value
+    
     def __repr__(self):
         return f"<Brand(name='{self.name}', country='{self.country}')>"
 
 class Model(Base):
     """Model representing car models"""
     __tablename__ = 'models'
+    __table_args__ = (
+        Index('idx_models_brand', 'brand_id'),
+        Index('idx_models_name_key', 'name_key'),
+    )
     
     model_id = Column(Integer, primary_key=True)
     brand_id = Column(Integer, ForeignKey('brands.brand_id'), nullable=False)
     name = Column(String(30), nullable=False)
+    name_key = Column(String(30))
     class_type = Column(String(20))
     production_start = Column(Integer)
     production_end = Column(Integer)
@@ -42,15 +90,24 @@ class Model(Base):
     market_values = relationship("MarketValue", back_populates="model")
     analyses = relationship("Analysis", back_populates="model")
     
+    @validates('name')
+    def _set_name_key(self, key, value):
+        self.name_key = normalize_key(value)
+        return value
+    
     def __repr__(self):
         return f"<Model(name='{self.name}', brand_id={self.brand_id})>"
 
 class Region(Base):
     """Model representing geographical regions"""
     __tablename__ = 'regions'
+    __table_args__ = (
+        Index('idx_regions_name_key', 'name_key'),
+    )
     
     region_id = Column(Integer, primary_key=True)
     name = Column(String(50), nullable=False)
+    name_key = Column(String(50))
     country = Column(String(30), nullable=False)
     lat = Column(Float)
     lng = Column(Float)
@@ -61,12 +118,24 @@ class Region(Base):
     cars = relationship("Car", back_populates="region")
     market_values = relationship("MarketValue", back_populates="region")
     
+    @validates('name')
+    def _set_name_key(self, key, value):
+        self.name_key = normalize_key(value)
+        return value
+    
     def __repr__(self):
         return f"<Region(name='{self.name}', country='{self.country}')>"
 
 class Car(Base):
     """Model representing individual cars"""
     __tablename__ = 'cars'
+    __table_args__ = (
+        # Searches go brand -> model -> year range, so model first
+        Index('idx_cars_model_year', 'model_id', 'year'),
+        Index('idx_cars_region', 'region_id'),
+        # Fuel filters without a brand, e.g. price stats for all diesels
+        Index('idx_cars_engine_type_key', 'engine_type_key'),
+    )
     
     car_id = Column(Integer, primary_key=True)
     model_id = Column(Integer, ForeignKey('models.model_id'), nullable=False)
@@ -79,6 +148,11 @@ class Car(Base):
     mileage = Column(Integer)
     body_type = Column(String(20))
     color = Column(String(20))
+    # normalize_key() of the columns above, bulk writes have to fill these themselves (see with_keys)
+    engine_type_key = Column(String(20))
+    transmission_key = Column(String(20))
+    body_type_key = Column(String(20))
+    color_key = Column(String(20))
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -88,6 +162,11 @@ class Car(Base):
     listings = relationship("Listing", back_populates="car")
     analyses = relationship("Analysis", back_populates="car")
     
+    @validates(*KEY_COLUMNS['cars'])
+    def _set_key(self, key, value):
+        setattr(self, f"{key}_key", normalize_key(value))
+        return value
+    
     def __repr__(self):
         return f"<Car(model_id={self.model_id}, year={self.year})>"
 
@@ -113,6 +192,14 @@ class Source(Base):
 class Listing(Base):
     """Model representing car listings/advertisements"""
     __tablename__ = 'listings'
+    __table_args__ = (
+        # The ingest lookup for every scraped listing
+        Index('uq_listings_source_external', 'source_id', 'external_id', unique=True),
+        Index('idx_listings_car', 'car_id'),
+        # Date first - is_active alone is too coarse to lead with, the planner
+        # would start a search from it instead of from the brand
+        Index('idx_listings_active_date', 'listing_date', 'is_active'),
+    )
     
     listing_id = Column(Integer, primary_key=True)
     car_id = Column(Integer, ForeignKey('cars.car_id'), nullable=False)
@@ -128,10 +215,84 @@ class Listing(Base):
     # Relationships
     car = relationship("Car", back_populates="listings")
     source = relationship("Source", back_populates="listings")
+    price_observations = relationship("PriceObservation", back_populates="listing")
     
     def __repr__(self):
         return f"<Listing(car_id={self.car_id}, price={self.price})>"
 
+class PriceObservation(Base):
+    """Model representing a listing's price at the time we saw it change.
+
+    Append-only: a row is written when a listing first shows up and then
+    only when its price moves. model_id is copied from the car so price
+    history for a model is a range scan on one index.
+    """
+    __tablename__ = 'price_observations'
+    __table_args__ = (
+        Index('idx_price_obs_model_time', 'model_id', 'observed_at'),
+        Index('idx_price_obs_listing_time', 'listing_id', 'observed_at'),
+    )
+    
+    observation_id = Column(Integer, primary_key=True)
+    listing_id = Column(Integer, ForeignKey('listings.listing_id'), nullable=False)
+    model_id = Column(Integer, ForeignKey('models.model_id'), nullable=False)
+    observed_at = Column(DateTime, nullable=False, default=datetime.now)
+    price = Column(Integer, nullable=False)
+    previous_price = Column(Integer)  # None for the first observation
+    
+    # Relationships
+    listing = relationship("Listing", back_populates="price_observations")
+    
+    def __repr__(self):
+        return f"<PriceObservation(listing_id={self.listing_id}, price={self.price}, previous={self.previous_price})>"
+
+class ListingFingerprint(Base):
+    """Model representing a listing's MinHash signature, for spotting reposts (see dedup.py)"""
+    __tablename__ = 'listing_fingerprints'
+    
+    listing_id = Column(Integer, ForeignKey('listings.listing_id'), primary_key=True)
+    model_id = Column(Integer, ForeignKey('models.model_id'), nullable=False)
+    signature = Column(LargeBinary, nullable=False)  # packed unsigned 64-bit minhashes
+    created_at = Column(DateTime, default=datetime.now)
+    
+    def __repr__(self):
+        return f"<ListingFingerprint(listing_id={self.listing_id})>"
+
+class LshBucket(Base):
+    """Model representing one LSH band bucket a listing's signature falls in.
+
+    bucket_key hashes the band number, the model, the year and the band's
+    minhashes, so listings that might be duplicates share a key and
+    finding them is an index lookup rather than a scan.
+    """
+    __tablename__ = 'lsh_buckets'
+    __table_args__ = (
+        Index('idx_lsh_buckets_key', 'bucket_key'),
+    )
+    
+    bucket_id = Column(Integer, primary_key=True)
+    bucket_key = Column(BigInteger, nullable=False)
+    listing_id = Column(Integer, ForeignKey('listings.listing_id'), nullable=False)
+    
+    def __repr__(self):
+        return f"<LshBucket(bucket_key={self.bucket_key}, listing_id={self.listing_id})>"
+
+class ListingRepost(Base):
+    """Model representing a listing that looks like a repost of an earlier one"""
+    __tablename__ = 'listing_reposts'
+    __table_args__ = (
+        Index('idx_listing_reposts_original', 'original_listing_id'),
+    )
+    
+    repost_id = Column(Integer, primary_key=True)
+    listing_id = Column(Integer, ForeignKey('listings.listing_id'), nullable=False, unique=True)
+    original_listing_id = Column(Integer, ForeignKey('listings.listing_id'), nullable=False)
+    similarity = Column(Float)  # estimated Jaccard similarity of the fingerprints
+    created_at = Column(DateTime, default=datetime.now)
+    
+    def __repr__(self):
+        return f"<ListingRepost(listing_id={self.listing_id}, original={self.original_listing_id}, similarity={self.similarity})>"
+
 class Analysis(Base):
     """Model representing analyses performed"""
     __tablename__ = 'analyses'
@@ -217,11 +378,266 @@ class ReportAnalysis(Base):
     def __repr__(self):
         return f"<ReportAnalysis(report_id={self.report_id}, analysis_id={self.analysis_id})>"
 
+class CrawlRun(Base):
+    """Model representing one scraper run, so an interrupted crawl can be resumed"""
+    __tablename__ = 'crawl_runs'
+    
+    run_id = Column(Integer, primary_key=True)
+    source_id = Column(Integer, ForeignKey('sources.source_id'), nullable=False)
+    status = Column(String(20), nullable=False, default='running')  # running, finished, failed, abandoned
+    pages_per_model = Column(Integer)
+    started_at = Column(DateTime, default=datetime.now)
+    finished_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    # Relationships
+    pages = relationship("FrontierPage", back_populates="run")
+    seen_listings = relationship("SeenListing", back_populates="run")
+    model_stats = relationship("ModelCrawlStat", back_populates="run")
+    metrics = relationship("CrawlRunMetrics", back_populates="run")
+    
+    def __repr__(self):
+        return f"<CrawlRun(run_id={self.run_id}, status='{self.status}')>"
+
+class FrontierPage(Base):
+    """Model representing a list page visited or a detail page still to fetch in a crawl run"""
+    __tablename__ = 'frontier_pages'
+    __table_args__ = (
+        UniqueConstraint('run_id', 'url', name='uq_frontier_run_url'),
+    )
+    
+    page_id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('crawl_runs.run_id'), nullable=False)
+    kind = Column(String(10), nullable=False)  # 'list' or 'detail'
+    url = Column(String(255), nullable=False)
+    status = Column(String(10), nullable=False, default='pending')  # pending or done
+    brand = Column(String(30))
+    model = Column(String(30))
+    page_num = Column(Integer)
+    data = Column(Text)  # JSON - next page for list pages, the basic listing for detail pages
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    # Relationships
+    run = relationship("CrawlRun", back_populates="pages")
+    
+    def __repr__(self):
+        return f"<FrontierPage(kind='{self.kind}', url='{self.url}', status='{self.status}')>"
+
+class SeenListing(Base):
+    """Model representing a listing a crawl run saw on a list page"""
+    __tablename__ = 'seen_listings'
+    __table_args__ = (
+        Index('idx_seen_listings_run_external', 'run_id', 'external_id'),
+    )
+    
+    seen_id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('crawl_runs.run_id'), nullable=False)
+    brand = Column(String(30))
+    model = Column(String(30))
+    external_id = Column(String(50), nullable=False)
+    
+    # Relationships
+    run = relationship("CrawlRun", back_populates="seen_listings")
+    
+    def __repr__(self):
+        return f"<SeenListing(run_id={self.run_id}, external_id='{self.external_id}')>"
+
+class ModelCrawlStat(Base):
+    """Model representing how much a model's listings changed in one crawl run"""
+    __tablename__ = 'model_crawl_stats'
+    __table_args__ = (
+        Index('idx_model_crawl_stats_model', 'brand', 'model', 'created_at'),
+    )
+    
+    stat_id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('crawl_runs.run_id'), nullable=False)
+    brand = Column(String(30), nullable=False)
+    model = Column(String(30), nullable=False)
+    listings_known = Column(Integer, default=0)  # we had before the run, 0 on a first crawl
+    listings_seen = Column(Integer, default=0)
+    listings_changed = Column(Integer, default=0)  # new or re-priced
+    created_at = Column(DateTime, default=datetime.now)
+    
+    # Relationships
+    run = relationship("CrawlRun", back_populates="model_stats")
+    
+    def __repr__(self):
+        return f"<ModelCrawlStat(brand='{self.brand}', model='{self.model}', changed={self.listings_changed}/{self.listings_seen})>"
+
+class CrawlRunMetrics(Base):
+    """Model representing the telemetry of one scraper run (see telemetry.py)"""
+    __tablename__ = 'crawl_run_metrics'
+    
+    metrics_id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('crawl_runs.run_id'), nullable=False)
+    elapsed_seconds = Column(Float)
+    pages = Column(Integer)
+    bytes = Column(Integer)
+    listings = Column(Integer)
+    data = Column(Text)  # JSON: latency histograms, status codes, per brand/model throughput
+    created_at = Column(DateTime, default=datetime.now)
+    
+    # Relationships
+    run = relationship("CrawlRun", back_populates="metrics")
+    
+    def __repr__(self):
+        return f"<CrawlRunMetrics(run_id={self.run_id}, pages={self.pages}, elapsed={self.elapsed_seconds})>"
+
+
+def ensure_key_columns(engine):
+    """Add the normalized key columns to an older database and fill them in.
+
+    Only rows whose key is still empty get computed, so after the first
+    run this is one cheap query per column. Also drops the lower(name)
+    indexes the keys replaced.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table_name, fields in KEY_COLUMNS.items():
+        if table_name not in existing_tables:
+            continue
+        table = Base.metadata.tables[table_name]
+        columns = {column['name'] for column in inspector.get_columns(table_name)}
+        primary_key = table.primary_key.columns.values()[0]
+
+        with engine.begin() as conn:
+            for field in fields:
+                key_column = table.c[f"{field}_key"]
+                if key_column.name not in columns:
+                    logger.info(f"Adding {table_name}.{key_column.name}")
+                    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {key_column.name} "
+                                      f"{key_column.type.compile(engine.dialect)}"))
+
+                # SQLite's lower() doesn't know about diacritics, so the keys are worked out here
+                rows = conn.execute(table.select().with_only_columns(primary_key, table.c[field]).where(
+                    key_column.is_(None), table.c[field].isnot(None)
+                )).all()
+                if rows:
+                    conn.execute(table.update().where(primary_key == bindparam('_id')).values(
+                        {key_column.name: bindparam('_key')}
+                    ), [{'_id': row[0], '_key': normalize_key(row[1])} for row in rows])
+                    logger.info(f"Backfilled {len(rows)} {table_name}.{key_column.name} values")
+
+    with engine.begin() as conn:
+        for old_index in ('idx_brands_lower_name', 'idx_models_lower_name', 'idx_regions_lower_name'):
+            conn.execute(text(f"DROP INDEX IF EXISTS {old_index}"))
+
+
+def ensure_indexes(engine):
+    """Create any index declared above that an existing database file doesn't have yet.
+
+    create_all() skips tables that already exist, indexes and all, so older
+    databases get theirs here. Everything is CREATE INDEX IF NOT EXISTS, so
+    it's safe to run every time.
+    """
+    existing_tables = set(inspect(engine).get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        for index in table.indexes:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+            except IntegrityError as e:
+                # A unique index over rows that already have duplicates
+                logger.warning(f"Couldn't create {index.name} on {table.name}, "
+                               f"existing rows break it: {str(e.orig)}")
+
+
+# Set on every new SQLite connection. WAL lets the API read while a scrape
+# is writing; NORMAL sync is still crash safe in WAL mode, it only skips
+# the fsync on each commit.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms to wait for a lock before "database is locked"
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # negative is KiB, so ~64 MB per connection
+    'temp_store': 'MEMORY',
+}
+
+
+def sqlite_date_trunc(interval, date_str):
+    """date_trunc() for SQLite, which doesn't have it built in"""
+    if date_str is None:
+        return None
+
+    # Dates, or datetimes stored as 'YYYY-MM-DD HH:MM:SS'
+    date_obj = datetime.strptime(date_str[:10], '%Y-%m-%d')
+
+    if interval.lower() == 'month':
+        return date_obj.replace(day=1).strftime('%Y-%m-%d')
+    elif interval.lower() == 'year':
+        return date_obj.replace(month=1, day=1).strftime('%Y-%m-%d')
+    elif interval.lower() == 'week':
+        # Get Monday of that week
+        return (date_obj - timedelta(days=date_obj.weekday())).strftime('%Y-%m-%d')
+    return date_str
+
+
+def configure_sqlite(engine, read_only=False, busy_timeout=None):
+    """Apply SQLITE_PRAGMAS and our SQL functions to every connection the engine opens"""
+    pragmas = dict(SQLITE_PRAGMAS)
+    if busy_timeout is not None:
+        pragmas['busy_timeout'] = busy_timeout
+    if read_only:
+        # The journal mode is stored in the file, only the writer sets it
+        del pragmas['journal_mode']
+        pragmas['query_only'] = 'ON'
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+        dbapi_connection.create_function("date_trunc", 2, sqlite_date_trunc)
+
+
+def make_engine(db_url, read_only=False, pool_size=5, max_overflow=10, pool_timeout=30, busy_timeout=None):
+    """Engine with the SQLite profile applied and a sized connection pool.
+
+    read_only opens the file with mode=ro, so nothing through that engine
+    can take the write lock. In-memory databases keep SQLAlchemy's own
+    single-connection pool, sizing one makes no sense.
+    """
+    url = make_url(db_url)
+    if url.get_backend_name() != 'sqlite':
+        return create_engine(url, pool_size=pool_size, max_overflow=max_overflow,
+                             pool_timeout=pool_timeout, pool_pre_ping=True)
+
+    if url.database in (None, '', ':memory:'):
+        engine = create_engine(url)
+    else:
+        if read_only:
+            url = url.set(database=f"file:{url.database}", query={**url.query, 'mode': 'ro', 'uri': 'true'})
+        engine = create_engine(url, pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+    configure_sqlite(engine, read_only=read_only, busy_timeout=busy_timeout)
+    return engine
+
 
 # Database initialization function
-def init_db(db_url="sqlite:///car_price_analysis.db"):
-    """Initialize the database with all tables"""
-    engine = create_engine(db_url)
+def init_db(db_url="sqlite:///car_price_analysis.db", **engine_options):
+    """Initialize the database with all tables.
+
+    engine_options go to make_engine (pool_size, max_overflow, pool_timeout, busy_timeout).
+    """
+    engine = make_engine(db_url, **engine_options)
     Base.metadata.create_all(engine)
+    ensure_key_columns(engine)
+    ensure_indexes(engine)
     Session = sessionmaker(bind=engine)
-    return Session(), engine
\ No newline at end of file
+    return Session(), engine
+
+
+def init_read_db(db_url="sqlite:///car_price_analysis.db", **engine_options):
+    """Read-only sessions for serving queries, one per thread.
+
+    The database has to exist already (run init_db first). Returns a
+    scoped_session - call .remove() when a request is done with it - and
+    the engine.
+    """
+    engine = make_engine(db_url, read_only=True, **engine_options)
+    return scoped_session(sessionmaker(bind=engine)), engine
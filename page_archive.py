@@ -0,0 +1,222 @@
+import gzip
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger('ss_scraper.archive')
+
+# Default place for the archive, next to the database
+ARCHIVE_DIR = 'page_archive'
+
+
+class PageArchive:
+    """Append-only store of fetched pages.
+
+    Pages go into gzip segment files, one gzip member per page, using a
+    WARC-like record (a few header lines, a blank line, then the body).
+    Segments roll over once they reach segment_size. A small SQLite index
+    maps URL and fetch time to (segment, offset, length) so any page can be
+    read back with a single seek, without unpacking the whole segment.
+
+    One archive can be shared between threads (several sources, API scrape
+    jobs); every access to the index and the open segment takes a lock.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR, segment_size=64 * 1024 * 1024, commit_every=50):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.commit_every = commit_every
+        os.makedirs(directory, exist_ok=True)
+
+        self.index_path = os.path.join(directory, 'index.db')
+        self.conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS pages (
+            page_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            fetched_at TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            segment TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL
+        )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_url_time ON pages (url, fetched_at)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_time ON pages (fetched_at)')
+        self.conn.commit()
+
+        self.segment_name = None
+        self.segment_file = None
+        self.uncommitted = 0
+
+    def _segment_names(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.warc.gz'))
+
+    def _open_segment(self):
+        """Open the newest segment for appending, starting a new one if it's full"""
+        names = self._segment_names()
+        name = names[-1] if names else None
+        if name is None or os.path.getsize(os.path.join(self.directory, name)) >= self.segment_size:
+            name = f"pages-{len(names) + 1:05d}.warc.gz"
+            logger.info(f"Starting archive segment {name}")
+        self.segment_name = name
+        self.segment_file = open(os.path.join(self.directory, name), 'ab')
+
+    def add(self, url, content, status=200, fetched_at=None):
+        """Append a page to the archive"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        fetched_at = fetched_at or datetime.now()
+
+        header = (
+            "WARC/1.0\r\n"
+            "WARC-Type: response\r\n"
+            f"WARC-Target-URI: {url}\r\n"
+            f"WARC-Date: {fetched_at.isoformat()}\r\n"
+            f"HTTP-Status: {status}\r\n"
+            f"Content-Length: {len(content)}\r\n"
+            "\r\n"
+        ).encode('utf-8')
+        record = gzip.compress(header + content + b"\r\n\r\n")
+
+        with self.lock:
+            if self.segment_file is None or self.segment_file.tell() >= self.segment_size:
+                self.close_segment()
+                self._open_segment()
+
+            offset = self.segment_file.seek(0, os.SEEK_END)
+            self.segment_file.write(record)
+            self.conn.execute(
+                'INSERT INTO pages (url, fetched_at, status, segment, offset, length) VALUES (?, ?, ?, ?, ?, ?)',
+                (url, fetched_at.isoformat(), status, self.segment_name, offset, len(record))
+            )
+
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self.flush()
+
+    def flush(self):
+        """Make sure everything added so far is on disk and in the index"""
+        with self.lock:
+            if self.segment_file is not None:
+                self.segment_file.flush()
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def close_segment(self):
+        with self.lock:
+            if self.segment_file is not None:
+                self.flush()
+                self.segment_file.close()
+                self.segment_file = None
+
+    def close(self):
+        with self.lock:
+            self.close_segment()
+            self.conn.commit()
+
+    def _read_record(self, segment, offset, length):
+        """Read one page back, returns (headers, body)"""
+        with self.lock:
+            if segment == self.segment_name and self.segment_file is not None:
+                self.segment_file.flush()
+        with open(os.path.join(self.directory, segment), 'rb') as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+
+        head, _, rest = data.partition(b"\r\n\r\n")
+        headers = {}
+        for line in head.decode('utf-8').split("\r\n")[1:]:
+            key, _, value = line.partition(': ')
+            headers[key] = value
+        return headers, rest[:int(headers['Content-Length'])]
+
+    def get(self, url, at=None, status=200):
+        """The newest copy of a page (fetched at or before `at`), None if we don't have it.
+
+        Returns (content, fetched_at).
+        """
+        response = self._newest(url, at, 'AND status = ?', (status,))
+        return response and response[1:]
+
+    def get_response(self, url, at=None):
+        """Like get, but whatever status the newest copy had.
+
+        Returns (status, content, fetched_at), so a replay can see the 404s
+        and 429s a run got as well as its pages.
+        """
+        return self._newest(url, at)
+
+    def _newest(self, url, at=None, condition='', params=()):
+        at = (at or datetime.now()).isoformat()
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT status, segment, offset, length, fetched_at FROM pages '
+                f'WHERE url = ? AND fetched_at <= ? {condition} ORDER BY fetched_at DESC LIMIT 1',
+                (url, at) + tuple(params)
+            ).fetchone()
+        if row is None:
+            return None
+        _, content = self._read_record(*row[1:4])
+        return row[0], content, datetime.fromisoformat(row[4])
+
+    def iter_pages(self, since=None, until=None, url_contains=None, status=200):
+        """Yield (url, fetched_at, content) for archived pages, oldest first"""
+        self.flush()
+        query = 'SELECT url, fetched_at, segment, offset, length FROM pages WHERE status = ?'
+        params = [status]
+        if since:
+            query += ' AND fetched_at >= ?'
+            params.append(since.isoformat())
+        if until:
+            query += ' AND fetched_at <= ?'
+            params.append(until.isoformat())
+        if url_contains:
+            query += ' AND url LIKE ?'
+            params.append(f"%{url_contains}%")
+        # Segment/offset order reads each segment front to back
+        query += ' ORDER BY segment, offset'
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        for url, fetched_at, segment, offset, length in rows:
+            _, content = self._read_record(segment, offset, length)
+            yield url, datetime.fromisoformat(fetched_at), content
+
+    def stats(self):
+        with self.lock:
+            count, first, last = self.conn.execute(
+                'SELECT COUNT(*), MIN(fetched_at), MAX(fetched_at) FROM pages'
+            ).fetchone()
+        size = sum(os.path.getsize(os.path.join(self.directory, name)) for name in self._segment_names())
+        return {
+            "pages": count,
+            "segments": len(self._segment_names()),
+            "bytes": size,
+            "first_fetch": first,
+            "last_fetch": last
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Page archive tools")
+    parser.add_argument('--dir', default=ARCHIVE_DIR, help='Archive directory')
+    parser.add_argument('--import-debug-html', metavar='DIR',
+                        help='Move pages from an old debug_html folder into the archive')
+    args = parser.parse_args()
+
+    archive = PageArchive(args.dir)
+    if args.import_debug_html:
+        # Old dumps only kept a mangled URL in the file name, so that's what we index them by
+        for path in sorted(glob.glob(os.path.join(args.import_debug_html, '*.html'))):
+            with open(path, 'rb') as f:
+                archive.add(os.path.basename(path)[:-len('.html')], f.read(),
+                            fetched_at=datetime.fromtimestamp(os.path.getmtime(path)))
+    archive.close()
+    print(archive.stats())
@@ -0,0 +1,93 @@
+import argparse
+import json
+import sys
+import time
+from fixture_server import FixtureSite
+from html_parsers import PARSERS, get_parser, guess_page_kind
+
+# What each kind of page goes through during a scrape
+BASIC = {'external_id': 'bench', 'brand': 'Bench', 'model': 'Bench', 'url': 'bench'}
+METHODS = {
+    'detail': lambda parser, html: parser.parse_listing_details(html, BASIC),
+    'list': lambda parser, html: parser.parse_list_page(html, 'Bench', 'Bench', ''),
+    'category': lambda parser, html: parser.parse_category_links(html),
+}
+
+
+def time_parser(parser, pages, repeat=5):
+    """CPU milliseconds per page for each kind of page, best of `repeat` passes"""
+    results = {}
+    for kind in METHODS:
+        kind_pages = [html for page_kind, html in pages if page_kind == kind]
+        if not kind_pages:
+            continue
+        best = None
+        for _ in range(repeat):
+            started = time.process_time()
+            for html in kind_pages:
+                METHODS[kind](parser, html)
+            spent = time.process_time() - started
+            best = spent if best is None else min(best, spent)
+        results[kind] = {"pages": len(kind_pages), "ms_per_page": round(best / len(kind_pages) * 1000, 3)}
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.15):
+    """Page kinds that got more than `tolerance` slower than the baseline"""
+    regressions = []
+    for backend, kinds in results.items():
+        for kind, stats in kinds.items():
+            old = baseline.get(backend, {}).get(kind, {}).get('ms_per_page')
+            if old and stats['ms_per_page'] > old * (1 + tolerance):
+                regressions.append(f"{backend} {kind}: {stats['ms_per_page']} ms vs baseline {old} ms "
+                                   f"({(stats['ms_per_page'] / old - 1) * 100:+.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the HTML parser backends per page")
+    parser.add_argument('files', nargs='*', help='Saved HTML pages')
+    parser.add_argument('--archive', metavar='DIR', help='Use every page in a page archive')
+    parser.add_argument('--listings', type=int, default=200,
+                        help='Without files or an archive: synthetic detail pages to generate')
+    parser.add_argument('--backend', choices=sorted(PARSERS), action='append',
+                        help='Backend to time, repeat for several (default: all installed)')
+    parser.add_argument('--repeat', type=int, default=5, help='Passes over the pages, the best one counts')
+    parser.add_argument('--save', metavar='FILE', help='Write the results to a JSON file')
+    parser.add_argument('--baseline', metavar='FILE', help='Fail if a page kind got slower than in this saved run')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.files:
+        with open(path, 'rb') as f:
+            html = f.read()
+        pages.append((guess_page_kind(html), html))
+    if args.archive:
+        from page_archive import PageArchive
+        pages.extend((guess_page_kind(html), html) for _, _, html in PageArchive(args.archive).iter_pages())
+    if not pages:
+        site = FixtureSite.synthetic(brands=1, models_per_brand=1, pages_per_model=max(1, args.listings // 30),
+                                     listings_per_page=min(30, args.listings))
+        pages = [(guess_page_kind(html), html) for html in site.pages.values()]
+
+    backends = []
+    for name in args.backend or sorted(PARSERS):
+        try:
+            backends.append(get_parser(name))
+        except ImportError:
+            print(f"Skipping {name}, not installed")
+
+    results = {backend.name: time_parser(backend, pages, args.repeat) for backend in backends}
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
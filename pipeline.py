@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger('ss_scraper.pipeline')
+
+# Put on a stage's queue once per worker to tell it there's nothing more coming
+_DONE = object()
+
+
+class _CpuTimed:
+    """Awaits a coroutine while adding up the CPU time spent in its own steps.
+
+    Wall-clock time around an await would also count whatever other tasks
+    ran in the meantime, so instead we drive the coroutine ourselves and
+    only time the stretches where it is actually running.
+    """
+
+    def __init__(self, coro, stage):
+        self.coro = coro
+        self.stage = stage
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            started = time.thread_time()
+            try:
+                if error is not None:
+                    yielded = self.coro.throw(error)
+                else:
+                    yielded = self.coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.stage.cpu_seconds += time.thread_time() - started
+
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class Stage:
+    """One step of the pipeline: a bounded input queue and a few workers.
+
+    The handler is a coroutine called as handler(item, emit) and awaits
+    emit(result) for everything it wants to pass on (zero, one or many
+    items). emit blocks while the next stage's queue is full, which is what
+    gives us backpressure all the way up to discovery.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=100):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.next_stage = None
+        self.tasks = []
+
+        # Stats
+        self.received = 0
+        self.processed = 0
+        self.emitted = 0
+        self.errors = 0
+        self.busy_seconds = 0.0  # time spent in the handler, minus waiting on the next stage
+        self.blocked_seconds = 0.0  # time spent waiting for room in the next stage's queue
+        self.cpu_seconds = 0.0  # CPU time on the event loop thread (not counting parse workers)
+        self.max_depth = 0
+        self.depth_total = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def put(self, item):
+        """Add an item, waiting while the queue is full"""
+        await self.queue.put(item)
+        self.received += 1
+        depth = self.queue.qsize()
+        self.depth_total += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    async def close(self):
+        """Wait for the workers to finish everything that's been put"""
+        for _ in self.tasks:
+            await self.queue.put(_DONE)
+        await asyncio.gather(*self.tasks)
+        self.finished_at = time.monotonic()
+
+    def cancel(self):
+        for task in self.tasks:
+            task.cancel()
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            if item is _DONE:
+                return
+
+            blocked_before = self.blocked_seconds
+            started = time.perf_counter()
+            try:
+                await _CpuTimed(self.handler(item, self._emit), self)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error in {self.name} stage: {str(e)}")
+            # Don't count time stuck behind the next stage as work
+            self.busy_seconds += (time.perf_counter() - started) - (self.blocked_seconds - blocked_before)
+
+    async def _emit(self, item):
+        self.emitted += 1
+        if self.next_stage is None:
+            return
+        started = time.perf_counter()
+        await self.next_stage.put(item)
+        self.blocked_seconds += time.perf_counter() - started
+
+    def stats(self):
+        elapsed = ((self.finished_at or time.monotonic()) - self.started_at) if self.started_at else 0
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "emitted": self.emitted,
+            "errors": self.errors,
+            "per_second": round(self.processed / elapsed, 2) if elapsed > 0 else 0,
+            "busy_seconds": round(self.busy_seconds, 2),
+            "blocked_seconds": round(self.blocked_seconds, 2),
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "max_queue": self.max_depth,
+            "avg_queue": round(self.depth_total / self.received, 1) if self.received else 0
+        }
+
+
+class Pipeline:
+    """A chain of stages connected by bounded queues.
+
+    Use it as an async context manager so the workers get cleaned up if
+    something goes wrong, and call finish() to drain it:
+
+        async with Pipeline([...]) as pipeline:
+            await pipeline.put(job)
+            await pipeline.finish()
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+        self.finished = False
+
+    async def __aenter__(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self.finished:
+            for stage in self.stages:
+                stage.cancel()
+            await asyncio.gather(*[task for stage in self.stages for task in stage.tasks],
+                                 return_exceptions=True)
+
+    async def put(self, item):
+        """Feed an item into the first stage"""
+        await self.stages[0].put(item)
+
+    async def finish(self):
+        """Close the stages in order so each one drains into the next"""
+        for stage in self.stages:
+            await stage.close()
+        self.finished = True
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def log_stats(self):
+        for name, stats in self.stats().items():
+            logger.info(f"Stage {name}: {stats}")
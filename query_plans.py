@@ -0,0 +1,128 @@
+import logging
+import sys
+from sqlalchemy import select, func, text
+from models import Brand, Model, Car, Listing, Region, PriceObservation, SeenListing
+
+logger = logging.getLogger('car_models.query_plans')
+
+# Tables big enough that a full scan on a hot path is a bug
+BIG_TABLES = ['listings', 'cars', 'price_observations', 'seen_listings']
+
+
+def hot_queries():
+    """(name, statement, indexes it has to use) for the lookups we run all the time"""
+    search = select(Listing.price, Car.year, Region.name).select_from(Brand).join(
+        Model, Brand.brand_id == Model.brand_id
+    ).join(
+        Car, Model.model_id == Car.model_id
+    ).join(
+        Listing, Car.car_id == Listing.car_id
+    ).join(
+        Region, Car.region_id == Region.region_id
+    ).where(
+        Brand.name_key == 'tesla',
+        Model.name_key == 'model 3',
+        Car.engine_type_key.in_(['elektriskais', 'elektrisks', 'electric']),
+        Car.year >= 2018,
+        Car.year <= 2022,
+        Listing.is_active == True
+    )
+
+    region_stats = select(Region.name, func.avg(Listing.price), func.count(Listing.listing_id)).select_from(
+        Listing
+    ).join(
+        Car, Listing.car_id == Car.car_id
+    ).join(
+        Region, Car.region_id == Region.region_id
+    ).join(
+        Model, Car.model_id == Model.model_id
+    ).join(
+        Brand, Model.brand_id == Brand.brand_id
+    ).where(
+        Listing.is_active == True,
+        Brand.name_key == 'tesla'
+    ).group_by(Region.name)
+
+    fuel_stats = select(func.avg(Listing.price)).select_from(Car).join(
+        Listing, Car.car_id == Listing.car_id
+    ).where(
+        Car.engine_type_key.in_(['dizelis', 'diesel'])
+    )
+
+    ingest_lookup = select(Listing, Car).join(Car, Listing.car_id == Car.car_id).where(
+        Listing.source_id == 1,
+        Listing.external_id.in_(['abc123', 'def456'])
+    )
+
+    recent_listings = select(Listing.listing_id).where(
+        Listing.is_active == True,
+        Listing.listing_date >= '2025-01-01'
+    )
+
+    price_history = select(PriceObservation.observed_at, PriceObservation.price).where(
+        PriceObservation.model_id.in_([1, 2]),
+        PriceObservation.observed_at >= '2025-01-01'
+    )
+
+    seen = select(SeenListing.seen_id).where(
+        SeenListing.run_id == 1,
+        SeenListing.external_id == 'abc123'
+    )
+
+    return [
+        ('search', search, ['idx_brands_name_key', 'idx_cars_model_year', 'idx_listings_car']),
+        ('region stats', region_stats, ['idx_brands_name_key', 'idx_models_brand', 'idx_cars_model_year',
+                                        'idx_listings_car']),
+        ('fuel stats', fuel_stats, ['idx_cars_engine_type_key', 'idx_listings_car']),
+        ('ingest lookup', ingest_lookup, ['uq_listings_source_external']),
+        ('recent active listings', recent_listings, ['idx_listings_active_date']),
+        ('price history', price_history, ['idx_price_obs_model_time']),
+        ('seen listings', seen, ['idx_seen_listings_run_external']),
+    ]
+
+
+def query_plan(engine, statement):
+    """SQLite's EXPLAIN QUERY PLAN lines for a statement"""
+    sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+def check_plans(engine):
+    """Run every hot query through the planner, returns [(name, plan, problems)]"""
+    results = []
+    for name, statement, indexes in hot_queries():
+        plan = query_plan(engine, statement)
+        problems = [f"doesn't use {index}" for index in indexes
+                    if not any(index in line for line in plan)]
+        for line in plan:
+            # 'SCAN cars' is a full table scan, 'SCAN cars USING INDEX ...' isn't
+            words = line.split()
+            if len(words) >= 2 and words[0] == 'SCAN' and words[1] in BIG_TABLES and 'USING' not in words:
+                problems.append(f"full scan of {words[1]}")
+        results.append((name, plan, problems))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from models import init_db
+
+    parser = argparse.ArgumentParser(description="Check that the hot queries use their indexes")
+    parser.add_argument('--db', default="sqlite://",
+                        help='SQLite database URL (default: an empty in-memory one, so only the schema decides)')
+    args = parser.parse_args()
+
+    # init_db adds any missing indexes first
+    _, engine = init_db(args.db)
+    failed = 0
+    for name, plan, problems in check_plans(engine):
+        print(f"{'FAIL' if problems else 'OK  '} {name}")
+        for line in plan:
+            print(f"       {line}")
+        for problem in problems:
+            print(f"       -> {problem}")
+        failed += bool(problems)
+
+    print(f"{failed} of {len(hot_queries())} queries not using their indexes")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import random
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger('ss_scraper.rate_limiter')
+
+
+class CircuitOpenError(Exception):
+    """Raised when a host has failed too often and we are giving it a break"""
+    pass
+
+
+def retry_delay(attempt, base_delay=1, max_delay=60):
+    """Exponential backoff with full jitter for the given (0-based) retry attempt"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    """Turn a Retry-After header into seconds, None if missing or a date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class HostRateLimiter:
+    """Token bucket for a single host whose rate adapts to how the host responds.
+
+    The rate is cut sharply when the host throttles us (429/403) or latency
+    climbs well above what we have seen before, and nudged up again after a
+    streak of healthy responses (AIMD). Too many failures in a row open the
+    circuit and requests fail fast until the cooldown has passed.
+    """
+
+    def __init__(self, host, initial_rate=2.0, min_rate=0.2, max_rate=8.0, burst=3,
+                 increase_step=0.25, backoff_factor=0.5, probe_after=10,
+                 latency_factor=2.0, min_latency_increase=0.25, failure_threshold=5, cooldown=60):
+        self.host = host
+        self.rate = initial_rate  # requests per second
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.backoff_factor = backoff_factor
+        self.probe_after = probe_after
+        self.latency_factor = latency_factor
+        self.min_latency_increase = min_latency_increase  # seconds, ignore jitter on fast hosts
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        # Bucket state - tokens may go negative, that just means callers are queued
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+
+        # Health tracking
+        self.healthy_streak = 0
+        self.latency_avg = None
+        self.latency_baseline = None
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0.0
+
+        # Counters for reporting
+        self.requests = 0
+        self.throttled = 0
+        self.failures = 0
+        self.wait_time = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+            self.last_refill = now
+
+    def _check_circuit(self, now):
+        if self.circuit_open_until > now:
+            raise CircuitOpenError(
+                f"Circuit open for {self.host}, retry in {self.circuit_open_until - now:.0f}s"
+            )
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it"""
+        now = time.monotonic()
+        self._check_circuit(now)
+        self._refill(now)
+
+        self.tokens -= 1
+        delay = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+        # Honour any pause from a recent throttle response
+        delay = max(delay, self.paused_until - now)
+        self.requests += 1
+        self.wait_time += delay
+        return delay
+
+    async def acquire(self):
+        """Wait (without blocking the loop) until we are allowed to send a request"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        # A throttle may have come in while we were waiting
+        remaining = self.paused_until - time.monotonic()
+        if remaining > 0:
+            self.wait_time += remaining
+            await asyncio.sleep(remaining)
+
+    def acquire_blocking(self):
+        """Same as acquire, for the blocking requests code path"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+        # A throttle may have come in while we were waiting
+        remaining = self.paused_until - time.monotonic()
+        if remaining > 0:
+            self.wait_time += remaining
+            time.sleep(remaining)
+
+    def record_success(self, latency):
+        """A request went through fine - maybe speed up a little"""
+        self.consecutive_failures = 0
+
+        # Track latency with a moving average and remember the best we've seen
+        if self.latency_avg is None:
+            self.latency_avg = latency
+        else:
+            self.latency_avg = 0.8 * self.latency_avg + 0.2 * latency
+        if self.latency_baseline is None or self.latency_avg < self.latency_baseline:
+            self.latency_baseline = self.latency_avg
+
+        if (self.latency_avg > self.latency_baseline * self.latency_factor
+                and self.latency_avg - self.latency_baseline > self.min_latency_increase):
+            # Server is getting slower, ease off before it starts refusing us
+            self._set_rate(self.rate * 0.8)
+            self.healthy_streak = 0
+            return
+
+        self.healthy_streak += 1
+        if self.healthy_streak >= self.probe_after:
+            self._set_rate(self.rate + self.increase_step)
+            self.healthy_streak = 0
+
+    def record_throttle(self, retry_after=None):
+        """The host told us to slow down (429/403)"""
+        self.throttled += 1
+        self.healthy_streak = 0
+        self._set_rate(self.rate * self.backoff_factor)
+
+        pause = retry_after if retry_after is not None else 1.0 / self.rate
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        self._record_failure()
+
+    def record_failure(self):
+        """Connection error, timeout or a 5xx"""
+        self.healthy_streak = 0
+        self._record_failure()
+
+    def _record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            logger.warning(f"Too many failures for {self.host}, pausing it for {self.cooldown}s")
+            self.circuit_open_until = time.monotonic() + self.cooldown
+            # Half-open afterwards: one more failure trips it again
+            self.consecutive_failures = self.failure_threshold - 1
+
+    def _set_rate(self, new_rate):
+        new_rate = min(self.max_rate, max(self.min_rate, new_rate))
+        if abs(new_rate - self.rate) >= 0.01:
+            logger.debug(f"Rate for {self.host}: {self.rate:.2f} -> {new_rate:.2f} req/s")
+        self.rate = new_rate
+
+    def stats(self):
+        """Counters for the run summary"""
+        return {
+            "rate": round(self.rate, 2),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "wait_seconds": round(self.wait_time, 2),
+            "avg_latency": round(self.latency_avg, 3) if self.latency_avg is not None else None
+        }
+
+
+class AdaptiveRateLimiter:
+    """Keeps one HostRateLimiter per host"""
+
+    def __init__(self, **limiter_settings):
+        self.limiter_settings = limiter_settings
+        self.hosts = {}
+
+    def for_url(self, url):
+        """Get the limiter for the host of this URL"""
+        host = urlparse(url).netloc
+        limiter = self.hosts.get(host)
+        if limiter is None:
+            limiter = HostRateLimiter(host, **self.limiter_settings)
+            self.hosts[host] = limiter
+        return limiter
+
+    def stats(self):
+        return {host: limiter.stats() for host, limiter in self.hosts.items()}
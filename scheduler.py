@@ -0,0 +1,146 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from config import Config
+from models import CrawlRun, ModelCrawlStat
+from ss_scraper import Scraper
+
+logger = logging.getLogger('ss_scraper.scheduler')
+
+
+class ScrapeScheduler:
+    """Runs incremental scrapes on a timer, recrawling busy models more often.
+
+    Every model gets a churn score from its recent runs: the share of its
+    listings that were new or re-priced. Hot models are recrawled after
+    hot_factor * scrape_interval_hours, cold ones only after
+    cold_factor * scrape_interval_hours, everything else on the interval.
+    Each run fetches at most max_listings_per_source detail pages.
+    """
+
+    def __init__(self, config=None, target_brands=None, db_url=None, pages_per_model=2, parse_workers=None,
+                 hot_churn=0.2, cold_churn=0.05, hot_factor=0.5, cold_factor=3, history_days=7, min_sleep=60):
+        self.config = config or Config()
+        self.interval = timedelta(hours=self.config.get('scrape_interval_hours', 24))
+        self.pages_per_model = pages_per_model
+        self.hot_churn = hot_churn
+        self.cold_churn = cold_churn
+        self.hot_factor = hot_factor
+        self.cold_factor = cold_factor
+        self.history_days = history_days
+        self.min_sleep = min_sleep  # seconds
+        self.history = {}
+        # Every (brand, model) the last run came across, and the ones the
+        # listing cap cut short or skipped
+        self.discovered = set()
+        self.capped = set()
+
+        # Incremental, so unchanged listings don't cost a detail page
+        self.scraper = Scraper(
+            target_brands=target_brands,
+            db_url=db_url or self.config.get('db_url'),
+            incremental=True,
+            parse_workers=parse_workers
+        )
+        self.scraper.model_filter = self.is_due
+        self.scraper.max_listings = self.config.get('max_listings_per_source')
+
+    def model_history(self):
+        """{(brand, model): (churn, last_crawled)} for every model we have crawled.
+
+        Churn only counts recent runs where we already had listings to
+        compare against, None if there are none.
+        """
+        session = self.scraper.session
+        since = datetime.now() - timedelta(days=self.history_days)
+        # Only our own source's runs, other sites can have models with the same names
+        ours = CrawlRun.source_id == self.scraper.source_id
+
+        last_crawled = dict(((brand, model), last) for brand, model, last in session.query(
+            ModelCrawlStat.brand, ModelCrawlStat.model, func.max(ModelCrawlStat.created_at)
+        ).join(CrawlRun).filter(ours).group_by(ModelCrawlStat.brand, ModelCrawlStat.model).all())
+
+        churn = {}
+        for brand, model, seen, changed in session.query(
+            ModelCrawlStat.brand, ModelCrawlStat.model,
+            func.sum(ModelCrawlStat.listings_seen), func.sum(ModelCrawlStat.listings_changed)
+        ).join(CrawlRun).filter(
+            ours,
+            ModelCrawlStat.created_at >= since,
+            ModelCrawlStat.listings_known > 0
+        ).group_by(ModelCrawlStat.brand, ModelCrawlStat.model).all():
+            churn[(brand, model)] = (changed or 0) / seen if seen else 0.0
+
+        return {key: (churn.get(key), last) for key, last in last_crawled.items()}
+
+    def classify(self, churn):
+        if churn is None:
+            return 'normal'
+        if churn >= self.hot_churn:
+            return 'hot'
+        if churn < self.cold_churn:
+            return 'cold'
+        return 'normal'
+
+    def recrawl_interval(self, churn):
+        kind = self.classify(churn)
+        if kind == 'hot':
+            return self.interval * self.hot_factor
+        if kind == 'cold':
+            return self.interval * self.cold_factor
+        return self.interval
+
+    def is_due(self, brand, model):
+        """Model filter for the scraper - models we've never crawled, or the cap left unfinished, are always due"""
+        key = (brand['name'], model['name'])
+        self.discovered.add(key)
+        history = self.history.get(key)
+        if history is None or key in self.capped:
+            return True
+        churn, last_crawled = history
+        return last_crawled + self.recrawl_interval(churn) <= datetime.now()
+
+    def next_run_at(self):
+        """When the next model comes due.
+
+        Now if the last run left something out - models the listing cap
+        cut short or skipped, or models that still have no crawl stats.
+        """
+        if self.capped or self.discovered - set(self.history):
+            return datetime.now()
+        if not self.history:
+            return datetime.now() + self.interval
+        return min(last_crawled + self.recrawl_interval(churn) for churn, last_crawled in self.history.values())
+
+    def run_once(self):
+        """Scrape whatever is due now"""
+        self.history = self.model_history()
+        kinds = [self.classify(churn) for churn, _ in self.history.values()]
+        logger.info(f"Scheduled scrape: {kinds.count('hot')} hot, {kinds.count('normal')} normal, "
+                    f"{kinds.count('cold')} cold models known")
+
+        # An interrupted scheduled run gets picked up where it stopped
+        self.discovered = set()
+        result = self.scraper.run(self.pages_per_model, resume=True)
+        self.history = self.model_history()
+        self.capped = set(self.scraper.capped_models)
+        return result
+
+    def run_forever(self):
+        """Keep scraping until we're stopped"""
+        logger.info(f"Scheduler started, interval {self.interval}, "
+                    f"listing cap {self.scraper.max_listings}")
+        while True:
+            result = self.run_once()
+            if result.get('success'):
+                logger.info(f"Scheduled scrape done: {result['total_listings']} listings, "
+                            f"{result['new_listings']} new, {result['updated_listings']} updated")
+            else:
+                logger.error(f"Scheduled scrape failed: {result.get('error')}")
+
+            next_run = self.next_run_at()
+            sleep_seconds = min(max(self.min_sleep, (next_run - datetime.now()).total_seconds()),
+                                self.interval.total_seconds())
+            logger.info(f"Next scheduled scrape in {sleep_seconds / 60:.0f} minutes")
+            time.sleep(sleep_seconds)
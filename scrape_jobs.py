@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import threading
+import uuid
+from datetime import datetime
+from ss_scraper import Scraper
+from sources import get_adapter
+
+logger = logging.getLogger('car_api.scrape_jobs')
+
+
+class JobConflictError(Exception):
+    """Raised when a source already has a scrape queued or running"""
+
+    def __init__(self, job):
+        super().__init__(f"Source {job['source']} already has job {job['job_id']} {job['status']}")
+        self.job = job
+
+
+class ScrapeJobManager:
+    """Runs scrapes as background jobs so API requests don't wait on them.
+
+    Each job runs in its own worker thread with its own event loop. There is
+    at most one active job per source, and the Scraper (with its database
+    engine, caches and rate limiter) is kept between jobs instead of being
+    built again for every request.
+    """
+
+    ACTIVE = ('queued', 'running', 'cancelling')
+
+    def __init__(self, db_url="sqlite:///car_price_analysis.db", target_brands=None, keep_finished=50):
+        self.db_url = db_url
+        self.target_brands = target_brands
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self.scrapers = {}
+        self.lock = threading.Lock()
+
+    def _scraper_for(self, source):
+        # Only the job thread touches it, and there is one job per source at a time.
+        # Parsing stays in the job thread - forking a process pool from a
+        # threaded server copies whatever locks other threads were holding
+        if source not in self.scrapers:
+            self.scrapers[source] = Scraper(adapter=get_adapter(source), target_brands=self.target_brands,
+                                            db_url=self.db_url, parse_workers=0)
+        return self.scrapers[source]
+
+    def submit(self, source="ss.lv", pages_per_model=2, incremental=False, resume=False):
+        """Queue a scrape and start it in the background, returns the job"""
+        # Same key as the sources registry, so "SS.LV" and "ss.lv" are one source
+        source = source.lower()
+        with self.lock:
+            for job in self.jobs.values():
+                if job['source'] == source and job['status'] in self.ACTIVE:
+                    raise JobConflictError(self._public(job))
+
+            job = {
+                'job_id': uuid.uuid4().hex,
+                'source': source,
+                'status': 'queued',
+                'params': {'pages_per_model': pages_per_model, 'incremental': incremental, 'resume': resume},
+                'created_at': datetime.now(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None,
+                'thread': None,
+                'scraper': None
+            }
+            self.jobs[job['job_id']] = job
+            self._forget_old_jobs()
+
+        job['thread'] = threading.Thread(target=self._run_job, args=(job,), name=f"scrape-{job['job_id'][:8]}",
+                                         daemon=True)
+        job['thread'].start()
+        logger.info(f"Queued scrape job {job['job_id']} for {source}")
+        return self._public(job)
+
+    def _run_job(self, job):
+        try:
+            scraper = self._scraper_for(job['source'])
+            scraper.incremental = job['params']['incremental']
+            with self.lock:
+                if job['status'] != 'queued':  # cancelled before it got going
+                    job['finished_at'] = datetime.now()
+                    return
+                # A cancel that reached the scraper after its last job ended
+                # mustn't stop this one; from here on cancels are for us
+                scraper.cancel_requested = False
+                job['scraper'] = scraper
+                job['status'] = 'running'
+                job['started_at'] = datetime.now()
+
+            # A fresh event loop for the job, closed again when it's done
+            result = asyncio.run(scraper.run_async(job['params']['pages_per_model'], job['params']['resume']))
+
+            with self.lock:
+                job['result'] = {key: value for key, value in result.items() if key not in ('pipeline', 'metrics')}
+                if result.get('cancelled'):
+                    job['status'] = 'cancelled'
+                elif result.get('success'):
+                    job['status'] = 'finished'
+                else:
+                    job['status'] = 'failed'
+                    job['error'] = result.get('error')
+        except Exception as e:
+            logger.error(f"Scrape job {job['job_id']} failed: {str(e)}", exc_info=True)
+            with self.lock:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+        finally:
+            with self.lock:
+                job['finished_at'] = job['finished_at'] or datetime.now()
+                job['progress'] = job['scraper'].progress() if job['scraper'] else None
+                job['scraper'] = None
+            logger.info(f"Scrape job {job['job_id']} {job['status']}")
+
+    def cancel(self, job_id):
+        """Ask a job to stop, None if there's no such job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job['status'] == 'queued':
+                job['status'] = 'cancelled'
+            elif job['status'] == 'running':
+                job['status'] = 'cancelling'
+                job['scraper'].cancel()
+            return self._public(job)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def list(self):
+        with self.lock:
+            return [self._public(job) for job in sorted(self.jobs.values(), key=lambda job: job['created_at'],
+                                                         reverse=True)]
+
+    def _forget_old_jobs(self):
+        finished = sorted((job for job in self.jobs.values() if job['status'] not in self.ACTIVE),
+                          key=lambda job: job['created_at'])
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job['job_id']]
+
+    def _public(self, job):
+        """The job as we show it to API clients"""
+        progress = job['scraper'].progress() if job['scraper'] else job.get('progress')
+        return {
+            'job_id': job['job_id'],
+            'source': job['source'],
+            'status': job['status'],
+            'params': job['params'],
+            'progress': progress,
+            'result': job['result'],
+            'error': job['error'],
+            'created_at': job['created_at'].isoformat(),
+            'started_at': job['started_at'].isoformat() if job['started_at'] else None,
+            'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None
+        }
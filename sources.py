@@ -0,0 +1,132 @@
+import logging
+
+logger = logging.getLogger('ss_scraper.sources')
+
+
+class SourceAdapter:
+    """Everything the scraper needs to know about one site.
+
+    The Scraper does the fetching, rate limiting, pipeline and database
+    work; an adapter says where the site's pages are, how its brand and
+    model links look, which parser backend reads its pages (anything with
+    the html_parsers.BaseParser methods, registered in PARSERS) and how
+    hard we're allowed to hit it.
+    """
+
+    name = None
+    url = None
+    country = None
+    base_url = None
+    parser_backend = None  # None = the default backend
+    default_brands = []
+
+    # Politeness budget for this site - each source gets its own
+    initial_rate = 2.0  # requests per second
+    min_rate = 0.2
+    max_rate = 8.0
+    connections = 6
+
+    def __init__(self, base_url=None):
+        if base_url:
+            self.base_url = base_url
+
+    @property
+    def start_url(self):
+        """Page that lists the brands"""
+        raise NotImplementedError
+
+    def brands_from_links(self, links, target_brands):
+        """Brand dicts (name, slug, url, count) from the brands page links"""
+        raise NotImplementedError
+
+    def models_from_links(self, brand_data, links):
+        """Model dicts (name, slug, url, count, brand) from a brand page's links"""
+        raise NotImplementedError
+
+    def scraping_config(self, target_brands):
+        return {"target_brands": target_brands}
+
+
+class SSLVAdapter(SourceAdapter):
+    """SS.LV cars section"""
+
+    name = "SS.LV"
+    url = "https://www.ss.lv/lv/transport/cars/"
+    country = "Latvia"
+    base_url = "https://www.ss.lv"
+    default_brands = ["tesla", "infiniti", "smart", "suzuki"]
+    cars_path = "/lv/transport/cars/"
+
+    def __init__(self, base_url=None):
+        super().__init__(base_url)
+        self._start_url = None
+
+    @property
+    def start_url(self):
+        return self._start_url or f"{self.base_url}{self.cars_path}"
+
+    @start_url.setter
+    def start_url(self, url):
+        self._start_url = url
+
+    def brands_from_links(self, links, target_brands):
+        brands = []
+        for link in links:
+            href = link['href']
+
+            # Get the brand slug (tesla, infiniti, etc.) from the URL
+            brand_slug = href.split('/')[-2]
+
+            # If this is one of our target brands, add it to the list
+            if brand_slug.lower() in target_brands:
+                brands.append({
+                    'name': link['name'],
+                    'slug': brand_slug,
+                    'url': self.base_url + href,
+                    'count': link['count']
+                })
+        return brands
+
+    def models_from_links(self, brand_data, links):
+        brand_slug = brand_data['slug'].lower()
+        brand_base_url = f"{self.cars_path}{brand_slug}/"
+        models = []
+
+        for link in links:
+            href = link['href']
+            model_name = link['name']
+
+            # Skip if not a valid model link
+            if not href or not model_name or href == brand_base_url:
+                continue
+
+            # Only include links that are models of this brand
+            if brand_base_url in href:
+                model_slug = href.rstrip('/').split('/')[-1]
+
+                # Skip search links or other non-model pages
+                if model_slug == brand_slug or "page" in model_slug or "search" in model_slug:
+                    continue
+
+                models.append({
+                    'name': model_name,
+                    'slug': model_slug,
+                    'url': self.base_url + href,
+                    'count': link['count'],
+                    'brand': brand_data['name']
+                })
+        return models
+
+
+# Sources we know how to scrape, by the name used on the command line
+SOURCES = {
+    'ss.lv': SSLVAdapter
+}
+
+
+def get_adapter(name, base_url=None):
+    """Adapter instance for a source name like 'ss.lv'"""
+    try:
+        return SOURCES[name.lower()](base_url)
+    except KeyError:
+        raise ValueError(f"Unknown source '{name}', choose from {', '.join(SOURCES)}")
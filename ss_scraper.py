@@ -4,14 +4,24 @@ import aiohttp
 import logging
 import random
 import time
-import re
+from functools import partial
 import json
 import os
 import sys
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, aclosing
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from models import init_db, Brand, Model, Car, Listing, Region, Source
+from sqlalchemy import and_, or_, select, update, exists
+from sqlalchemy.orm import Session
+from models import init_db, normalize_key, Brand, Model, Car, Listing, Source, SeenListing
+from ingest import IngestWriter
+from html_parsers import get_parser, init_worker, run_parser
+from pipeline import Pipeline, Stage
+from frontier import CrawlFrontier
+from telemetry import RunMetrics, save_run_metrics
+from page_archive import PageArchive, ARCHIVE_DIR
+from rate_limiter import AdaptiveRateLimiter, CircuitOpenError, retry_delay, parse_retry_after
+from sources import SOURCES, SSLVAdapter, get_adapter
 
 logger = logging.getLogger('ss_scraper')
 logger.setLevel(logging.DEBUG)  # Set the logger level to DEBUG
@@ -48,20 +58,41 @@ logger.propagate = False
 # logger.propagate = False # Try with and without this if issues persist
 
 class Scraper:
-    """Scraper for SS.LV for now :p"""
+    """Crawls one source. The site-specific bits live in its adapter (sources.py),
+    this is the fetching, rate limiting, pipeline and database side."""
     
-    def __init__(self, target_brands=None, db_url="sqlite:///car_price_analysis.db", debug_mode=False):
+    def __init__(self, target_brands=None, db_url="sqlite:///car_price_analysis.db", debug_mode=False,
+                 incremental=False, parser_backend=None, parse_workers=None, stage_workers=None,
+                 archive_dir=ARCHIVE_DIR, replay=False, replay_at=None, base_url=None, adapter=None):
         """Set up the scraper with our settings"""
-        self.base_url = "https://www.ss.lv"
-        self.car_url = f"{self.base_url}/lv/transport/cars/"
+        # SS.LV unless we're told otherwise
+        self.adapter = adapter or SSLVAdapter()
+        if base_url:
+            self.adapter.base_url = base_url
         self.debug_mode = debug_mode
         
-        # Create debug folder if needed
-        if self.debug_mode:
-            os.makedirs("debug_html", exist_ok=True)
+        # In incremental mode we only open detail pages for listings that are
+        # new or changed price since we last saw them
+        self.incremental = incremental
         
-        # Define which brands we want - default to our four chosen ones
-        self.target_brands = target_brands or ["tesla", "infiniti", "smart", "suzuki"]
+        # HTML parser backend for this site - for SS.LV lxml if it's
+        # installed, otherwise BeautifulSoup
+        self.parser = get_parser(parser_backend or self.adapter.parser_backend)
+        
+        # Worker processes for parsing pages during async runs, so parsing
+        # doesn't hold up the event loop (0 = parse inline)
+        self.parse_workers = parse_workers if parse_workers is not None else (os.cpu_count() or 1)
+        self.parse_pool = None
+        
+        # In debug mode every page we fetch goes into the page archive. In
+        # replay mode pages come out of the archive instead of the network
+        # (the newest copy fetched at or before replay_at)
+        self.replay = replay
+        self.replay_at = replay_at
+        self.archive = PageArchive(archive_dir) if (debug_mode or replay) else None
+        
+        # Define which brands we want - default to the source's chosen ones
+        self.target_brands = target_brands or self.adapter.default_brands
         
         # Random user agents to look like different browsers
         self.user_agents = [
@@ -74,189 +105,364 @@ class Scraper:
         # Connect to the database
         self.session, self.engine = init_db(db_url)
         
-        # Make sure we have SS.LV as a source in our database
+        # Make sure the source is in our database
         self.ensure_source_exists()
         
+        # Listings get written in chunks with cached brand/model/region ids.
+        # The writer has its own session and does all its work on one
+        # thread (see _in_writer) so a chunk commit doesn't hold up the loop
+        self.writer = IngestWriter(Session(bind=self.engine), self.source_id, country=self.adapter.country)
+        self.write_executor = None
+        
+        # Crawl frontier for the current run (set up by run_async)
+        self.frontier = None
+        
+        # Optional limits for scheduled runs: model_filter(brand, model)
+        # decides which models get crawled, max_listings caps how many
+        # detail pages a run fetches
+        self.model_filter = None
+        self.max_listings = None
+        
         # Track progress with these counters
         self.total_listings = 0
         self.new_listings = 0
         self.updated_listings = 0
         self.error_count = 0
+        self.skipped_details = 0
+        self.discovered_listings = 0
+        self.queued_listings = 0
+        self.write_counts = {}
+        # (brand, model) names the listing cap cut short or skipped
+        self.capped_models = set()
+        
+        # Latencies, bytes, status codes etc. for the current run
+        self.metrics = RunMetrics()
+        
+        # The task and loop of a run in progress, so it can be cancelled
+        # from another thread
+        self.run_task = None
+        self.run_loop = None
+        self.cancel_requested = False
+        
+        # Per-host token buckets that speed up or back off depending on how
+        # the site responds, instead of a fixed concurrency and random sleeps.
+        # Each source has its own budget
+        self.rate_limiter = AdaptiveRateLimiter(initial_rate=self.adapter.initial_rate,
+                                                min_rate=self.adapter.min_rate,
+                                                max_rate=self.adapter.max_rate)
+        
+        # Connection pool settings for the HTTP session shared by a whole run
+        self.connections_per_host = self.adapter.connections
+        self.dns_cache_ttl = 300  # seconds
+        self.keepalive_timeout = 30  # seconds
+        self.http_session = None
+        self.connection_stats = self._empty_connection_stats()
         
-        # This helps us limit how many concurrent requests we make
-        self.semaphore = asyncio.Semaphore(3)  # Only 3 concurrent requests
+        # Scrape pipeline: workers per stage (discover -> fetch -> parse ->
+        # validate -> write) and how many items can wait between stages.
+        # Discovery workers are how many models get paged through at once,
+        # the rate limiter keeps the total request rate polite
+        self.stage_workers = {
+            'discover': 4,
+            'fetch': self.connections_per_host,
+            'parse': max(1, self.parse_workers),
+            'validate': 1,
+            'write': 1
+        }
+        if stage_workers:
+            self.stage_workers.update(stage_workers)
+        self.queue_size = 100
+        self.pipeline_stats = {}
+    
+    @property
+    def base_url(self):
+        return self.adapter.base_url
+    
+    @base_url.setter
+    def base_url(self, url):
+        self.adapter.base_url = url
+    
+    @property
+    def car_url(self):
+        return self.adapter.start_url
+    
+    @car_url.setter
+    def car_url(self, url):
+        self.adapter.start_url = url
     
     def ensure_source_exists(self):
-        """Add SS.LV as a data source if it's not already in our database"""
-        source = self.session.query(Source).filter(Source.name == "SS.LV").first()
+        """Add our source to the database if it's not already there"""
+        source = self.session.query(Source).filter(Source.name == self.adapter.name).first()
         
         if not source:
-            logger.info("Adding SS.LV as a data source")
+            logger.info(f"Adding {self.adapter.name} as a data source")
             source = Source(
-                name="SS.LV",
-                url="https://www.ss.lv/lv/transport/cars/",
-                country="Latvia",
-                scraping_config=json.dumps({"target_brands": self.target_brands}),
+                name=self.adapter.name,
+                url=self.adapter.url,
+                country=self.adapter.country,
+                scraping_config=json.dumps(self.adapter.scraping_config(self.target_brands)),
                 last_scraped_at=None
             )
             self.session.add(source)
             self.session.commit()
         
         self.source_id = source.source_id
-        logger.info(f"Using source_id {self.source_id} for SS.LV")
+        logger.info(f"Using source_id {self.source_id} for {self.adapter.name}")
+    
+    def _empty_connection_stats(self):
+        """Fresh counters for how the connection pool is being used"""
+        return {
+            "new_connections": 0,
+            "reused_connections": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0
+        }
+    
+    def _create_http_session(self):
+        """Create the pooled aiohttp session we reuse for every request in a run"""
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.connections_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        
+        # Count new vs. reused connections so we can see if keep-alive works
+        async def on_connection_create_end(session, trace_config_ctx, params):
+            self.connection_stats["new_connections"] += 1
+        
+        async def on_connection_reuseconn(session, trace_config_ctx, params):
+            self.connection_stats["reused_connections"] += 1
+        
+        async def on_dns_cache_hit(session, trace_config_ctx, params):
+            self.connection_stats["dns_cache_hits"] += 1
+        
+        async def on_dns_cache_miss(session, trace_config_ctx, params):
+            self.connection_stats["dns_cache_misses"] += 1
+        
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        
+        return aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+    
+    @asynccontextmanager
+    async def _http_session_scope(self):
+        """Use the run's shared session, or a temporary one outside of run_async"""
+        if self.http_session is not None and not self.http_session.closed:
+            yield self.http_session
+        else:
+            async with self._create_http_session() as session:
+                yield session
+    
+    def _create_parse_pool(self):
+        """Process pool of parse workers, None if parsing should stay inline"""
+        if self.parse_workers <= 0:
+            return None
+        logger.info(f"Starting {self.parse_workers} parse workers ({self.parser.name})")
+        return ProcessPoolExecutor(max_workers=self.parse_workers,
+                                   initializer=init_worker, initargs=(self.parser.name,))
+    
+    async def _parse(self, method, *args):
+        """Run a parser method in the parse pool, or inline if there isn't one"""
+        started = time.perf_counter()
+        try:
+            if self.parse_pool is None:
+                return getattr(self.parser, method)(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.parse_pool, run_parser, method, *args)
+        finally:
+            self.metrics.observe('parse', time.perf_counter() - started)
     
     def _get_random_user_agent(self):
         """Pick a random browser user agent to avoid looking like a bot"""
         return random.choice(self.user_agents)
     
-    def _make_request(self, url, retries=3, delay=1):
-        """Get a webpage, with retry logic if something goes wrong"""
-        headers = {
+    def _request_headers(self):
+        """Headers we send with every page request"""
+        return {
             'User-Agent': self._get_random_user_agent(),
             'Accept-Language': 'en-US,en;q=0.9,lv;q=0.8',
             'Accept': 'text/html,application/xhtml+xml,application/xml',
             'Connection': 'keep-alive',
             'Referer': self.base_url
         }
+    
+    def _replayed_response(self, url):
+        """Serve a page from the archive, like a response but without the network"""
+        archived = self.archive.get_response(url, at=self.replay_at)
+        if archived is None:
+            logger.warning(f"Page not in archive: {url}")
+            return None
+        status, content, fetched_at = archived
+        if status in [404, 410]:
+            logger.warning(f"Page not found ({status}, archived): {url}")
+            return None
+        if status != 200:
+            # The run didn't get this page either, no retries in a replay
+            logger.warning(f"Request failed ({status}, archived): {url}")
+            return None
+        return type('obj', (object,), {
+            'status': status,
+            'status_code': status,
+            'content': content,
+            'fetched_at': fetched_at
+        })
+    
+    def _make_request(self, url, retries=3, delay=1):
+        """Get a webpage, with retry logic if something goes wrong"""
+        if self.replay:
+            return self._replayed_response(url)
+        
+        headers = self._request_headers()
+        limiter = self.rate_limiter.for_url(url)
         
         for attempt in range(retries + 1):
+            if attempt:
+                self.metrics.retries += 1
+            waiting = time.monotonic()
+            try:
+                limiter.acquire_blocking()
+            except CircuitOpenError as e:
+                logger.warning(f"Skipping {url}: {str(e)}")
+                return None
+            
+            started = time.monotonic()
+            self.metrics.rate_limit_wait += started - waiting
             try:
                 response = requests.get(url, headers=headers, timeout=10)
+                self.metrics.record_response(response.status_code, time.monotonic() - started, len(response.content))
                 
-                # Save HTML for debugging if that option is enabled
-                if self.debug_mode:
-                    debug_file = f"debug_html/{url.replace('/', '_').replace(':', '')}.html"
-                    with open(debug_file, "w", encoding="utf-8") as f:
-                        f.write(response.text)
+                # Keep the page in the archive if that option is enabled
+                if self.archive:
+                    self.archive.add(url, response.content, response.status_code)
                 
                 if response.status_code == 200:
+                    limiter.record_success(time.monotonic() - started)
                     return response
                 
+                if response.status_code in [404, 410]:
+                    # Listing is gone, no point asking again
+                    limiter.record_success(time.monotonic() - started)
+                    logger.warning(f"Page not found ({response.status_code}): {url}")
+                    return None
+                
                 if response.status_code in [403, 429]:
-                    # We're being rate limited, wait longer
-                    wait_time = delay * (attempt + 1) * 2
-                    logger.warning(f"Rate limited ({response.status_code}). Waiting {wait_time}s")
-                    time.sleep(wait_time)
+                    # We're being rate limited, slow this host down
+                    limiter.record_throttle(parse_retry_after(response.headers.get('Retry-After')))
+                    logger.warning(f"Rate limited ({response.status_code}). Rate now {limiter.rate:.2f} req/s")
                 else:
+                    limiter.record_failure()
                     logger.warning(f"Request failed: {response.status_code}")
-                    time.sleep(delay)
             except Exception as e:
+                self.metrics.record_response('error', time.monotonic() - started)
+                limiter.record_failure()
                 logger.warning(f"Request error for {url}: {str(e)}")
-                if attempt < retries:
-                    time.sleep(delay)
-                else:
+                if attempt >= retries:
                     raise
+            
+            if attempt < retries:
+                time.sleep(retry_delay(attempt, delay))
         
         return None
     
     async def _async_make_request(self, url, session, retries=3, delay=1):
         """Get a webpage asynchronously - allows multiple requests at once"""
-        async with self.semaphore:  # Limit how many requests we make at once
-            headers = {
-                'User-Agent': self._get_random_user_agent(),
-                'Accept-Language': 'en-US,en;q=0.9,lv;q=0.8',
-                'Accept': 'text/html,application/xhtml+xml,application/xml',
-                'Connection': 'keep-alive',
-                'Referer': self.base_url
-            }
+        if self.replay:
+            return self._replayed_response(url)
+        
+        headers = self._request_headers()
+        limiter = self.rate_limiter.for_url(url)
+        
+        for attempt in range(retries + 1):
+            if attempt:
+                self.metrics.retries += 1
+            waiting = time.monotonic()
+            try:
+                await limiter.acquire()  # Wait for our turn on this host
+            except CircuitOpenError as e:
+                logger.warning(f"Skipping {url}: {str(e)}")
+                return None
             
-            for attempt in range(retries + 1):
-                try:
-                    async with session.get(url, headers=headers, timeout=10) as response:
-                        if response.status == 200:
-                            text = await response.text()
-                            
-                            # Save HTML for debugging if that option is enabled
-                            if self.debug_mode:
-                                debug_file = f"debug_html/{url.replace('/', '_').replace(':', '')}.html"
-                                with open(debug_file, "w", encoding="utf-8") as f:
-                                    f.write(text)
-                            
-                            # Return an object with the response text
-                            return type('obj', (object,), {
-                                'status': response.status,
-                                'text': text
-                            })
+            started = time.monotonic()
+            self.metrics.rate_limit_wait += started - waiting
+            try:
+                async with session.get(url, headers=headers, timeout=10) as response:
+                    # Raw bytes - decoding is left to the parser
+                    content = await response.read()
+                    self.metrics.record_response(response.status, time.monotonic() - started, len(content))
+                    
+                    # Keep the page in the archive if that option is enabled,
+                    # error pages too so a replay sees what the run saw
+                    if self.archive:
+                        self.archive.add(url, content, response.status)
+                    
+                    if response.status == 200:
+                        limiter.record_success(time.monotonic() - started)
                         
-                        if response.status in [403, 429]:
-                            # We're being rate limited, wait longer
-                            wait_time = delay * (attempt + 1) * 2
-                            logger.warning(f"Rate limited ({response.status}). Waiting {wait_time}s")
-                            await asyncio.sleep(wait_time)
-                        else:
-                            logger.warning(f"Request failed: {response.status}")
-                            await asyncio.sleep(delay)
-                except Exception as e:
-                    logger.warning(f"Async request error for {url}: {str(e)}")
-                    if attempt < retries:
-                        await asyncio.sleep(delay)
+                        # Return an object with the response body
+                        return type('obj', (object,), {
+                            'status': response.status,
+                            'content': content
+                        })
+                    
+                    if response.status in [404, 410]:
+                        # Listing is gone, no point asking again
+                        limiter.record_success(time.monotonic() - started)
+                        logger.warning(f"Page not found ({response.status}): {url}")
+                        return None
+                    
+                    if response.status in [403, 429]:
+                        # We're being rate limited, slow this host down
+                        limiter.record_throttle(parse_retry_after(response.headers.get('Retry-After')))
+                        logger.warning(f"Rate limited ({response.status}). Rate now {limiter.rate:.2f} req/s")
                     else:
-                        raise
+                        limiter.record_failure()
+                        logger.warning(f"Request failed: {response.status}")
+            except Exception as e:
+                self.metrics.record_response('error', time.monotonic() - started)
+                limiter.record_failure()
+                logger.warning(f"Async request error for {url}: {str(e)}")
+                if attempt >= retries:
+                    raise
             
-            return None
-    
-    def _random_delay(self, min_delay=0.5, max_delay=2):
-        """Wait a random amount of time to be nice to the server"""
-        time.sleep(random.uniform(min_delay, max_delay))
-    
-    async def _async_random_delay(self, min_delay=0.5, max_delay=2):
-        """Wait a random amount of time asynchronously"""
-        await asyncio.sleep(random.uniform(min_delay, max_delay))
+            if attempt < retries:
+                await asyncio.sleep(retry_delay(attempt, delay))
+        
+        return None
     
     def get_brands(self):
-        """Get our target car brands from the main SS.LV car page"""
-        logger.info("Getting car brands from SS.LV")
+        """Get our target car brands from the source's main car page"""
+        logger.info(f"Getting car brands from {self.adapter.name}")
         
         response = self._make_request(self.car_url)
         if not response:
             logger.error("Couldn't get the brands page")
             return []
         
-        soup = BeautifulSoup(response.content, 'html.parser')
-        brands = []
+        return self._brands_from_page(response.content)
+    
+    async def get_brands_async(self, session):
+        """Get our target car brands without blocking the event loop"""
+        logger.info(f"Getting car brands from {self.adapter.name}")
+        
+        response = await self._async_make_request(self.car_url, session)
+        if not response:
+            logger.error("Couldn't get the brands page")
+            return []
         
+        return self._brands_from_page(response.content)
+    
+    def _brands_from_page(self, content):
         # Find all brand links that match our targets
-        for brand_element in soup.select("h4.category > a.a_category"):
-            brand_name = brand_element.text.strip()
-            href = brand_element['href']
-            
-            # Get the brand slug (tesla, infiniti, etc.) from the URL
-            brand_slug = href.split('/')[-2]  
-            
-            # Get the listing count from the span
-            count_span = brand_element.find_next("span", class_="category_cnt")
-            count = int(count_span.text.strip("()")) if count_span else 0
-            
-            # If this is one of our target brands, add it to the list
-            if brand_slug.lower() in self.target_brands:
-                brand_url = self.base_url + href
-                brands.append({
-                    'name': brand_name,
-                    'slug': brand_slug,
-                    'url': brand_url,
-                    'count': count
-                })
+        links = self.parser.parse_category_links(content, headers_only=True)
+        brands = self.adapter.brands_from_links(links, self.target_brands)
         
         logger.info(f"Found {len(brands)} target car brands")
         return brands
     
-    def save_brand(self, brand_name):
-        """Add a brand to our database if it's not already there"""
-        brand = self.session.query(Brand).filter(func.lower(Brand.name) == func.lower(brand_name)).first()
-        
-        if not brand:
-            logger.info(f"Adding new brand: {brand_name}")
-            brand = Brand(
-                name=brand_name,
-                country="Unknown",
-                created_at=datetime.now(),
-                updated_at=datetime.now()
-            )
-            self.session.add(brand)
-            self.session.commit()
-        
-        return brand
-    
     def get_models_for_brand(self, brand_data):
         """Get all models for a specific car brand"""
         brand_name = brand_data['name']
@@ -268,884 +474,682 @@ class Scraper:
             logger.error(f"Couldn't get models for {brand_name}")
             return []
         
-        soup = BeautifulSoup(response.content, 'html.parser')
-        models = []
-        
-        # Look for model links with a specific pattern
-        model_links = soup.select("h4.category > a.a_category, a.a_category")
+        return self._models_from_page(brand_data, response.content)
+    
+    async def get_models_for_brand_async(self, brand_data, session):
+        """Get all models for a brand without blocking the event loop"""
+        logger.info(f"Getting models for {brand_data['name']}")
         
-        # We need the brand slug to find model URLs
-        brand_slug = brand_data['slug'].lower()
-        brand_base_url = f"/lv/transport/cars/{brand_slug}/"
+        response = await self._async_make_request(brand_data['url'], session)
+        if not response:
+            logger.error(f"Couldn't get models for {brand_data['name']}")
+            return []
         
-        for link in model_links:
-            href = link.get('href', '')
-            model_name = link.text.strip()
-            
-            # Skip if not a valid model link
-            if not href or not model_name or href == brand_base_url:
-                continue
-            
-            # Only include links that are models of this brand
-            if brand_base_url in href:
-                model_slug = href.rstrip('/').split('/')[-1]
-                
-                # Skip search links or other non-model pages
-                if model_slug == brand_slug or "page" in model_slug or "search" in model_slug:
-                    continue
-                
-                # Get model listing count if available
-                count_span = link.find_next("span", class_="category_cnt")
-                count = int(count_span.text.strip("()")) if count_span else 0
-                
-                model_url = self.base_url + href
-                models.append({
-                    'name': model_name,
-                    'slug': model_slug,
-                    'url': model_url,
-                    'count': count,
-                    'brand': brand_name
-                })
-        
-        logger.info(f"Found {len(models)} models for {brand_name}")
-        return models
+        return self._models_from_page(brand_data, response.content)
     
-    def save_model(self, brand, model_name):
-        """Add a model to our database if it's not already there"""
-        model = self.session.query(Model).filter(
-            Model.brand_id == brand.brand_id,
-            func.lower(Model.name) == func.lower(model_name)
-        ).first()
-        
-        if not model:
-            logger.info(f"Adding new model: {brand.name} {model_name}")
-            model = Model(
-                brand_id=brand.brand_id,
-                name=model_name,
-                created_at=datetime.now(),
-                updated_at=datetime.now()
-            )
-            self.session.add(model)
-            self.session.commit()
+    def _models_from_page(self, brand_data, content):
+        """Pick the model links out of a brand page"""
+        model_links = self.parser.parse_category_links(content)
+        models = self.adapter.models_from_links(brand_data, model_links)
         
-        return model
+        logger.info(f"Found {len(models)} models for {brand_data['name']}")
+        return models
     
-    def get_listings_for_model(self, brand_data, model_data, max_pages=3):
+    async def iter_listing_pages(self, brand_data, model_data, session, max_pages=3, start_url=None, start_page=0):
+        """Page through a model's list pages, yielding each one as soon as it's parsed.
+
+        Yields (listings, page_url, page_num, next_url). Nothing is kept
+        between pages, so a caller that hands listings on as they come holds
+        one page at a time however big the model is, and the next page isn't
+        fetched until the caller asks for it. start_url and start_page let a
+        resumed crawl carry on part way through a model.
+        """
         brand_name = brand_data['name']
         model_name = model_data['name']
-        model_url = model_data['url']
         
         logger.info(f"Getting listings for {brand_name} {model_name}")
-        listings = []
-        page_num = 0 
-        current_url = model_url
+        page_num = start_page
+        current_url = start_url or model_data['url']
         
         while page_num < max_pages:
             logger.info(f"Checking page {page_num+1} at {current_url}")
-            response = self._make_request(current_url)
+            response = await self._async_make_request(current_url, session)
             if not response:
                 logger.error(f"Couldn't get listings page for {brand_name} {model_name} at {current_url}")
-                break
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            listing_rows = soup.select("tr[id^='tr_']")
+                return
             
-            logger.critical(f"TESTING DEBUG OUTPUT: About to loop through {len(listing_rows)} rows. Console level should be DEBUG.")
-            logger.debug(f"DIRECT LOGGER.DEBUG TEST: Number of listing_rows: {len(listing_rows)}")
-            logger.info(f"Found {len(listing_rows)} potential listing rows on this page")
-
-            if not listing_rows:
-                logger.debug("No rows matching tr[id^='tr_'] found on this page.")
-
-            for i, row in enumerate(listing_rows):
-                # Reset for each row
-                year, engine_volume, mileage, price = None, None, None, None
-                listing_id, listing_url, title_text = None, None, None
-
-                try:
-                    listing_id = row.get('id', '').replace('tr_', '')
-                    if not listing_id or "bnr" in listing_id.lower():
-                        logger.debug(f"Row {i}: Skipping, no valid listing_id or is banner (ID: {listing_id}).")
-                        continue
-                    
-                    logger.debug(f"Row {i}: Processing row with ID: {listing_id}")
-
-                    # Get title and URL from the main text cell
-                    title_cell = row.select_one("td.msg2")
-                    if title_cell:
-                        title_link = title_cell.select_one("a.am")
-                        if title_link and title_link.has_attr('href'):
-                            listing_url = self.base_url + title_link['href']
-                            title_text = title_link.text.strip()
-                    
-                    if not title_text or not listing_url:
-                        logger.debug(f"Row {i}, ID {listing_id}: Skipping, no title_link or href.")
-                        continue
-
-                    # Get all data cells
-                    data_cells = row.select("td.msga2-o.pp6, td.msga2-r.pp6")
-                    
-                    logger.debug(f"Row {i}, ID {listing_id}: Found {len(data_cells)} data cells")
-                    
-                    # Check if this is Tesla based on the number of data cells
-                    is_tesla = len(data_cells) == 3
-                    
-                    if is_tesla:
-                        # Tesla layout: Year | Mileage | Price (3 cells)
-                        if len(data_cells) >= 3:
-                            # Year is in cell 0
-                            year_cell = data_cells[0]
-                            year_text = year_cell.get_text(strip=True)
-                            if year_text.isdigit() and len(year_text) == 4:
-                                year = int(year_text)
-                            
-                            # Mileage is in cell 1
-                            mileage_cell = data_cells[1]
-                            mileage_text = mileage_cell.get_text(strip=True).lower()
-                            
-                            if "tūkst." in mileage_text:
-                                mileage_digits = ''.join(filter(str.isdigit, mileage_text.split("tūkst.")[0]))
-                                if mileage_digits:
-                                    mileage = int(mileage_digits) * 1000
-                            elif mileage_text.replace(' ', '').isdigit():
-                                mileage = int(mileage_text.replace(' ', ''))
-                            
-                            # Price is in cell 2
-                            price_cell = data_cells[2]
-                            price_text = price_cell.get_text(strip=True).lower()
-                            
-                            if "€" in price_text:
-                                # Check if it's an exchange listing
-                                if 'maiņai' in price_text or 'pērku' in price_text or 'maina' in price_text:
-                                    logger.info(f"Row {i}, ID {listing_id}: Skipping exchange/buying listing.")
-                                    continue
-                                    
-                                # Remove spaces, commas, and non-digit characters
-                                price_digits = ''.join(filter(str.isdigit, price_text.replace(' ', '').replace(',', '')))
-                                if price_digits:
-                                    price = int(price_digits)
-                            
-                            # For Tesla, set engine type to Electric
-                            engine_type = "Elektrisks"
-                            
-                            logger.debug(f"Row {i}, ID {listing_id}: Tesla layout (3 cells) - Year:{year}, Mileage:{mileage}, Price:{price}")
-                        else:
-                            logger.warning(f"Row {i}, ID {listing_id}: Tesla format but only {len(data_cells)} cells")
-                            continue
-                    else:
-                        # Standard layout: Year | Engine | Mileage | Price (4 cells)
-                        if len(data_cells) >= 4:
-                            # Find the year cell (it's always a 4-digit number starting with "20")
-                            year_cell_index = None
-                            for idx, cell in enumerate(data_cells):
-                                cell_text = cell.get_text(strip=True)
-                                if cell_text.isdigit() and len(cell_text) == 4:
-                                    year_val = int(cell_text)
-                                    # Accept years from 1900 to current year + 1 (for future models)
-                                    if 1900 <= year_val <= datetime.now().year + 1:
-                                        year_cell_index = idx
-                                        year = year_val
-                                        break
-                            
-                            if year_cell_index is None:
-                                logger.debug(f"Row {i}, ID {listing_id}: No year found in data cells")
-                                continue
-                            
-                            # Engine is at year_index + 1
-                            if year_cell_index + 1 < len(data_cells):
-                                engine_cell = data_cells[year_cell_index + 1]
-                                engine_text = engine_cell.get_text(strip=True)
-                                
-                                # Extract numeric volume
-                                volume_match = re.search(r'(\d+\.?\d*)', engine_text)
-                                if volume_match:
-                                    try:
-                                        engine_volume = float(volume_match.group(1))
-                                    except ValueError:
-                                        pass
-                            
-                            # Mileage is at year_index + 2
-                            if year_cell_index + 2 < len(data_cells):
-                                mileage_cell = data_cells[year_cell_index + 2]
-                                mileage_text = mileage_cell.get_text(strip=True).lower()
-                                
-                                if "tūkst." in mileage_text:
-                                    mileage_digits = ''.join(filter(str.isdigit, mileage_text.split("tūkst.")[0]))
-                                    if mileage_digits:
-                                        mileage = int(mileage_digits) * 1000
-                                elif mileage_text.replace(' ', '').isdigit():
-                                    mileage = int(mileage_text.replace(' ', ''))
-                            
-                            # Price is at year_index + 3
-                            if year_cell_index + 3 < len(data_cells):
-                                price_cell = data_cells[year_cell_index + 3]
-                                price_text = price_cell.get_text(strip=True).lower()
-                                
-                                if "€" in price_text:
-                                    # Check if it's an exchange listing
-                                    if 'maiņai' in price_text or 'pērku' in price_text or 'maina' in price_text:
-                                        logger.info(f"Row {i}, ID {listing_id}: Skipping exchange/buying listing.")
-                                        continue
-                                        
-                                    # Remove spaces, commas, and non-digit characters
-                                    price_digits = ''.join(filter(str.isdigit, price_text.replace(' ', '').replace(',', '')))
-                                    if price_digits:
-                                        price = int(price_digits)
-                            
-                            logger.debug(f"Row {i}, ID {listing_id}: Standard layout (4 cells) - Year:{year}, Engine:{engine_volume}, Mileage:{mileage}, Price:{price}")
-                        else:
-                            logger.warning(f"Row {i}, ID {listing_id}: Standard format but only {len(data_cells)} cells")
-                            continue
-                    
-                    # Only add if we have essential data
-                    if price and title_text and listing_url:
-                        listing_data = {
-                            'external_id': listing_id,
-                            'title': title_text,
-                            'url': listing_url,
-                            'price': price,
-                            'year': year,
-                            'engine_volume': engine_volume,
-                            'mileage': mileage,
-                            'brand': brand_name,
-                            'model': model_name,
-                            # These will be filled in by get_listing_details_async:
-                            'engine_type': engine_type if is_tesla else None,
-                            'transmission': None,
-                            'region': None,
-                            'body_type': None,
-                            'color': None
-                        }
-                        listings.append(listing_data)
-                        logger.debug(f"Row {i}, ID {listing_id}: Success - P:{price} Y:{year} E:{engine_volume}L M:{mileage}")
-                    else:
-                        logger.warning(f"Row {i}, ID {listing_id}: Missing essential data - price:{price}, title:{bool(title_text)}, url:{bool(listing_url)}")
-                
-                except Exception as e:
-                    current_id_in_loop = listing_id if listing_id else "UNKNOWN_ID_IN_LOOP_EXC"
-                    logger.error(f"Row {i}, ID {current_id_in_loop}: Exception: {str(e)}", exc_info=True)
-                    continue
+            page_url = current_url
+            page_listings, current_url = await self._parse(
+                'parse_list_page', response.content, brand_name, model_name, self.base_url)
             
-            # Next page logic
-            next_page_link_tag = None
-            for link_tag_in_soup in soup.select("a.navi"):
-                # Make comparison case-insensitive and strip whitespace
-                link_text_cleaned = link_tag_in_soup.text.strip().lower()
-                if link_text_cleaned in ["nākamā", "next", ">>", "следующая"]:
-                    next_page_link_tag = link_tag_in_soup
-                    break
+            yield page_listings, page_url, page_num, current_url
             
-            if next_page_link_tag and next_page_link_tag.has_attr('href'):
-                current_url = self.base_url + next_page_link_tag['href']
-                page_num += 1
-                logger.debug(f"Moving to next page: {current_url}")
-                self._random_delay()
-            else:
+            if not current_url:
                 logger.debug("No next page link found or href missing.")
-                break # No more pages
+                return # No more pages
+            
+            page_num += 1
+            logger.debug(f"Moving to next page: {current_url}")
+    
+    async def get_listings_for_model_async(self, brand_data, model_data, session, max_pages=3):
+        """All of a model's listings in one list - iter_listing_pages if you don't need them all at once"""
+        listings = []
+        async for page_listings, _, _, _ in self.iter_listing_pages(brand_data, model_data, session, max_pages):
+            listings.extend(page_listings)
         
-        logger.info(f"Found {len(listings)} total listings for {brand_name} {model_name} after processing all pages.")
+        logger.info(f"Found {len(listings)} total listings for {brand_data['name']} {model_data['name']} after processing all pages.")
         return listings
         
-    async def get_listing_details_async(self, listing_basic, session):
-        """Get all the detailed info from a car's individual listing page"""
+    async def fetch_listing_page(self, listing_basic, session):
+        """Get the raw detail page for a listing, None if we couldn't"""
         # Skip if no URL
         if not listing_basic.get('url'):
-            return listing_basic
-                    
-        listing_url = listing_basic['url']
+            return None
+        
         logger.debug(f"Getting details for listing {listing_basic['external_id']}")
+        try:
+            response = await self._async_make_request(listing_basic['url'], session)
+        except Exception as e:
+            logger.error(f"Error getting listing details: {str(e)}")
+            return None
         
+        if not response:
+            logger.error(f"Couldn't get listing details")
+            return None
+        if self.replay:
+            # The writer dates the listing by when the page was archived, not now
+            listing_basic['fetched_at'] = response.fetched_at
+        return response.content
+    
+    async def parse_listing_page(self, listing_basic, content):
+        """Turn a fetched detail page into the full listing dict"""
+        if content is None:
+            return listing_basic  # Return what we already have
         try:
-            response = await self._async_make_request(listing_url, session)
-            if not response:
-                logger.error(f"Couldn't get listing details")
-                return listing_basic  # Return what we already have
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            details = dict(listing_basic)  # Start with the basic info we already have
-            
-            # Check if this is an exchange listing
-            if 'maiņai' in soup.text.lower() or 'maina' in soup.text.lower() or 'pērku' in soup.text.lower():
-                logger.info(f"Skipping exchange/buying listing from details page: {listing_basic['external_id']}")
-                details['skip_listing'] = True
-                return details
-        
-            # Get listing date
-            date_cells = soup.select('td.msg2, td.msga2')
-            for cell in date_cells:
-                if 'Datums' in cell.text or 'Date' in cell.text:
-                    date_value = cell.find_next('td')
-                    if date_value:
-                        date_text = date_value.text.strip()
-                        try:
-                            # Handle different date formats
-                            if '.' in date_text:  # DD.MM.YYYY
-                                parts = date_text.split('.')
-                                if len(parts) == 3:
-                                    day, month, year = map(int, parts)
-                                    details['listing_date'] = f"{year:04d}-{month:02d}-{day:02d}"
-                            elif '-' in date_text:  # YYYY-MM-DD
-                                details['listing_date'] = date_text
-                            else:
-                                details['listing_date'] = datetime.now().strftime('%Y-%m-%d')
-                        except:
-                            details['listing_date'] = datetime.now().strftime('%Y-%m-%d')
-            
-            # Default listing date if not found
-            if 'listing_date' not in details:
-                details['listing_date'] = datetime.now().strftime('%Y-%m-%d')
-            
-            # Get region/location - enhanced version
-            # First check in various text labels
-            for cell in date_cells:
-                if any(loc_text in cell.text.lower() for loc_text in ['region', 'reģions', 'pilsēta', 'vieta']):
-                    location_value = cell.find_next('td')
-                    if location_value:
-                        details['region'] = location_value.text.strip()
-            
-            # Also check contacts table for location
-            contacts_table = soup.select_one('table.contacts_table')
-            if contacts_table:
-                for row in contacts_table.select('tr'):
-                    if 'Vieta:' in row.text:
-                        location_cell = row.select_one('td.ads_contacts')
-                        if location_cell:
-                            details['region'] = location_cell.text.strip()
-            
-            # Default region if not found
-            if 'region' not in details or not details['region']:
-                details['region'] = 'Nav norādīts'
-            
-            # Look for specific IDs for engine and transmission
-            engine_elem = soup.select_one("td.ads_opt#tdo_15")
-            if engine_elem:
-                engine_text = engine_elem.text.strip()
-                details['engine'] = engine_text
-                
-                # Extract engine volume (e.g., 0.7)
-                volume_match = re.search(r'(\d+[\.,]\d+|\d+)', engine_text)
-                if volume_match:
-                    volume_str = volume_match.group(1).replace(',', '.')
-                    try:
-                        details['engine_volume'] = float(volume_str)
-                    except ValueError:
-                        pass
-                
-                # Determine engine type
-                engine_text_lower = engine_text.lower()
-                if 'benzīn' in engine_text_lower:
-                    details['engine_type'] = 'Benzīns'
-                elif 'dīzel' in engine_text_lower:
-                    details['engine_type'] = 'Dīzelis'
-                elif 'hibrīd' in engine_text_lower:
-                    details['engine_type'] = 'Hibrīds'
-                elif 'elektr' in engine_text_lower:
-                    details['engine_type'] = 'Elektriskais'
-                elif 'gāz' in engine_text_lower:
-                    details['engine_type'] = 'Gāze'
+            return await self._parse('parse_listing_details', content, listing_basic)
+        except Exception as e:
+            logger.error(f"Error parsing listing details: {str(e)}")
+            return listing_basic
+    
+    def _record_write_results(self, statuses):
+        """Update our counters with what the writer did"""
+        for status in statuses:
+            if status == "new":
+                self.new_listings += 1
+            elif status == "updated":
+                self.updated_listings += 1
+            elif status == "error":
+                self.error_count += 1
+            self.write_counts[status] = self.write_counts.get(status, 0) + 1
+    
+    def save_car_and_listing(self, listing_data):
+        """Save a car and its listing to our database right away"""
+        statuses = self.writer.write_chunk([listing_data])
+        self._record_write_results(statuses)
+        return statuses[0]
+    
+    async def _in_writer(self, fn, *args):
+        """Run fn on the writer thread and wait for it without blocking the loop"""
+        if self.write_executor is None:
+            self.write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-writer')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.write_executor, partial(fn, *args))
+    
+    def _close_writer(self):
+        """Close the writer's session on its own thread and stop the thread"""
+        if self.write_executor is None:
+            self.writer.session.close()
+            return
+        self.write_executor.submit(self.writer.session.close).result()
+        self.write_executor.shutdown()
+        self.write_executor = None
+    
+    async def queue_car_and_listing(self, listing_data):
+        """Queue a car and its listing for the next batched write"""
+        started = time.perf_counter()
+        statuses = await self._in_writer(self.writer.add, listing_data)
+        if statuses:
+            # This one filled up a chunk and it got written
+            self.metrics.observe('write', time.perf_counter() - started)
+        self._record_write_results(statuses)
+    
+    async def flush_pending_writes(self):
+        """Write out anything still queued in the ingest writer"""
+        started = time.perf_counter()
+        statuses = await self._in_writer(self.writer.flush)
+        if statuses:
+            self.metrics.observe('write', time.perf_counter() - started)
+        self._record_write_results(statuses)
+    
+    def load_known_prices(self, brand_name, model_name):
+        """Get {external_id: price} for every listing we already have for a model"""
+        rows = self.session.query(Listing.external_id, Listing.price).join(
+            Car, Listing.car_id == Car.car_id
+        ).join(
+            Model, Car.model_id == Model.model_id
+        ).join(
+            Brand, Model.brand_id == Brand.brand_id
+        ).filter(
+            Listing.source_id == self.source_id,
+            Brand.name_key == normalize_key(brand_name),
+            Model.name_key == normalize_key(model_name)
+        ).all()
+        
+        return {external_id: price for external_id, price in rows}
+    
+    def touch_listings(self, external_ids, chunk_size=500):
+        """Mark listings we saw again (but didn't re-fetch) as active and fresh"""
+        if not external_ids or self.replay:
+            # A replayed list page says nothing about whether a listing is live now
+            return 0
+        
+        touched = 0
+        now = datetime.now()
+        try:
+            # Chunked so we stay under SQLite's bound parameter limit
+            for i in range(0, len(external_ids), chunk_size):
+                chunk = external_ids[i:i + chunk_size]
+                touched += self.session.query(Listing).filter(
+                    Listing.source_id == self.source_id,
+                    Listing.external_id.in_(chunk)
+                ).update(
+                    {Listing.updated_at: now, Listing.is_active: True},
+                    synchronize_session=False
+                )
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Error refreshing unchanged listings: {str(e)}")
+            return 0
+        
+        return touched
+    
+    def build_pipeline(self, session, pages_per_model=2):
+        """Set up the discover -> fetch -> parse -> validate -> write stages.
 
-                logger.debug(f"Found engine info via tdo_15 for {listing_basic['external_id']}: {engine_text}")
+        Jobs going in are (brand_data, model_data) pairs.
+        """
+        def stage(name, handler, queue_size=None):
+            return Stage(name, handler, workers=self.stage_workers[name], queue_size=queue_size or self.queue_size)
+        
+        # Listings waiting on a detail fetch and pages waiting to be parsed
+        # are what take up memory, so those queues only hold a couple of
+        # items per worker - discovery pages ahead no faster than that
+        def bounded(name):
+            return min(self.queue_size, self.stage_workers[name] * 2)
+        
+        return Pipeline([
+            stage('discover', partial(self._discover_stage, session, pages_per_model)),
+            stage('fetch', partial(self._fetch_stage, session), bounded('fetch')),
+            stage('parse', self._parse_stage, bounded('parse')),
+            stage('validate', self._validate_stage),
+            stage('write', self._write_stage)
+        ])
+    
+    async def _discover_stage(self, session, pages_per_model, job, emit):
+        """Page through a model's list pages and pass on listings to fetch"""
+        brand_data, model_data = job
+        brand_name, model_name = brand_data['name'], model_data['name']
+        if self.max_listings is not None and self.queued_listings >= self.max_listings:
+            # Cap reached, the models still queued don't get a page fetched
+            logger.debug(f"Listing cap reached, skipping {brand_name} {model_name}")
+            self.capped_models.add((brand_name, model_name))
+            return
+        logger.info(f"Starting to scrape model: {brand_name} {model_name}")
+        self.metrics.model_started(brand_name, model_name)
+        
+        emitted_urls = set()
+        start_url, start_page = None, 0
+        if self.frontier:
+            # Detail pages left over from an interrupted run go straight to fetching
+            for listing in self.frontier.pending_details(brand_name, model_name):
+                emitted_urls.add(listing['url'])
+                await emit(listing)
             
-            # Look for "Dzinēja tips" for Smart cars
-            if 'engine_type' not in details:
-                engine_type_elem = soup.select_one("td.ads_opt#tdo_34")
-                if engine_type_elem:
-                    engine_type_text = engine_type_elem.text.strip()
-                    details['engine'] = engine_type_text  # Use this as the full engine description too
-                    
-                    # Determine engine type
-                    engine_type_text_lower = engine_type_text.lower()
-                    if 'benzīn' in engine_type_text_lower:
-                        details['engine_type'] = 'Benzīns'
-                    elif 'dīzel' in engine_type_text_lower:
-                        details['engine_type'] = 'Dīzelis'
-                    elif 'hibrīd' in engine_type_text_lower:
-                        details['engine_type'] = 'Hibrīds'
-                    elif 'elektr' in engine_type_text_lower:
-                        details['engine_type'] = 'Elektriskais'
-                        # For electric cars, set a default engine volume if needed
-                        if 'engine_volume' not in details:
-                            details['engine_volume'] = None  # Or some default value for electric
-                    elif 'gāz' in engine_type_text_lower:
-                        details['engine_type'] = 'Gas'
-
-                    logger.debug(f"Found engine info via tdo_34 for {listing_basic['external_id']}: {engine_type_text}")
-
-            # Check transmission - using ID tdo_35
-            transmission_elem = soup.select_one("td.ads_opt#tdo_35")
-            if transmission_elem:
-                trans_text = transmission_elem.text.strip()
+            done, start_url, start_page = self.frontier.model_progress(brand_name, model_name)
+            if done:
+                logger.info(f"List pages for {brand_name} {model_name} already visited, "
+                            f"{len(emitted_urls)} detail pages left")
+                return
+            if start_url:
+                logger.info(f"Resuming {brand_name} {model_name} at page {start_page + 1}")
+        
+        # What we have already tells us how many listings are new or
+        # re-priced, and in incremental mode the unchanged ones don't need
+        # their detail page
+        known_prices = self.load_known_prices(brand_name, model_name)
+        unchanged_ids = []
+        page_stats = {'seen': 0, 'changed': 0}
+        if self.incremental:
+            logger.info(f"Incremental mode: {len(known_prices)} known listings for {model_name}")
+        
+        # Each page's listings go on to fetching as soon as it's parsed, and
+        # emit blocks while the fetch queue is full, so we only page ahead as
+        # fast as the detail workers keep up
+        discovered = 0
+        pages = self.iter_listing_pages(brand_data, model_data, session, max_pages=pages_per_model,
+                                        start_url=start_url, start_page=start_page)
+        async with aclosing(pages):
+            async for page_listings, page_url, page_num, next_url in pages:
+                discovered += len(page_listings)
+                self.discovered_listings += len(page_listings)
+                to_fetch = []
+                for listing in page_listings:
+                    known_price = known_prices.get(listing['external_id'])
+                    unchanged = known_price is not None and known_price == listing['price']
+                    page_stats['seen'] += 1
+                    page_stats['changed'] += 0 if unchanged else 1
+                    if unchanged and self.incremental:
+                        unchanged_ids.append(listing['external_id'])
+                    elif listing['url'] not in emitted_urls:
+                        emitted_urls.add(listing['url'])
+                        to_fetch.append(listing)
                 
-                # Extract just the first part of transmission text
-                # Example: "Automāts 6 ātrumi" -> "Automāts"
-                trans_text_lower = trans_text.lower()
+                # Stay under the run's listing cap - capped means some of
+                # this page's listings didn't make it in
+                capped = False
+                if self.max_listings is not None:
+                    room = max(0, self.max_listings - self.queued_listings)
+                    capped = len(to_fetch) > room
+                    to_fetch = to_fetch[:room]
+                self.queued_listings += len(to_fetch)
                 
-                if 'automāt' in trans_text_lower:
-                    details['transmission'] = 'Automatic'
-                elif 'manuāl' in trans_text_lower:
-                    details['transmission'] = 'Manual'
-                elif 'pusautomāt' in trans_text_lower:
-                    details['transmission'] = 'Semi-Automatic'
-                else:
-                    details['transmission'] = trans_text  # keep original if no match
-            
-            # Get specs from the options table (keep this as a fallback)
-            options_table = soup.select_one('table.options_list')
-            if options_table:
-                rows = options_table.select('tr')
-                for row in rows:
-                    cells = row.select('td')
-                    if len(cells) >= 2:
-                        label = cells[0].text.strip().lower()
-                        value = cells[1].text.strip()
-                        
-                        # Only set these if they weren't already found by ID
-                        if 'engine' not in details and any(eng_text in label for eng_text in ['dzinējs', 'engine', 'двигатель']):
-                            details['engine'] = value
-                            
-                            # Get engine volume (e.g., 2.0)
-                            volume_match = re.search(r'(\d+[\.,]\d+)', value)
-                            if volume_match:
-                                volume_str = volume_match.group(1).replace(',', '.')
-                                details['engine_volume'] = float(volume_str)
-                            
-                            # Figure out engine type
-                            lower_value = value.lower()
-                            if any(fuel in lower_value for fuel in ['benzīn', 'petrol', 'gasoline']):
-                                details['engine_type'] = 'Petrol'
-                            elif any(fuel in lower_value for fuel in ['dīzel', 'diesel']):
-                                details['engine_type'] = 'Diesel'
-                            elif any(fuel in lower_value for fuel in ['hibrīd', 'hybrid']):
-                                details['engine_type'] = 'Hybrid'
-                            elif any(fuel in lower_value for fuel in ['elektr', 'electric']):
-                                details['engine_type'] = 'Electric'
-                            elif any(fuel in lower_value for fuel in ['gas', 'gāze']):
-                                details['engine_type'] = 'Gas'
-                        
-                        # Only set transmission if not found by ID
-                        if 'transmission' not in details and any(trans_text in label for trans_text in ['ātrumkārba', 'transmission', 'коробка']):
-                            lower_value = value.lower()
-                            if any(t in lower_value for t in ['manuāl', 'manual', 'механика']):
-                                details['transmission'] = 'Manual'
-                            elif any(t in lower_value for t in ['automāt', 'automatic', 'автомат']):
-                                details['transmission'] = 'Automatic'
-                            elif any(t in lower_value for t in ['pusautomāt', 'semi-automatic', 'полуавтомат']):
-                                details['transmission'] = 'Semi-Automatic'
-                            else:
-                                details['transmission'] = value
-                        
-                        # Extract body type
-                        if 'body_type' not in details and any(body_text in label for body_text in ['virsbūve', 'body', 'кузов']):
-                            details['body_type'] = value
-                        
-                        # Extract color
-                        if 'color' not in details and any(color_text in label for color_text in ['krāsa', 'color', 'цвет']):
-                            details['color'] = value
-            
-            # For Tesla models, default to Automatic if not specified
-            if 'tesla' in (details.get('brand', '') or '').lower() and not details.get('transmission'):
-                details['transmission'] = 'Automatic'
+                # Checkpoint before handing anything on, so a crash can't lose it
+                if self.frontier:
+                    self.frontier.checkpoint_list_page(brand_name, model_name, page_url, page_num, next_url, to_fetch,
+                                                       seen_ids=[listing['external_id'] for listing in page_listings],
+                                                       done=not capped)
                 
-            if 'smart' in listing_basic.get('brand', '').lower() and not details.get('engine_type'):
-                # Check if it's a newer model (2018+)
-                if details.get('year') and details.get('year') >= 2018:
-                    logger.info(f"Setting engine type to Electric for newer Smart: {listing_basic['external_id']}")
-                    details['engine_type'] = 'Elektrisks'
+                # Detail fetches start on this page's listings straight away
+                for listing in to_fetch:
+                    await emit(listing)
+                
+                if self.max_listings is not None and self.queued_listings >= self.max_listings:
+                    logger.info(f"Listing cap of {self.max_listings} reached, "
+                                f"stopped paging {brand_name} {model_name} after page {page_num+1}")
+                    if capped or next_url:
+                        self.capped_models.add((brand_name, model_name))
+                    break
+        
+        logger.info(f"Found {discovered} listings for {brand_name} {model_name}")
+        if self.frontier:
+            self.frontier.record_model_stats(brand_name, model_name, len(known_prices),
+                                             page_stats['seen'], page_stats['changed'])
+        
+        if not discovered:
+            logger.warning(f"No listings found for {brand_data['name']} {model_data['name']}")
+        
+        if unchanged_ids:
+            # One bulk update instead of a detail fetch per unchanged listing
+            self.touch_listings(unchanged_ids)
+            self.skipped_details += len(unchanged_ids)
+            self.total_listings += len(unchanged_ids)
+            self.metrics.count_listings(brand_name, model_name, len(unchanged_ids))
+            logger.info(f"{len(unchanged_ids)} unchanged listings for {model_data['name']}, details skipped")
+    
+    async def _fetch_stage(self, session, listing_basic, emit):
+        await emit((listing_basic, await self.fetch_listing_page(listing_basic, session)))
+    
+    async def _parse_stage(self, item, emit):
+        listing_basic, content = item
+        await emit(await self.parse_listing_page(listing_basic, content))
+    
+    async def _validate_stage(self, listing_details, emit):
+        """Drop listings we shouldn't save"""
+        if listing_details.get('skip_listing'):
+            logger.info(f"Skipping listing as marked: {listing_details.get('external_id', 'unknown')}")
+            self._mark_details_done([listing_details.get('url')])
+            return
+        
+        missing = [field for field in ['external_id', 'brand', 'model', 'url', 'price'] if not listing_details.get(field)]
+        if missing:
+            logger.warning(f"Skipping listing {listing_details.get('external_id', 'unknown')}, missing {missing}")
+            self.error_count += 1
+            self._mark_details_done([listing_details.get('url')])
+            return
+        
+        await emit(listing_details)
+    
+    def _mark_details_done(self, urls, commit=True):
+        """Tell the crawl frontier we're finished with these detail pages"""
+        if self.frontier:
+            self.frontier.mark_details_done([url for url in urls if url], commit=commit)
+    
+    def _mark_chunk_done(self, chunk):
+        # Runs on the writer thread inside its transaction, just before it commits
+        if self.frontier:
+            self.frontier.mark_details_done([listing['url'] for listing in chunk if listing['url']],
+                                            commit=False, session=self.writer.session)
+    
+    async def _write_stage(self, listing_details, emit):
+        # Queue for the database, it gets written in chunks
+        await self.queue_car_and_listing(listing_details)
+        self.total_listings += 1
+        self.metrics.count_listings(listing_details['brand'], listing_details['model'])
+    
+    async def run_pipeline(self, feed, pages_per_model=2):
+        """Run the scrape pipeline, feed(pipeline) puts the (brand, model) jobs in"""
+        async with self._http_session_scope() as session:
+            pipeline = self.build_pipeline(session, pages_per_model)
+            try:
+                async with pipeline:
+                    await feed(pipeline)
+                    await pipeline.finish()
+            finally:
+                await self.flush_pending_writes()
+                self.pipeline_stats = pipeline.stats()
+        
+        pipeline.log_stats()
+        return self.pipeline_stats
+    
+    async def scrape_model_async(self, brand_data, model_data, pages_per_model=2):
+        """Scrape all listings for a single car model"""
+        discovered_before = self.discovered_listings
+        
+        async def feed(pipeline):
+            await pipeline.put((brand_data, model_data))
+        
+        await self.run_pipeline(feed, pages_per_model)
+        
+        listing_count = self.discovered_listings - discovered_before
+        logger.info(f"Processed {listing_count} listings for {brand_data['name']} {model_data['name']}")
+        return listing_count
+    
+    async def scrape_brand_async(self, brand, pages_per_model=2, pipeline=None):
+        """Scrape all models for a single car brand.
 
-            # Also check by specific IDs as mentioned in the guide
-            for field_name, field_id in [
-                ("year", "tdo_18"),
-                ("body_type", "tdo_32"),
-                ("color", "tdo_17"),
-                ("tech_inspection", "tdo_223"),
-            ]:
-                field_elem = soup.select_one(f"td.ads_opt#{field_id}")
-                if field_elem:
-                    if field_name == "year":
-                        # Extract only the numeric year part from strings like "2019 decembris"
-                        year_text = field_elem.text.strip()
-                        try:
-                            details[field_name] = int(year_text.split()[0])  # Take just the first part
-                        except (ValueError, IndexError):
-                            # Fall back to the original text if conversion fails
-                            details[field_name] = year_text
-                    else:
-                        details[field_name] = field_elem.text.strip()
-            
-            # Price from specific ID
-            price_elem = soup.select_one("span.ads_price#tdo_8")
-            if price_elem and not details.get('price'):
-                price_text = price_elem.text.strip().lower()
-                # Skip listings that are for exchange or buying
-                if 'maiņai' in price_text or 'pērku' in price_text or 'maina' in price_text:
-                    logger.info(f"Skipping exchange/buying listing from price: {listing_basic['external_id']}")
-                    details['skip_listing'] = True
-                    return details
-                    
-                price_digits = ''.join(filter(str.isdigit, price_text))
-                if price_digits:
-                    details['price'] = int(price_digits)
-            
-            # Check if we have a price
-            if 'price' not in details or details['price'] is None:
-                logger.info(f"Skipping listing without price: {listing_basic['external_id']}")
-                details['skip_listing'] = True
-                return details
+        With a pipeline the models just get queued into it, otherwise the
+        brand runs through a pipeline of its own.
+        """
+        if pipeline is None:
+            discovered_before = self.discovered_listings
+            await self.run_pipeline(partial(self.scrape_brand_async, brand, pages_per_model), pages_per_model)
+            return self.discovered_listings - discovered_before
+        
+        logger.info(f"Starting to scrape brand: {brand['name']}")
+        
+        # Get all models for this brand
+        async with self._http_session_scope() as session:
+            models = await self.get_models_for_brand_async(brand, session)
+        
+        if not models:
+            logger.warning(f"No models found for brand: {brand['name']}")
+            return 0
+        
+        for job in self.schedule_models([(brand, models)]):
+            await pipeline.put(job)
+        
+        logger.info(f"Queued {len(models)} models for brand {brand['name']}")
+        return len(models)
+    
+    def schedule_models(self, brand_models):
+        """Order (brand, model) jobs for the pipeline.
+
+        Brands take turns so every brand gets crawled from the start of the
+        run, and within a brand the models with the most listings (by the
+        category counts) go first. Bigger brands get the first pick in each
+        round.
+        """
+        queues = []
+        for brand, models in sorted(brand_models, key=lambda item: item[0].get('count', 0), reverse=True):
+            ordered = sorted(models, key=lambda model: model.get('count', 0), reverse=True)
+            if ordered:
+                queues.append([(brand, model) for model in ordered])
+        
+        jobs = []
+        while queues:
+            for queue in queues:
+                jobs.append(queue.pop(0))
+            queues = [queue for queue in queues if queue]
+        return jobs
+    
+    def mark_inactive_listings(self, days=14):
+        """Mark listings as inactive once they're gone from the site.
+
+        For every model this run paged through completely, anything the run
+        didn't see is gone - that's one UPDATE with a NOT EXISTS against the
+        ids the run recorded. Listings of models we didn't fully crawl are
+        only dropped once they haven't been seen in `days` days.
+        """
+        now = datetime.now()
+        deactivated = 0
+        
+        try:
+            completed = self.frontier.completed_models() if self.frontier else []
+            if completed:
+                model_ids = [model_id for model_id, in self.session.query(Model.model_id).join(
+                    Brand, Model.brand_id == Brand.brand_id
+                ).filter(or_(*[
+                    and_(Brand.name_key == normalize_key(brand_name), Model.name_key == normalize_key(model_name))
+                    for brand_name, model_name in completed
+                ])).all()]
                 
-            # Check if we have a year
-            if 'year' not in details or details['year'] is None:
-                logger.info(f"Skipping listing without year: {listing_basic['external_id']}")
-                details['skip_listing'] = True
-                return details
+                seen = select(SeenListing.seen_id).where(
+                    SeenListing.run_id == self.frontier.run.run_id,
+                    SeenListing.external_id == Listing.external_id
+                )
+                result = self.session.execute(
+                    update(Listing).where(
+                        Listing.source_id == self.source_id,
+                        Listing.is_active == True,
+                        Listing.car_id.in_(select(Car.car_id).where(Car.model_id.in_(model_ids))),
+                        ~exists(seen)
+                    ).values(is_active=False, updated_at=now),
+                    execution_options={"synchronize_session": False}
+                )
+                logger.info(f"Marked {result.rowcount} listings inactive that are no longer listed "
+                            f"({len(completed)} fully crawled models)")
+                deactivated += result.rowcount
             
-            logger.debug(f"Got details for listing {listing_basic['external_id']}")
-            return details
+            if days:
+                cutoff_date = now - timedelta(days=days)
+                result = self.session.execute(
+                    update(Listing).where(
+                        Listing.source_id == self.source_id,
+                        Listing.is_active == True,
+                        Listing.updated_at < cutoff_date
+                    ).values(is_active=False, updated_at=now),
+                    execution_options={"synchronize_session": False}
+                )
+                logger.info(f"Marked {result.rowcount} listings inactive not seen in {days} days")
+                deactivated += result.rowcount
             
+            self.session.commit()
+            return deactivated
         except Exception as e:
-            logger.error(f"Error getting listing details: {str(e)}")
-            return listing_basic
+            self.session.rollback()
+            logger.error(f"Error marking inactive listings: {str(e)}")
+            return 0
     
-    def ensure_region_exists(self, region_name):
-        """Add a region to our database if it's not already there"""
-        if not region_name:
-            region_name = "Nav norādīts"
-            
-        region = self.session.query(Region).filter(func.lower(Region.name) == func.lower(region_name)).first()
-        
-        if not region:
-            logger.info(f"Adding new region: {region_name}")
-            region = Region(
-                name=region_name,
-                country="Latvia",  # Default for SS.LV
-                created_at=datetime.now(),
-                updated_at=datetime.now()
-            )
-            self.session.add(region)
-            self.session.commit()
+    async def run_async(self, pages_per_model=2, resume=False):
+        """Run the whole scraping process"""
+        start_time = datetime.now()
+        logger.info(f"Starting the {self.adapter.name} scraper at {start_time}")
+        
+        # Reset our counters
+        self.total_listings = 0
+        self.new_listings = 0
+        self.updated_listings = 0
+        self.error_count = 0
+        self.skipped_details = 0
+        self.discovered_listings = 0
+        self.queued_listings = 0
+        self.write_counts = {}
+        self.capped_models = set()
+        self.metrics = RunMetrics()
+        self.connection_stats = self._empty_connection_stats()
+        self.pipeline_stats = {}
+        self.run_task = asyncio.current_task()
+        self.run_loop = asyncio.get_running_loop()
         
-        return region
-    
-    def save_car_and_listing(self, listing_data):
-        """Save a car and its listing to our database"""
         try:
-            # 1. Make sure the brand exists
-            brand = self.save_brand(listing_data['brand'])
-            
-            # 2. Make sure the model exists
-            model = self.save_model(brand, listing_data['model'])
-            
-            # 3. Make sure the region exists
-            region = self.ensure_region_exists(listing_data.get('region', 'Nav norādīts'))
-            
-            # 4. Check if this listing already exists
-            existing_listing = self.session.query(Listing).filter(
-                Listing.external_id == listing_data['external_id']
-            ).first()
+            if self.cancel_requested:
+                raise asyncio.CancelledError()
             
-            if existing_listing:
-                # Update existing listing
-                logger.debug(f"Updating existing listing {listing_data['external_id']}")
+            # One pooled session for the whole run so connections, DNS
+            # lookups and TLS sessions carry over between models
+            async with self._create_http_session() as http_session:
+                self.http_session = http_session
                 
-                # Get the car
-                car = existing_listing.car
+                # Get our target brands - async, so other sources running in
+                # the same loop aren't held up by it
+                brands = await self.get_brands_async(http_session)
                 
-                # Update car attributes if we have new info
-                updated = False
-                if listing_data.get('year') and car.year != listing_data['year']:
-                    car.year = listing_data['year']
-                    updated = True
-                if listing_data.get('engine_volume') and car.engine_volume != listing_data['engine_volume']:
-                    car.engine_volume = listing_data['engine_volume']
-                    updated = True
-                if listing_data.get('engine_type') and car.engine_type != listing_data['engine_type']:
-                    car.engine_type = listing_data['engine_type']
-                    updated = True
-                    logger.info(f"Updated engine type for listing {listing_data['external_id']}: {listing_data['engine_type']}")
-                if listing_data.get('transmission') and car.transmission != listing_data['transmission']:
-                    car.transmission = listing_data['transmission']
-                    updated = True
-                if listing_data.get('mileage') and car.mileage != listing_data['mileage']:
-                    car.mileage = listing_data['mileage']
-                    updated = True
-                if listing_data.get('body_type') and car.body_type != listing_data['body_type']:
-                    car.body_type = listing_data['body_type']
-                    updated = True
-                if listing_data.get('color') and car.color != listing_data['color']:
-                    car.color = listing_data['color']
-                    updated = True
+                if not brands:
+                    logger.error("No target brands found. Exiting.")
+                    return {
+                        "success": False,
+                        "error": "No target brands found",
+                        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    }
                 
-                # Update listing attributes
-                if listing_data.get('price') and existing_listing.price != listing_data['price']:
-                    existing_listing.price = listing_data['price']
-                    updated = True
-                if listing_data.get('listing_date'):
-                    try:
-                        new_date = datetime.strptime(listing_data['listing_date'], '%Y-%m-%d').date()
-                        if existing_listing.listing_date != new_date:
-                            existing_listing.listing_date = new_date
-                            updated = True
-                    except ValueError:
-                        pass
+                # Record our progress as we go so a crashed run can be resumed
+                self.frontier = CrawlFrontier(self.session, self.source_id)
+                pages_per_model = self.frontier.start_run(pages_per_model, resume).pages_per_model
+                self.writer.before_commit = self._mark_chunk_done
                 
-                # Mark as active
-                if not existing_listing.is_active:
-                    existing_listing.is_active = True
-                    updated = True
+                self.parse_pool = self._create_parse_pool()
                 
-                # Always update timestamps
-                existing_listing.updated_at = datetime.now()
-                car.updated_at = datetime.now()
+                async def feed(pipeline):
+                    # Every brand's model list at once, then all the models go
+                    # in together - the rate limiter sets the pace, not sleeps
+                    brand_models = await asyncio.gather(*[
+                        self.get_models_for_brand_async(brand, http_session) for brand in brands
+                    ])
+                    jobs = self.schedule_models(list(zip(brands, brand_models)))
+                    if self.model_filter:
+                        jobs = [(brand, model) for brand, model in jobs if self.model_filter(brand, model)]
+                    logger.info(f"Queued {len(jobs)} models across {len(brands)} brands")
+                    for job in jobs:
+                        await pipeline.put(job)
                 
-                self.session.commit()
-                
-                # Return appropriate status
-                if updated:
-                    self.updated_listings += 1
-                return "updated" if updated else "unchanged"
-            else:
-                # Create new car
-                car = Car(
-                    model_id=model.model_id,
-                    region_id=region.region_id,
-                    year=listing_data.get('year'),
-                    engine_volume=listing_data.get('engine_volume'),
-                    engine_type=listing_data.get('engine_type'),
-                    transmission=listing_data.get('transmission'),
-                    mileage=listing_data.get('mileage'),
-                    body_type=listing_data.get('body_type'),
-                    color=listing_data.get('color'),
-                    created_at=datetime.now(),
-                    updated_at=datetime.now()
-                )
-                self.session.add(car)
-                self.session.flush()  # Get car_id without committing
-                
-                # Create new listing
-                listing_date = datetime.now().date()
-                if listing_data.get('listing_date'):
-                    try:
-                        listing_date = datetime.strptime(
-                            listing_data['listing_date'], '%Y-%m-%d'
-                        ).date()
-                    except ValueError:
-                        pass
-                
-                listing = Listing(
-                    car_id=car.car_id,
-                    source_id=self.source_id,
-                    external_id=listing_data['external_id'],
-                    price=listing_data.get('price', 0),
-                    listing_date=listing_date,
-                    listing_url=listing_data['url'],
-                    is_active=True,
-                    created_at=datetime.now(),
-                    updated_at=datetime.now()
-                )
-                self.session.add(listing)
-                self.session.commit()
-                
-                logger.info(f"Added new listing: {listing_data['external_id']}")
-                self.new_listings += 1
-                return "new"
+                await self.run_pipeline(feed, pages_per_model)
+            
+            # A replay only covers what's in the archive, so it says nothing
+            # about which listings are gone or when we last scraped
+            if not self.replay:
+                # Mark old listings as inactive
+                deactivated_count = self.mark_inactive_listings()
                 
-        except Exception as e:
-            self.session.rollback()
-            logger.error(f"Error saving listing {listing_data.get('external_id', 'unknown')}: {str(e)}")
-            return "error"
-    
-    async def process_listing_async(self, listing_basic, session):
-        try:
-            # Get all the details from the listing page
-            listing_details = await self.get_listing_details_async(listing_basic, session)
+                # Update when we last scraped
+                source = self.session.query(Source).filter(Source.source_id == self.source_id).first()
+                if source:
+                    source.last_scraped_at = datetime.now()
+                    self.session.commit()
             
-            # Skip listings marked for skipping
-            if listing_details.get('skip_listing'):
-                logger.info(f"Skipping listing as marked: {listing_details.get('external_id', 'unknown')}")
-                return "skipped"
+            run_metrics = self._save_run_metrics('finished')
+            self.frontier.finish_run(success=True)
             
-            # Save to database
-            result = self.save_car_and_listing(listing_details)
+            end_time = datetime.now()
+            elapsed = (end_time - start_time).total_seconds()
             
-            self.total_listings += 1
+            logger.info(f"{self.adapter.name} scraping completed at {end_time}")
+            logger.info(f"Total time: {elapsed:.2f} seconds")
+            logger.info(f"Total listings processed: {self.total_listings}")
+            logger.info(f"New listings: {self.new_listings}")
+            logger.info(f"Updated listings: {self.updated_listings}")
+            logger.info(f"Errors: {self.error_count}")
+            if self.incremental:
+                logger.info(f"Unchanged listings (details skipped): {self.skipped_details}")
+            logger.info(f"Connections: {self.connection_stats}")
+            logger.info(f"Rate limits: {self.rate_limiter.stats()}")
+            logger.info(f"Pipeline: {self.pipeline_stats}")
+            logger.info(f"Run metrics: pages {run_metrics['pages']}, bytes {run_metrics['bytes']}, "
+                        f"status codes {run_metrics['status_codes']}, retries {run_metrics['retries']}, "
+                        f"rate limit wait {run_metrics['rate_limit_wait_seconds']}s")
             
-            # Add a small delay to be nice to the server
-            await self._async_random_delay()
+            return {
+                "success": True,
+                "total_listings": self.total_listings,
+                "new_listings": self.new_listings,
+                "updated_listings": self.updated_listings,
+                "errors": self.error_count,
+                "skipped_details": self.skipped_details,
+                "connections": dict(self.connection_stats),
+                "rate_limits": self.rate_limiter.stats(),
+                "pipeline": self.pipeline_stats,
+                "metrics": run_metrics,
+                "elapsed_time": f"{elapsed:.2f} seconds",
+                "timestamp": end_time.strftime('%Y-%m-%d %H:%M:%S')
+            }
             
-            return result
+        except asyncio.CancelledError:
+            # Left as a failed run, so --resume can carry on from here
+            logger.info(f"{self.adapter.name} scraper run cancelled")
+            self._fail_run('cancelled')
+            return {
+                "success": False,
+                "cancelled": True,
+                "error": "Cancelled",
+                "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
         except Exception as e:
-            logger.error(f"Error processing listing: {str(e)}")
-            self.error_count += 1
-            return "error"
-   
-    async def process_listings_batch_async(self, listings):
-       """Process a bunch of listings at the same time"""
-       async with aiohttp.ClientSession() as session:
-           tasks = []
-           for listing in listings:
-               tasks.append(self.process_listing_async(listing, session))
-           
-           results = await asyncio.gather(*tasks, return_exceptions=True)
-           
-           # Count what happened with each listing
-           result_counts = {
-               "new": 0,
-               "updated": 0,
-               "unchanged": 0,
-               "error": 0
-           }
-           
-           for result in results:
-               if isinstance(result, Exception):
-                   result_counts["error"] += 1
-               else:
-                   result_counts[result] = result_counts.get(result, 0) + 1
-           
-           return result_counts
-   
-    async def scrape_model_async(self, brand_data, model_data, pages_per_model=2):
-       """Scrape all listings for a single car model"""
-       logger.info(f"Starting to scrape model: {brand_data['name']} {model_data['name']}")
-       
-       # Get listings for this model
-       listings = self.get_listings_for_model(brand_data, model_data, max_pages=pages_per_model)
-       
-       if not listings:
-           logger.warning(f"No listings found for {brand_data['name']} {model_data['name']}")
-           return 0
-       
-       # Process all the listings at once
-       results = await self.process_listings_batch_async(listings)
-       
-       logger.info(f"Processed {len(listings)} listings for {brand_data['name']} {model_data['name']}")
-       logger.info(f"Results: {results}")
-       
-       return len(listings)
-   
-    async def scrape_brand_async(self, brand, pages_per_model=2):
-       """Scrape all models for a single car brand"""
-       logger.info(f"Starting to scrape brand: {brand['name']}")
-       
-       # Get all models for this brand
-       models = self.get_models_for_brand(brand)
-       
-       if not models:
-           logger.warning(f"No models found for brand: {brand['name']}")
-           return 0
-       
-       brand_listings_count = 0
-       
-       for model in models:
-           model_count = await self.scrape_model_async(brand, model, pages_per_model)
-           brand_listings_count += model_count
-           
-           # Small delay between models
-           await asyncio.sleep(random.uniform(1, 3))
-       
-       logger.info(f"Finished scraping brand {brand['name']}. Processed {brand_listings_count} listings.")
-       return brand_listings_count
-   
-    def mark_inactive_listings(self, days=14):
-       """Mark listings as inactive if they haven't been updated recently"""
-       from datetime import timedelta
-       
-       cutoff_date = datetime.now() - timedelta(days=days)
-       
-       try:
-           # Find active listings that haven't been updated since the cutoff date
-           listings_to_deactivate = self.session.query(Listing).filter(
-               Listing.is_active == True,
-               Listing.updated_at < cutoff_date
-           ).all()
-           
-           if listings_to_deactivate:
-               logger.info(f"Marking {len(listings_to_deactivate)} listings as inactive")
-               
-               for listing in listings_to_deactivate:
-                   listing.is_active = False
-                   listing.updated_at = datetime.now()
-               
-               self.session.commit()
-               return len(listings_to_deactivate)
-           else:
-               logger.info("No listings to mark as inactive")
-               return 0
-       except Exception as e:
-           self.session.rollback()
-           logger.error(f"Error marking inactive listings: {str(e)}")
-           return 0
-   
-    async def run_async(self, pages_per_model=2):
-       """Run the whole scraping process"""
-       start_time = datetime.now()
-       logger.info(f"Starting the scraper at {start_time}")
-       
-       # Reset our counters
-       self.total_listings = 0
-       self.new_listings = 0
-       self.updated_listings = 0
-       self.error_count = 0
-       
-       try:
-           # Get our target brands
-           brands = self.get_brands()
-           
-           if not brands:
-               logger.error("No target brands found. Exiting.")
-               return {
-                   "success": False,
-                   "error": "No target brands found",
-                   "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-               }
-           
-           # Scrape each brand
-           for brand in brands:
-               await self.scrape_brand_async(brand, pages_per_model)
-               
-               # Small delay between brands
-               await asyncio.sleep(random.uniform(2, 5))
-           
-           # Mark old listings as inactive
-           deactivated_count = self.mark_inactive_listings()
-           
-           # Update when we last scraped
-           source = self.session.query(Source).filter(Source.source_id == self.source_id).first()
-           if source:
-               source.last_scraped_at = datetime.now()
-               self.session.commit()
-           
-           end_time = datetime.now()
-           elapsed = (end_time - start_time).total_seconds()
-           
-           logger.info(f"Scraping completed at {end_time}")
-           logger.info(f"Total time: {elapsed:.2f} seconds")
-           logger.info(f"Total listings processed: {self.total_listings}")
-           logger.info(f"New listings: {self.new_listings}")
-           logger.info(f"Updated listings: {self.updated_listings}")
-           logger.info(f"Errors: {self.error_count}")
-           
-           return {
-               "success": True,
-               "total_listings": self.total_listings,
-               "new_listings": self.new_listings,
-               "updated_listings": self.updated_listings,
-               "errors": self.error_count,
-               "elapsed_time": f"{elapsed:.2f} seconds",
-               "timestamp": end_time.strftime('%Y-%m-%d %H:%M:%S')
-           }
-           
-       except Exception as e:
-           logger.error(f"Error running scraper: {str(e)}")
-           return {
-               "success": False,
-               "error": str(e),
-               "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-           }
-       finally:
-           # Make sure to clean up
-           self.session.close()
-   
-    def run(self, pages_per_model=2):
+            logger.error(f"Error running {self.adapter.name} scraper: {str(e)}")
+            self._fail_run('failed')
+            return {
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+        finally:
+            # Make sure to clean up
+            self.run_task = None
+            self.run_loop = None
+            self.http_session = None
+            self.writer.before_commit = None
+            self.frontier = None
+            if self.archive:
+                self.archive.flush()
+            if self.parse_pool is not None:
+                self.parse_pool.shutdown()
+                self.parse_pool = None
+            self._close_writer()
+            self.session.close()
+    
+    def _save_run_metrics(self, outcome):
+        """Keep this run's telemetry for comparing against other runs"""
+        self.metrics.finish()
+        run_metrics = self.metrics.to_dict()
+        run_metrics['outcome'] = outcome
+        save_run_metrics(self.session, self.frontier.run_id, run_metrics)
+        return run_metrics
+    
+    def _fail_run(self, outcome):
+        """Save what telemetry we got and leave the crawl run failed"""
+        if not self.frontier or self.frontier.run_id is None:
+            return
+        # Whatever broke may have left the session mid-transaction
+        self.session.rollback()
+        self._save_run_metrics(outcome)
+        self.frontier.finish_run(success=False)
+    
+    def cancel(self):
+        """Stop the run in progress - safe to call from another thread.
+
+        The flag also stops a run that hasn't got going yet. It isn't cleared
+        when a run ends, whoever starts the next run clears it first (see
+        ScrapeJobManager._run_job).
+        """
+        self.cancel_requested = True
+        task, loop = self.run_task, self.run_loop
+        if task is not None and loop is not None:
+            loop.call_soon_threadsafe(task.cancel)
+    
+    def progress(self):
+        """Live counters for the run in progress"""
+        return {
+            "discovered_listings": self.discovered_listings,
+            "queued_listings": self.queued_listings,
+            "total_listings": self.total_listings,
+            "new_listings": self.new_listings,
+            "updated_listings": self.updated_listings,
+            "skipped_details": self.skipped_details,
+            "errors": self.error_count,
+            "pages": self.metrics.pages,
+            "bytes": self.metrics.bytes
+        }
+    
+    def run(self, pages_per_model=2, resume=False):
        """Start the scraper"""
        # Handle Windows event loop if needed
        if 'win' in sys.platform:
@@ -1161,21 +1165,66 @@ class Scraper:
        
        # Run the async method and return the result
        return loop.run_until_complete(
-           self.run_async(pages_per_model)
+           self.run_async(pages_per_model, resume)
        )
 
 
 # Helper function to run the scraper from another file
-def run_ss_scraper(target_brands=None, pages_per_model=2, db_url=None, debug_mode=False):
-    if target_brands is None:
-        target_brands = ["tesla", "infiniti", "smart", "suzuki"]
-    
+def run_ss_scraper(target_brands=None, pages_per_model=2, db_url=None, debug_mode=False, incremental=False,
+                   parser_backend=None, parse_workers=None, resume=False, replay=False, replay_at=None,
+                   source='ss.lv'):
     scraper = Scraper(
+        adapter=get_adapter(source),
         target_brands=target_brands,
         db_url=db_url if db_url else "sqlite:///car_price_analysis.db",
-        debug_mode=debug_mode
+        debug_mode=debug_mode,
+        incremental=incremental,
+        parser_backend=parser_backend,
+        parse_workers=parse_workers,
+        replay=replay,
+        replay_at=replay_at
     )
-    return scraper.run(pages_per_model)
+    return scraper.run(pages_per_model, resume)
+
+
+async def _run_all(scrapers, pages_per_model, resume):
+    results = await asyncio.gather(*[scraper.run_async(pages_per_model, resume) for scraper in scrapers])
+    return {scraper.adapter.name: result for scraper, result in zip(scrapers, results)}
+
+
+def run_sources(sources=None, target_brands=None, pages_per_model=2, db_url=None, debug_mode=False,
+                incremental=False, parse_workers=None, resume=False, replay=False, replay_at=None):
+    """Scrape several sources at once in one event loop.
+    
+    Sources are adapters or names from sources.SOURCES. Each gets its own
+    Scraper, so its own rate limiter and connection pool - a slow or strict
+    site only slows itself down. Returns {source name: result}.
+    """
+    adapters = [get_adapter(source) if isinstance(source, str) else source for source in (sources or ['ss.lv'])]
+    
+    # Share the CPUs between the sources' parse pools
+    if parse_workers is None:
+        parse_workers = max(1, (os.cpu_count() or 1) // len(adapters))
+    
+    scrapers = [Scraper(
+        target_brands=target_brands,
+        db_url=db_url if db_url else "sqlite:///car_price_analysis.db",
+        debug_mode=debug_mode,
+        incremental=incremental,
+        parse_workers=parse_workers,
+        replay=replay,
+        replay_at=replay_at,
+        adapter=adapter
+    ) for adapter in adapters]
+    
+    # One archive writer for everyone, they'd trip over each other's segments otherwise
+    archive = scrapers[0].archive
+    for scraper in scrapers[1:]:
+        scraper.archive = archive
+    
+    if 'win' in sys.platform:
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    return asyncio.run(_run_all(scrapers, pages_per_model, resume))
 
 
 # When running this file directly from command line
@@ -1184,20 +1233,61 @@ if __name__ == "__main__":
    import argparse
    
    # Handle command line arguments
-   parser = argparse.ArgumentParser(description="SS.LV Car Scraper")
+   parser = argparse.ArgumentParser(description="Car listings scraper")
+   parser.add_argument('--source', action='append', choices=sorted(SOURCES),
+                       help='Source to scrape, repeat for several at once (default: ss.lv)')
    parser.add_argument('--brands', nargs='+', help='Brands to scrape (space-separated list)')
    parser.add_argument('--pages', type=int, default=2, help='Maximum pages per model')
    parser.add_argument('--db', type=str, help='Database URL (optional)')
-   parser.add_argument('--debug', action='store_true', help='Save HTML for debugging')
+   parser.add_argument('--debug', action='store_true', help='Save fetched pages to the page archive')
+   parser.add_argument('--replay', action='store_true',
+                       help='Re-parse pages from the page archive instead of fetching them')
+   parser.add_argument('--replay-at', type=datetime.fromisoformat,
+                       help='With --replay, use pages as they were at this time (YYYY-MM-DD[THH:MM])')
+   parser.add_argument('--incremental', action='store_true',
+                       help='Only fetch details for new or re-priced listings')
+   parser.add_argument('--parser', choices=['lxml', 'bs4'], help='HTML parser backend (default: lxml if installed)')
+   parser.add_argument('--resume', action='store_true',
+                       help='Carry on from the last interrupted run instead of starting over')
+   parser.add_argument('--parse-workers', type=int,
+                       help='Parse worker processes (default: one per CPU, 0 = parse on the main thread)')
    
    args = parser.parse_args()
    
+   if args.source and len(args.source) > 1:
+       results = run_sources(
+           sources=args.source,
+           target_brands=args.brands,
+           pages_per_model=args.pages,
+           db_url=args.db,
+           debug_mode=args.debug,
+           incremental=args.incremental,
+           parse_workers=args.parse_workers,
+           resume=args.resume,
+           replay=args.replay,
+           replay_at=args.replay_at
+       )
+       for name, result in results.items():
+           if result["success"]:
+               print(f"{name}: {result['total_listings']} listings, {result['new_listings']} new, "
+                     f"{result['updated_listings']} updated, {result['errors']} errors in {result['elapsed_time']}")
+           else:
+               print(f"{name}: scraping failed: {result['error']}")
+       sys.exit(0)
+   
    # Run the scraper
    result = run_ss_scraper(
+       source=args.source[0] if args.source else 'ss.lv',
        target_brands=args.brands,
        pages_per_model=args.pages,
        db_url=args.db,
-       debug_mode=args.debug
+       debug_mode=args.debug,
+       incremental=args.incremental,
+       parser_backend=args.parser,
+       parse_workers=args.parse_workers,
+       resume=args.resume,
+       replay=args.replay,
+       replay_at=args.replay_at
    )
    
    # Print results
@@ -0,0 +1,249 @@
+import json
+import logging
+import time
+from datetime import datetime
+from models import CrawlRunMetrics
+
+logger = logging.getLogger('ss_scraper.telemetry')
+
+# Histogram bucket upper bounds in seconds, roughly 1-2-5 steps from 1 ms to 30 s
+BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30]
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, cheap enough to feed on every request"""
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is everything above the top bound
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.bounds):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, p):
+        """Upper bound of the bucket the p-th percentile falls in"""
+        if not self.count:
+            return None
+        needed = self.count * p / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= needed:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total, 3),
+            "mean": round(self.total / self.count, 4) if self.count else None,
+            "min": round(self.min, 4) if self.min is not None else None,
+            "max": round(self.max, 4) if self.max is not None else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": {label: count for label, count in zip(labels, self.counts) if count}
+        }
+
+
+class RunMetrics:
+    """Everything we measure during one scraper run.
+
+    Fetch, parse and DB-write latencies go into histograms; alongside them
+    we count bytes, status codes, retries and time spent waiting on the
+    rate limiter, plus listings per brand and model so a slow run can be
+    pinned on the network, parsing or SQLite.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.started = time.monotonic()
+        self.finished = None
+        self.histograms = {name: Histogram() for name in ('fetch', 'parse', 'write')}
+        self.status_codes = {}
+        self.bytes = 0
+        self.pages = 0
+        self.retries = 0
+        self.rate_limit_wait = 0.0
+        self.models = {}
+
+    def observe(self, name, seconds):
+        self.histograms[name].observe(seconds)
+
+    def record_response(self, status, seconds, size=0):
+        """One HTTP attempt - status is 'error' if there was no response at all"""
+        self.observe('fetch', seconds)
+        self.status_codes[str(status)] = self.status_codes.get(str(status), 0) + 1
+        if status == 200:
+            self.pages += 1
+            self.bytes += size
+
+    def _model(self, brand_name, model_name):
+        key = f"{brand_name} {model_name}"
+        if key not in self.models:
+            self.models[key] = {"brand": brand_name, "started": time.monotonic(), "last": None, "listings": 0}
+        return self.models[key]
+
+    def model_started(self, brand_name, model_name):
+        self._model(brand_name, model_name)
+
+    def count_listings(self, brand_name, model_name, count=1):
+        model = self._model(brand_name, model_name)
+        model["listings"] += count
+        model["last"] = time.monotonic()
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def to_dict(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        listings = sum(model["listings"] for model in self.models.values())
+
+        models, brands = {}, {}
+        for key, model in sorted(self.models.items()):
+            seconds = (model["last"] or model["started"]) - model["started"]
+            models[key] = {
+                "listings": model["listings"],
+                "seconds": round(seconds, 2),
+                "listings_per_second": round(model["listings"] / seconds, 2) if seconds > 0 else None
+            }
+            brand = brands.setdefault(model["brand"], {"listings": 0, "started": model["started"], "last": model["started"]})
+            brand["listings"] += model["listings"]
+            brand["started"] = min(brand["started"], model["started"])
+            brand["last"] = max(brand["last"], model["last"] or model["started"])
+
+        for brand in brands.values():
+            seconds = brand.pop("last") - brand.pop("started")
+            brand["seconds"] = round(seconds, 2)
+            brand["listings_per_second"] = round(brand["listings"] / seconds, 2) if seconds > 0 else None
+
+        return {
+            "started_at": self.started_at.isoformat(),
+            "elapsed_seconds": round(elapsed, 2),
+            "pages": self.pages,
+            "bytes": self.bytes,
+            "listings": listings,
+            "pages_per_second": round(self.pages / elapsed, 2) if elapsed > 0 else 0,
+            "listings_per_second": round(listings / elapsed, 2) if elapsed > 0 else 0,
+            "status_codes": dict(sorted(self.status_codes.items())),
+            "retries": self.retries,
+            "rate_limit_wait_seconds": round(self.rate_limit_wait, 2),
+            "latency": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            "brands": brands,
+            "models": models
+        }
+
+
+def save_run_metrics(session, run_id, metrics):
+    """Store a run's metrics dict next to its crawl run"""
+    try:
+        session.add(CrawlRunMetrics(
+            run_id=run_id,
+            elapsed_seconds=metrics["elapsed_seconds"],
+            pages=metrics["pages"],
+            bytes=metrics["bytes"],
+            listings=metrics["listings"],
+            data=json.dumps(metrics, ensure_ascii=False),
+            created_at=datetime.now()
+        ))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error saving run metrics: {str(e)}")
+
+
+def load_run_metrics(session, run_ids=None, last=2):
+    """Metrics dicts for the given runs in the order given, or the last few, oldest first"""
+    query = session.query(CrawlRunMetrics)
+    if run_ids:
+        # A resumed run has a row per attempt, the last one is what it ended with
+        latest = {}
+        for row in query.filter(CrawlRunMetrics.run_id.in_(run_ids)).order_by(CrawlRunMetrics.metrics_id):
+            latest[row.run_id] = row
+        rows = [latest[run_id] for run_id in run_ids if run_id in latest]
+    else:
+        rows = list(reversed(query.order_by(CrawlRunMetrics.metrics_id.desc()).limit(last).all()))
+    return [(row.run_id, json.loads(row.data)) for row in rows]
+
+
+def _summary(metrics):
+    """The numbers worth comparing between two runs, flattened"""
+    summary = {
+        "elapsed_seconds": metrics["elapsed_seconds"],
+        "pages": metrics["pages"],
+        "bytes": metrics["bytes"],
+        "listings": metrics["listings"],
+        "pages_per_second": metrics["pages_per_second"],
+        "listings_per_second": metrics["listings_per_second"],
+        "retries": metrics["retries"],
+        "rate_limit_wait_seconds": metrics["rate_limit_wait_seconds"],
+    }
+    for name, histogram in metrics["latency"].items():
+        for key in ("count", "total_seconds", "p50", "p90", "p99"):
+            summary[f"{name}.{key}"] = histogram[key]
+    for status, count in metrics["status_codes"].items():
+        summary[f"status.{status}"] = count
+    return summary
+
+
+def compare_runs(old, new):
+    """Rows of (metric, old, new, change %) for two metrics dicts"""
+    old_summary, new_summary = _summary(old), _summary(new)
+    rows = []
+    for key in list(old_summary) + [key for key in new_summary if key not in old_summary]:
+        old_value, new_value = old_summary.get(key), new_summary.get(key)
+        change = None
+        if old_value and new_value is not None:
+            change = round((new_value / old_value - 1) * 100, 1)
+        rows.append((key, old_value, new_value, change))
+    return rows
+
+
+def format_comparison(old_run, old, new_run, new):
+    lines = [f"{'metric':<28}{'run ' + str(old_run):>14}{'run ' + str(new_run):>14}{'change':>10}"]
+    for key, old_value, new_value, change in compare_runs(old, new):
+        change_text = f"{change:+.1f}%" if change is not None else ''
+        lines.append(f"{key:<28}{str(old_value):>14}{str(new_value):>14}{change_text:>10}")
+
+    # Where the time went - handy for a quick "network, parsing or SQLite?"
+    for label, metrics in ((old_run, old), (new_run, new)):
+        split = {name: histogram["total_seconds"] for name, histogram in metrics["latency"].items()}
+        split["rate_limit_wait"] = metrics["rate_limit_wait_seconds"]
+        lines.append(f"run {label} time split: " + ", ".join(f"{name} {seconds}s" for name, seconds in split.items()))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    from models import init_db
+
+    parser = argparse.ArgumentParser(description="Compare scraper run metrics")
+    parser.add_argument('--db', default="sqlite:///car_price_analysis.db", help='Database URL')
+    parser.add_argument('--runs', type=int, nargs=2, metavar=('OLD', 'NEW'),
+                        help='Run ids to compare (default: the last two runs)')
+    parser.add_argument('--json', action='store_true', help='Print the newest run\'s full metrics')
+    args = parser.parse_args()
+
+    session, _ = init_db(args.db)
+    runs = load_run_metrics(session, args.runs)
+    if not runs:
+        print("No run metrics recorded yet")
+    elif args.json or len(runs) < 2:
+        print(json.dumps(runs[-1][1], indent=2, ensure_ascii=False))
+    else:
+        (old_run, old), (new_run, new) = runs[0], runs[-1]
+        print(format_comparison(old_run, old, new_run, new))